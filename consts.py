@@ -3,7 +3,7 @@ ZERO_SHOT_CYPHER_TEMPLATE = """
                 Instructions:
                 Use only the provided relationship types and properties in the schema.
                 The current date is {current_date}.
-                If the user query contains a date or datetime, format it in the iso format like "YYYY-MM-DDTHH:MM:SSZ". If the datetime is without the timestamp, use a regex for the missing part.
+                If the user query contains a date or datetime, compare it with the datetime properties of the schema using datetime("YYYY-MM-DDTHH:MM:SSZ"). If the datetime is without the timestamp, use a range covering the whole day, e.g. c.committedDateTime >= datetime("2024-05-01") AND c.committedDateTime < datetime("2024-05-02"). Do not compare dates as strings.
 
                 Before you start, determine the intention of the question. If the question can interpreted in multiple ways, list all the possible interpretations and select the most probable one.
 
@@ -22,7 +22,7 @@ FEW_SHOT_CYPHER_TEMPLATE = """
                 Instructions:
                 Use only the provided relationship types and properties in the schema.
                 The current date is {current_date}.
-                If the user query contains a date or datetime, format it in the iso format like "YYYY-MM-DDTHH:MM:SSZ". If the datetime is without the timestamp, use a regex for the missing part.
+                If the user query contains a date or datetime, compare it with the datetime properties of the schema using datetime("YYYY-MM-DDTHH:MM:SSZ"). If the datetime is without the timestamp, use a range covering the whole day, e.g. c.committedDateTime >= datetime("2024-05-01") AND c.committedDateTime < datetime("2024-05-02"). Do not compare dates as strings.
 
                 Before you start, determine the intention of the question. If the question can interpreted in multiple ways, list all the possible interpretations and select the most probable one.
 
@@ -91,7 +91,7 @@ ZERO_SHOT_CYPHER_TEMPLATE_LLAMA = """
                 Use only the provided relationship types and properties in the schema.
                 Do not use any other relationship types or properties that are not provided.
                 The current date is {current_date}.
-                If the user query contains a date or datetime, format it in the iso format like "YYYY-MM-DDTHH:MM:SSZ". and if the datetime is without the timestamp, use the regex for the missing part.
+                If the user query contains a date or datetime, compare it with the datetime properties of the schema using datetime("YYYY-MM-DDTHH:MM:SSZ"). If the datetime is without the timestamp, use a range covering the whole day, e.g. c.committedDateTime >= datetime("2024-05-01") AND c.committedDateTime < datetime("2024-05-02"). Do not compare dates as strings.
                 Schema:
                 {schema}
                 Note: hash is the unique identifier of a commit, abbreviatedOid is the short version of the hash (the first 7 characters).
@@ -118,7 +118,7 @@ FEW_SHOT_CYPHER_TEMPLATE_LLAMA = """
                 Use only the provided relationship types and properties in the schema.
                 Do not use any other relationship types or properties that are not provided.
                 The current date is {current_date}.
-                If the user query contains a date or datetime, format it in the iso format like "YYYY-MM-DDTHH:MM:SSZ". and if the datetime is without the timestamp, use the regex for the missing part.
+                If the user query contains a date or datetime, compare it with the datetime properties of the schema using datetime("YYYY-MM-DDTHH:MM:SSZ"). If the datetime is without the timestamp, use a range covering the whole day, e.g. c.committedDateTime >= datetime("2024-05-01") AND c.committedDateTime < datetime("2024-05-02"). Do not compare dates as strings.
                 Schema:
                 {schema}
                 Note: hash is the unique identifier of a commit, abbreviatedOid is the short version of the hash (the first 7 characters).
@@ -132,8 +132,8 @@ FEW_SHOT_CYPHER_TEMPLATE_LLAMA = """
                 RETURN count(c) as totalCommits
 
                 # list all commits and their parents created on the same day?
-                MATCH (c:Commit)-[:created_at]->(d1:Date), (c)-[:parent_of]->(p:Commit)-[:created_at]->(d2:Date)
-                WHERE d1.date = d2.date
+                MATCH (p:Commit)-[:parent_of]->(c:Commit)
+                WHERE date(c.committedDateTime) = date(p.committedDateTime)
                 RETURN c AS ChildCommit, p AS ParentCommit
 
                 # Which developer has the most unfixed bugs?
@@ -173,4 +173,20 @@ GENERATION_TEMPLATE_LLAMA = """
             <|start_header_id|>assistant<|end_header_id|>
             """
 
+SCHEMA_NOTES = """
+                Notes on the schema:
+                The diff of a change is not stored in the graph: changed relationships only have its patchDigest and patchSize. To get the diff text, return the patch property of the changed relationship, e.g. RETURN r.patch AS diff, it is added to the results. Do not filter on the patch property.
+                There is a single contributes_to relationship between a user and a repository and a single impacted relationship between an issue and a file: count is the number of commits (respectively of fixing commits) they stand for, firstSeen and lastSeen the dates of the first and last of them. Use sum(r.count) rather than count(r) to count them.
+                Files that usually change together are linked by co_changed relationships, from a file to the files it most often changed with: commits is the number of commits that changed both, confidence the share of the commits of the first file that also changed the second one, support the share of all commits. Use them instead of joining changed relationships, e.g. MATCH (f:File {name: "app.py"})-[r:co_changed]->(o:File) RETURN o.name, r.commits ORDER BY r.commits DESC.
+                The history of the commits is given by parent_of relationships from a commit to its children. To know whether commit a is an ancestor of commit b (b contains a, a was made before b in the history), compare their reachability properties instead of following parent_of relationships: WHERE (b.treeStart >= a.treeStart AND b.treeStart <= a.treeEnd) OR (a.topoOrder < b.topoOrder AND a.reachLow <= b.reachLow AND b.reachHigh <= a.reachHigh AND EXISTS {(a)-[:parent_of*]->(b)}).
+                Tags point to their commit (points_to) and releases to their tag (release_of). Each commit is linked from the first tag that shipped it by a contains relationship, and each issue from the first tag that shipped its fix (contains_fix) and the bug (contains_bug), e.g. MATCH (t:Tag)-[:contains_fix]->(i:Issue {number: 123}) OPTIONAL MATCH (r:Release)-[:release_of]->(t) RETURN t.name, r.name. Only the first tag is linked, later tags usually contain the same commits.
+                Code ownership at the current version of the code is given by owns_lines relationships from users to files: lines is the number of lines of the file they last changed, share the fraction of the file it stands for. Use them for questions about who owns or knows a file.
+                Weekly and monthly activity is rolled up in UserActivity and FileActivity nodes, linked from the User and File nodes by has_activity relationships: granularity is week or month, startDate the first day of the period (a native date), and commits, additions, deletions, churn, issuesOpened and issuesClosed the activity of the user or file in it. Use them for trends over time instead of aggregating commits, e.g. MATCH (u:User {login: "alice"})-[:has_activity]->(a:UserActivity {granularity: "month"}) WHERE a.startDate >= date("2024-01-01") RETURN a.start, a.commits, a.churn ORDER BY a.start.
+                Dates are also stored as native datetimes, which are indexed: Commit.committedDateTime, Issue.createdDateTime and Issue.closedDateTime. Filter time windows on them with datetime() and duration() values rather than on the committedDate, createdAt and closedAt strings.
+                To search words in commit messages or in issue titles and bodies, use the full-text indexes commit_fulltext and issue_fulltext instead of CONTAINS or regular expressions, and match the yielded node with its label, e.g. CALL db.index.fulltext.queryNodes("commit_fulltext", "login timeout") YIELD node AS c, score MATCH (c:Commit) RETURN c.hash, c.message ORDER BY score DESC.
+                The embedding and embeddingHash properties are only used for semantic search, never filter on them nor return them.
+                Users, files and issues carry precomputed counters, prefer them to aggregating relationships: User.commitCount, User.additions, User.deletions, User.bugsIntroduced and User.bugsFixed (number of bugs introduced or fixed by their commits), File.changeCount, File.churn (lines added and deleted) and File.bugCount (number of bugs that impacted it), Issue.fixingCommitCount, Issue.inducingCommitCount and Issue.impactedFileCount.
+                Queries are automatically restricted to the nodes of the current repository, do not filter on the repo property.
+            """
+
 LOGS_DIR = 'logs'
@@ -0,0 +1,163 @@
+import json
+import os
+from logging import getLogger
+
+import pandas as pd
+
+from scripts.graph_handler import commit_author
+from scripts.graph_sync import content_hash
+from scripts.neo4j_client import DEFAULT_BATCH_SIZE
+
+logger = getLogger(__name__)
+
+# granularity -> pandas period frequency, weeks start on Monday
+GRANULARITIES = {'week': 'W', 'month': 'M'}
+# kind of rollup -> (label of the rollup nodes, label of the nodes they roll up)
+ROLLUP_LABELS = {
+    'user': ('UserActivity', 'User'),
+    'file': ('FileActivity', 'File'),
+}
+METRICS = ['commits', 'additions', 'deletions', 'churn', 'issuesOpened', 'issuesClosed']
+
+
+def _dates(values):
+    """ ISO date strings as naive UTC timestamps, NaT for the missing and unparsable ones """
+    return pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors='coerce', format='ISO8601') \
+        .dt.tz_localize(None)
+
+
+def _frame(records, columns):
+    return pd.DataFrame.from_records(records, columns=columns)
+
+
+def activity_frames(commits, issues, bics, collaborators):
+    """
+    Activity events of the users and files, one row per event: commits with their line changes, and issues opened
+    and closed. Users open the issues they created and close the closed issues assigned to them; files get the
+    issues whose bug impacted them.
+
+    :returns dict kind -> DataFrame of (entity, date, commit, additions, deletions, opened, closed) rows
+    """
+    collaborator_dict = {collaborator['name']: collaborator for collaborator in collaborators}
+    collaborator_login_dict = {collaborator['login']: collaborator for collaborator in collaborators}
+    columns = ['entity', 'date', 'commit', 'additions', 'deletions', 'opened', 'closed']
+
+    user_events, file_events = [], []
+    for commit in commits:
+        author_id, _ = commit_author(commit['author_name'], commit['author_email'] or '', collaborator_dict,
+                                     collaborator_login_dict)
+        files = commit.get('modified_files', [])
+        user_events.append((author_id, commit['committedDate'], commit['hash'],
+                            sum(file['additions'] for file in files), sum(file['deletions'] for file in files), 0, 0))
+        file_events.extend((file['filename'], commit['committedDate'], commit['hash'], file['additions'],
+                            file['deletions'], 0, 0) for file in files)
+
+    issue_dates = {}
+    for issue in issues:
+        issue_dates[int(issue['number'])] = (issue['created_at'], issue['closed_at'])
+        if issue['author_id'] is not None:
+            user_events.append((issue['author_id'], issue['created_at'], None, 0, 0, 1, 0))
+        if issue['closed_at']:
+            user_events.extend((assignee['id'], issue['closed_at'], None, 0, 0, 0, 1)
+                               for assignee in issue['assignees'] if assignee['id'] is not None)
+    for bic in bics:
+        created_at, closed_at = issue_dates.get(int(bic['Number']), (None, None))
+        for file_id in set(bic['ImpactedFiles']):
+            file_events.append((file_id, created_at, None, 0, 0, 1, 0))
+            if closed_at:
+                file_events.append((file_id, closed_at, None, 0, 0, 0, 1))
+
+    frames = {}
+    for kind, events in [('user', user_events), ('file', file_events)]:
+        frame = _frame(events, columns)
+        frame['date'] = _dates(frame['date'])
+        frames[kind] = frame.dropna(subset=['entity', 'date'])
+    return frames
+
+
+def rollup(frame, granularity):
+    """
+    Metrics of every (period, entity) bucket of the events, computed with vectorised groupbys.
+
+    :param DataFrame frame: events, see activity_frames
+    :param str granularity: week or month
+    :returns DataFrame with the entity, start of the period and the METRICS
+    """
+    if frame.empty:
+        return pd.DataFrame(columns=['entity', 'start'] + METRICS)
+    frame = frame.assign(start=frame['date'].dt.to_period(GRANULARITIES[granularity]).dt.start_time)
+    grouped = frame.groupby(['entity', 'start'])
+    buckets = grouped.agg(commits=('commit', 'nunique'), additions=('additions', 'sum'),
+                          deletions=('deletions', 'sum'), issuesOpened=('opened', 'sum'),
+                          issuesClosed=('closed', 'sum')).reset_index()
+    buckets['churn'] = buckets['additions'] + buckets['deletions']
+    return buckets[['entity', 'start'] + METRICS]
+
+
+def rollup_rows(frames):
+    """ rollup node rows of every kind and granularity, id -> (kind, entity, attributes) """
+    rows = {}
+    for kind, frame in frames.items():
+        for granularity in GRANULARITIES:
+            for bucket in rollup(frame, granularity).itertuples(index=False):
+                start = bucket.start.strftime('%Y-%m-%d')
+                attributes = {'granularity': granularity, 'start': start, 'startDate': bucket.start.date()}
+                attributes.update({metric: int(getattr(bucket, metric)) for metric in METRICS})
+                rows[f"{kind}:{granularity}:{start}:{bucket.entity}"] = (kind, bucket.entity, attributes)
+    return rows
+
+
+class ActivityRollups:
+    """
+    Weekly and monthly activity of every user and file, as UserActivity and FileActivity nodes linked from the
+    User and File nodes by has_activity relationships. Each rollup node holds the commits, line changes and issues
+    opened and closed in its period, so trend questions read a few rollup nodes instead of scanning the commits.
+
+    The rollups are recomputed from the collected data in bulk with pandas, and the content hash of every rollup of
+    the last upload is kept in a json file next to the data files, so an update only writes the buckets that changed,
+    usually the current week and month of the active users and files.
+    """
+
+    def __init__(self, state_path):
+        self.state_path = state_path
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, hashes):
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(hashes, f)
+        os.replace(temp_path, self.state_path)
+
+    def update(self, neo_client, commits, issues, bics, collaborators, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param list commits: all the collected commits
+        :param list issues: all the collected issues
+        :param list bics: all the fixing and bug inducing commits found by LinkBugs
+        :param list collaborators: collaborators of the repository, to resolve the commit authors to their User node
+        """
+        rows = rollup_rows(activity_frames(commits, issues, bics, collaborators))
+        hashes = {rollup_id: content_hash(attributes) for rollup_id, (_, _, attributes) in rows.items()}
+        previous = self.load()
+        changed = sorted(rollup_id for rollup_id in hashes if previous.get(rollup_id) != hashes[rollup_id])
+        stale = sorted(set(previous) - set(hashes))
+        logger.info(f"Activity rollups: {len(changed)} of {len(hashes)} buckets written, {len(stale)} removed")
+
+        for kind, (label, entity_label) in ROLLUP_LABELS.items():
+            # rollup ids start with their kind, the label in the pattern lets the id constraint serve the lookup
+            kind_stale = [rollup_id for rollup_id in stale if rollup_id.startswith(f"{kind}:")]
+            for start in range(0, len(kind_stale), batch_size):
+                neo_client.delete_nodes(label, kind_stale[start:start + batch_size])
+            kind_changed = [rollup_id for rollup_id in changed if rows[rollup_id][0] == kind]
+            for start in range(0, len(kind_changed), batch_size):
+                batch = kind_changed[start:start + batch_size]
+                neo_client.upload_nodes(label, [{'id': rollup_id, 'attributes': rows[rollup_id][2]}
+                                                for rollup_id in batch])
+                neo_client.upload_edges(entity_label, 'has_activity', label,
+                                        [{'source': rows[rollup_id][1], 'target': rollup_id, 'attributes': {}}
+                                         for rollup_id in batch])
+        self.save(hashes)
@@ -0,0 +1,191 @@
+import os
+import random
+import subprocess
+import tempfile
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+BASE_TIMESTAMP = 1600000000
+IDENTITY = 'Benchmark Bot <bench@example.com>'
+
+
+class SyntheticRepoSpec:
+    """ Shape of a synthetic repository generated for the SZZ benchmark """
+
+    def __init__(self, commits=200, files=20, lines_per_file=40, churn=3, rename_rate=0.02, merge_rate=0.05,
+                 mode_change_rate=0.02, fix_rate=0.1, seed=42):
+        """
+        :param int commits: number of commits on the main branch, side branch commits excluded
+        :param int files: number of files created by the first commit
+        :param int lines_per_file: number of lines of each file created by the first commit
+        :param int churn: maximum number of lines changed by a single commit
+        :param float rename_rate: probability of a commit renaming a file
+        :param float merge_rate: probability of merging a side branch that adds a new file
+        :param float mode_change_rate: probability of a commit only changing the mode of a file
+        :param float fix_rate: probability of a commit fixing a bug, referenced as '#N' in its message
+        :param int seed: seed of the generator, the same spec always produces the same repository
+        """
+        self.commits = commits
+        self.files = files
+        self.lines_per_file = lines_per_file
+        self.churn = churn
+        self.rename_rate = rename_rate
+        self.merge_rate = merge_rate
+        self.mode_change_rate = mode_change_rate
+        self.fix_rate = fix_rate
+        self.seed = seed
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({", ".join(f"{k}={v}" for k, v in vars(self).items())})'
+
+
+class _FastImportWriter:
+    """ Serialises commits in the git fast-import format """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.mark = 0
+
+    def _write(self, text):
+        self.stream.write(text.encode('utf-8'))
+
+    def _data(self, content):
+        payload = content.encode('utf-8')
+        self.stream.write(f'data {len(payload)}\n'.encode('utf-8') + payload + b'\n')
+
+    def commit(self, ref, message, changes, from_mark=None, merge_mark=None):
+        """
+        :param str ref: branch receiving the commit
+        :param str message: commit message
+        :param list changes: ('M', mode, path, content), ('D', path) or ('R', old_path, new_path) tuples
+        :returns int mark of the new commit
+        """
+        self.mark += 1
+        timestamp = BASE_TIMESTAMP + self.mark * 3600
+        self._write(f'commit {ref}\nmark :{self.mark}\n')
+        self._write(f'author {IDENTITY} {timestamp} +0000\ncommitter {IDENTITY} {timestamp} +0000\n')
+        self._data(message)
+        if from_mark is not None:
+            self._write(f'from :{from_mark}\n')
+        if merge_mark is not None:
+            self._write(f'merge :{merge_mark}\n')
+        for change in changes:
+            if change[0] == 'M':
+                _, mode, path, content = change
+                self._write(f'M {mode} inline {path}\n')
+                self._data(content)
+            elif change[0] == 'D':
+                self._write(f'D {change[1]}\n')
+            elif change[0] == 'R':
+                self._write(f'R {change[1]} {change[2]}\n')
+        self._write('\n')
+        return self.mark
+
+
+def _content(lines):
+    return ''.join(f'{text}\n' for text, _ in lines)
+
+
+def generate_repository(path, spec: SyntheticRepoSpec):
+    """
+    Generate a deterministic git repository with 'git fast-import'. Every line remembers the commit that wrote
+    it, so the commits that introduced the lines changed by a fix commit are known exactly.
+
+    :param str path: directory of the new repository, must not exist
+    :param SyntheticRepoSpec spec: shape of the repository
+    :returns dict ground truth by issue number: {'fix': fix commit hash, 'bic': set of bug introducing hashes}
+    """
+    rnd = random.Random(spec.seed)
+    os.makedirs(path)
+    subprocess.run(['git', 'init', '-q', path], check=True)
+
+    files = {}
+    modes = {}
+    fixes = {}
+    counter = [0]
+
+    def new_line(mark):
+        counter[0] += 1
+        return f'value_{counter[0]} = {rnd.randint(0, 10 ** 6)}', mark
+
+    marks_file = tempfile.NamedTemporaryFile(suffix='.marks', delete=False)
+    marks_file.close()
+    process = subprocess.Popen(['git', '-C', path, 'fast-import', '--quiet', f'--export-marks={marks_file.name}'],
+                               stdin=subprocess.PIPE)
+    writer = _FastImportWriter(process.stdin)
+    main = 'refs/heads/main'
+
+    mark = writer.mark + 1
+    for i in range(spec.files):
+        files[f'src/module_{i}.py'] = [new_line(mark) for _ in range(spec.lines_per_file)]
+        modes[f'src/module_{i}.py'] = '100644'
+    head = writer.commit(main, 'Initial import', [('M', modes[p], p, _content(lines)) for p, lines in files.items()])
+
+    for step in range(1, spec.commits):
+        roll = rnd.random()
+        path_name = rnd.choice(sorted(files))
+        lines = files[path_name]
+        mark = writer.mark + 1
+
+        if roll < spec.merge_rate:
+            feature = f'src/feature_{step}.py'
+            side = f'refs/heads/feature_{step}'
+            side_lines = [new_line(writer.mark + 1) for _ in range(rnd.randint(1, spec.lines_per_file))]
+            side_mark = writer.commit(side, f'Add feature {step}', [('M', '100644', feature, _content(side_lines))],
+                                      from_mark=head)
+            files[feature] = side_lines
+            modes[feature] = '100644'
+            head = writer.commit(main, f'Merge feature {step}', [('M', '100644', feature, _content(side_lines))],
+                                 from_mark=head, merge_mark=side_mark)
+            continue
+
+        roll -= spec.merge_rate
+        if roll < spec.rename_rate:
+            new_path = path_name.replace('.py', f'_r{step}.py')
+            files[new_path] = files.pop(path_name)
+            modes[new_path] = modes.pop(path_name)
+            head = writer.commit(main, f'Rename {path_name}', [('R', path_name, new_path)])
+            continue
+
+        roll -= spec.rename_rate
+        if roll < spec.mode_change_rate:
+            modes[path_name] = '100755' if modes[path_name] == '100644' else '100644'
+            head = writer.commit(main, f'Change mode of {path_name}', [('M', modes[path_name], path_name, _content(lines))])
+            continue
+
+        roll -= spec.mode_change_rate
+        size = rnd.randint(1, min(spec.churn, len(lines))) if lines else 0
+        start = rnd.randint(0, len(lines) - size) if lines else 0
+        if roll < spec.fix_rate and size:
+            issue = len(fixes) + 1
+            fixes[issue] = {'fix': mark, 'bic': {origin for _, origin in lines[start:start + size]}}
+            lines[start:start + size] = [new_line(mark) for _ in range(size)]
+            message = f'Fix #{issue} wrong values in {path_name}'
+        else:
+            action = rnd.random()
+            if action < 0.5 and size:
+                lines[start:start + size] = [new_line(mark) for _ in range(size)]
+            elif action < 0.8 or not size:
+                lines[start:start] = [new_line(mark) for _ in range(rnd.randint(1, spec.churn))]
+            else:
+                del lines[start:start + size]
+            message = f'Update {path_name} (step {step})'
+        head = writer.commit(main, message, [('M', modes[path_name], path_name, _content(lines))])
+
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError('git fast-import failed')
+
+    hashes = {}
+    with open(marks_file.name, encoding='utf-8') as f:
+        for line in f:
+            mark_id, commit_hash = line.split()
+            hashes[int(mark_id[1:])] = commit_hash
+    os.remove(marks_file.name)
+
+    subprocess.run(['git', '-C', path, 'symbolic-ref', 'HEAD', main], check=True)
+    subprocess.run(['git', '-C', path, 'reset', '-q', '--hard'], check=True)
+
+    logger.info(f"generated {writer.mark} commits and {len(fixes)} fixes in {path}")
+    return {issue: {'fix': hashes[fix['fix']], 'bic': {hashes[m] for m in fix['bic']}} for issue, fix in fixes.items()}
@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from collections import defaultdict
+from functools import wraps
+from logging import getLogger, basicConfig, WARNING
+from time import perf_counter
+
+from scripts.benchmarks.synthetic_repo import SyntheticRepoSpec, generate_repository
+from scripts.core import RSZZ
+from scripts.core.szz_core.variations import AGSZZ, MASZZ
+
+logger = getLogger(__name__)
+
+SZZ_VARIANTS = {'RSZZ': RSZZ, 'MASZZ': MASZZ, 'AGSZZ': AGSZZ}
+
+# methods whose cumulated time is reported as a stage of find_bic
+TIMED_STAGES = {
+    'blame': ['_blame'],
+    'filters': ['_exclude_commits_by_change_size', 'get_merge_commits', 'select_meta_changes'],
+}
+
+
+def _instrument(szz, timings):
+    """ Wrap the methods of TIMED_STAGES on the given SZZ instance to accumulate their time in timings """
+    for stage, method_names in TIMED_STAGES.items():
+        for method_name in method_names:
+            method = getattr(szz, method_name, None)
+            if method is None:
+                continue
+
+            @wraps(method)
+            def timed(*args, _method=method, _stage=stage, **kwargs):
+                start = perf_counter()
+                try:
+                    return _method(*args, **kwargs)
+                finally:
+                    timings[_stage] += perf_counter() - start
+
+            setattr(szz, method_name, timed)
+
+
+def run_variant(name, repos_dir, repo_name, ground_truth):
+    """
+    Run one SZZ variant over every fix of the synthetic repository.
+
+    :returns dict per-stage timings (seconds) and accuracy of the variant
+    """
+    timings = defaultdict(float)
+    szz = SZZ_VARIANTS[name](repo_full_name=repo_name, repo_url=None, repos_dir=repos_dir)
+    lookup = szz if isinstance(szz, RSZZ) else RSZZ(repo_full_name=repo_name, repo_url=None, repos_dir=repos_dir)
+    _instrument(szz, timings)
+
+    true_positives = predicted = expected = hits = 0
+    for issue, truth in sorted(ground_truth.items()):
+        start = perf_counter()
+        fixing_commits = lookup.find_bug_fix_commit(str(issue))
+        timings['fix_lookup'] += perf_counter() - start
+
+        bic = set()
+        for fixing_commit in fixing_commits:
+            start = perf_counter()
+            impacted_files = szz.get_impacted_files(fixing_commit)
+            timings['impacted_files'] += perf_counter() - start
+
+            start = perf_counter()
+            bic.update(c.hexsha for c in szz.find_bic(fixing_commit, impacted_files) if c is not None)
+            timings['find_bic'] += perf_counter() - start
+
+        true_positives += len(bic & truth['bic'])
+        predicted += len(bic)
+        expected += len(truth['bic'])
+        hits += int(bool(bic & truth['bic']))
+
+    timings['other'] = timings['find_bic'] - timings['blame'] - timings['filters']
+    return {
+        'fixes': len(ground_truth),
+        'timings': dict(timings),
+        'fixes_per_second': len(ground_truth) / timings['find_bic'] if timings['find_bic'] else None,
+        'precision': true_positives / predicted if predicted else None,
+        'recall': true_positives / expected if expected else None,
+        'hit_rate': hits / len(ground_truth) if ground_truth else None,
+    }
+
+
+def run_benchmark(spec: SyntheticRepoSpec, variants=None, work_dir=None):
+    """
+    Generate a synthetic repository for the spec and run the given SZZ variants over its fixes.
+
+    :param SyntheticRepoSpec spec: shape of the generated repository
+    :param list variants: names of the variants to run, all of SZZ_VARIANTS by default
+    :param str work_dir: directory for the generated repository, a temporary one removed at the end by default
+    :returns dict report with the spec and the results of each variant
+    """
+    keep = work_dir is not None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='szz_bench_')
+    repos_dir = os.path.join(work_dir, 'repos')
+    repo_name = f'synthetic_{spec.seed}'
+    try:
+        start = perf_counter()
+        ground_truth = generate_repository(os.path.join(repos_dir, repo_name), spec)
+        report = {'spec': vars(spec), 'generation_seconds': perf_counter() - start, 'variants': {}}
+        for name in variants or SZZ_VARIANTS:
+            logger.info(f"running {name}")
+            report['variants'][name] = run_variant(name, repos_dir, repo_name, ground_truth)
+        return report
+    finally:
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def format_report(report):
+    stages = ['fix_lookup', 'impacted_files', 'blame', 'filters', 'other', 'find_bic']
+    metrics = ['precision', 'recall', 'hit_rate']
+    rows = [f"{'variant':<8}{'fixes':>7}" + ''.join(f'{name:>16}' for name in stages + metrics)]
+    for name, result in report['variants'].items():
+        row = f"{name:<8}{result['fixes']:>7}"
+        row += ''.join(f"{result['timings'].get(stage, 0.0):>15.3f}s" for stage in stages)
+        row += ''.join(f"{result[metric]:>16.3f}" if result[metric] is not None else f"{'n/a':>16}" for metric in metrics)
+        rows.append(row)
+    return '\n'.join(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the SZZ implementations over a synthetic repository")
+    parser.add_argument('--commits', type=int, default=200)
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--lines-per-file', type=int, default=40)
+    parser.add_argument('--churn', type=int, default=3)
+    parser.add_argument('--rename-rate', type=float, default=0.02)
+    parser.add_argument('--merge-rate', type=float, default=0.05)
+    parser.add_argument('--mode-change-rate', type=float, default=0.02)
+    parser.add_argument('--fix-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--variants', nargs='+', choices=list(SZZ_VARIANTS), default=list(SZZ_VARIANTS))
+    parser.add_argument('--work-dir', default=None, help="keep the generated repository in this directory")
+    parser.add_argument('--json', default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    basicConfig(level=WARNING)
+    spec = SyntheticRepoSpec(commits=args.commits, files=args.files, lines_per_file=args.lines_per_file,
+                             churn=args.churn, rename_rate=args.rename_rate, merge_rate=args.merge_rate,
+                             mode_change_rate=args.mode_change_rate, fix_rate=args.fix_rate, seed=args.seed)
+    report = run_benchmark(spec, args.variants, args.work_dir)
+    print(spec)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
@@ -0,0 +1,142 @@
+import os
+from logging import getLogger
+
+import numpy as np
+from scipy import sparse
+
+from scripts.neo4j_client import DEFAULT_BATCH_SIZE
+
+logger = getLogger(__name__)
+
+DEFAULT_TOP_K = 10
+# commits changing more files than this (mass renames, reformatting, vendoring) say nothing about coupling
+MAX_FILES_PER_COMMIT = 100
+
+DELETE_CO_CHANGES_QUERY = """
+                UNWIND $rows AS id
+                MATCH (f:File {id: id})-[r:co_changed]->(:File)
+                WHERE $repo IS NULL OR f.repo = $repo
+                DELETE r
+                """
+
+
+class CoChangeIndex:
+    """
+    Co-change coupling of the files of a repository: a sparse file x file matrix counting the commits that changed
+    both files, built in bulk from the commit x file incidence matrix A as A^T A. Its diagonal holds the number of
+    commits that changed each file. The matrix and the commits it already counts are kept in an npz file next to
+    the data files, so new commits are added to it without recounting the history.
+
+    Each file gets co_changed relationships to the top_k files it most often changed with, carrying the number of
+    common commits, their support (share of all commits) and confidence (share of the commits of the file).
+    """
+
+    def __init__(self, state_path, top_k=DEFAULT_TOP_K, max_files=MAX_FILES_PER_COMMIT):
+        self.state_path = state_path
+        self.top_k = top_k
+        self.max_files = max_files
+        self.files = []
+        self.file_index = {}
+        self.commits = set()
+        self.total = 0
+        self.counts = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return
+        with np.load(self.state_path) as state:
+            self.files = state['files'].tolist()
+            self.commits = set(state['commits'].tolist())
+            self.total = int(state['total'])
+            self.counts = sparse.csr_matrix((state['data'], state['indices'], state['indptr']),
+                                            shape=(len(self.files), len(self.files)))
+        self.file_index = {file: index for index, file in enumerate(self.files)}
+        logger.info(f"Loaded the co-change index of {len(self.files)} files and {self.total} commits")
+
+    def save(self):
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez_compressed(f, files=np.array(self.files, dtype=str),
+                                commits=np.array(sorted(self.commits), dtype=bytes), total=self.total,
+                                data=self.counts.data, indices=self.counts.indices, indptr=self.counts.indptr)
+        os.replace(temp_path, self.state_path)
+
+    def add_commits(self, commit_files):
+        """
+        Count the commits not counted yet.
+
+        :param dict commit_files: commit hash -> ids of the files it changed
+        :returns numpy array of the indexes of the files whose coupling changed
+        """
+        new_commits = [(commit, sorted(set(files))) for commit, files in commit_files.items()
+                       if commit.encode('utf-8') not in self.commits]
+        rows, columns = [], []
+        counted = 0
+        for commit, files in new_commits:
+            self.commits.add(commit.encode('utf-8'))
+            if not files or len(files) > self.max_files:
+                continue
+            for file in files:
+                if file not in self.file_index:
+                    self.file_index[file] = len(self.files)
+                    self.files.append(file)
+                rows.append(counted)
+                columns.append(self.file_index[file])
+            counted += 1
+        if not counted:
+            return np.array([], dtype=np.int64)
+
+        size = len(self.files)
+        self.counts.resize((size, size))
+        incidence = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)), shape=(counted, size))
+        self.counts = (self.counts + (incidence.T @ incidence).tocsr()).tocsr()
+        self.total += counted
+        logger.info(f"{counted} commits added to the co-change index, {len(new_commits) - counted} skipped")
+        return np.unique(columns)
+
+    def top_co_changes(self, file_indexes):
+        """ co_changed relationship rows of the given files, the top_k most coupled files of each """
+        diagonal = self.counts.diagonal()
+        indptr, indices, data = self.counts.indptr, self.counts.indices, self.counts.data
+        for file in file_indexes:
+            start, end = indptr[file], indptr[file + 1]
+            others, commits = indices[start:end], data[start:end]
+            keep = others != file
+            others, commits = others[keep], commits[keep]
+            if len(commits) > self.top_k:
+                selected = np.argpartition(-commits, self.top_k - 1)[:self.top_k]
+                others, commits = others[selected], commits[selected]
+            for position in np.lexsort((others, -commits)):
+                yield {
+                    'source': self.files[file],
+                    'target': self.files[others[position]],
+                    'attributes': {
+                        'commits': int(commits[position]),
+                        'support': float(commits[position]) / self.total,
+                        'confidence': float(commits[position]) / float(diagonal[file]),
+                    },
+                }
+
+    def update(self, neo_client, graph, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Add the commits of the uploaded graph to the index and rewrite the co_changed relationships of the files
+        they changed. The state is saved once the relationships are written.
+        """
+        commit_files = {}
+        for source, target, relation in graph.edges(keys=True):
+            if relation == 'changed':
+                commit_files.setdefault(source, []).append(target)
+        touched = self.add_commits(commit_files)
+        if not len(touched):
+            logger.info("No new commits for the co-change index")
+            return
+
+        touched_ids = [self.files[file] for file in touched]
+        for start in range(0, len(touched_ids), batch_size):
+            neo_client.write_rows(DELETE_CO_CHANGES_QUERY, touched_ids[start:start + batch_size])
+        rows = list(self.top_co_changes(touched))
+        for start in range(0, len(rows), batch_size):
+            neo_client.upload_edges('File', 'co_changed', 'File', rows[start:start + batch_size])
+        logger.info(f"{len(rows)} co_changed relationships written for {len(touched_ids)} files")
+        self.save()
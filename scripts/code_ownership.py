@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+
+from git import Repo
+
+from scripts.graph_handler import commit_author
+from scripts.neo4j_client import DEFAULT_BATCH_SIZE
+
+logger = getLogger(__name__)
+
+DEFAULT_BLAME_WORKERS = 4
+
+DELETE_OWNERSHIP_QUERY = """
+                UNWIND $rows AS id
+                MATCH (:User)-[r:owns_lines]->(f:File {id: id})
+                WHERE $repo IS NULL OR f.repo = $repo
+                DELETE r
+                """
+
+
+class OwnershipIndexer:
+    """
+    Code ownership at the HEAD of the default branch: every tracked file is blamed, and each author gets an
+    owns_lines relationship to the files with the number of lines they last changed and their share of the file.
+
+    Files are blamed in parallel with git blame, as the SZZ implementations do, and the blame of each blob is cached
+    in a json file next to the data files, so only the files changed since the last run are blamed again. The
+    relationships of the last upload are kept in the same file, so only the files whose ownership changed are
+    rewritten.
+    """
+
+    def __init__(self, repo_path, state_path, workers=DEFAULT_BLAME_WORKERS):
+        self.repo_path = repo_path
+        self.state_path = state_path
+        self.workers = workers
+        self._local = threading.local()
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return {'blames': {}, 'ownership': {}}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, state):
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def _repository(self):
+        # one Repo per thread, the persistent git processes of a Repo are not shared between threads
+        if not hasattr(self._local, 'repository'):
+            self._local.repository = Repo(self.repo_path)
+        return self._local.repository
+
+    def tracked_blobs(self):
+        """ path -> blob hash of the files tracked at HEAD """
+        output = self._repository().git.ls_tree('-r', '--full-tree', 'HEAD')
+        blobs = {}
+        for line in output.splitlines():
+            info, path = line.split('\t', 1)
+            _, object_type, blob = info.split()
+            if object_type == 'blob':
+                blobs[path] = blob
+        return blobs
+
+    def blame(self, path):
+        """ [author name, author email, lines] of the lines of a file at HEAD """
+        lines = {}
+        try:
+            for entry in self._repository().blame_incremental('HEAD', path):
+                author = (entry.commit.author.name, entry.commit.author.email)
+                lines[author] = lines.get(author, 0) + len(entry.linenos)
+        except Exception as e:
+            logger.warning(f"Unable to blame {path}: {e}")
+        return [[name, email, count] for (name, email), count in lines.items()]
+
+    def update(self, neo_client, collaborators, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param list collaborators: collaborators of the repository, to resolve the authors to their User node
+        """
+        state = self.load()
+        blobs = self.tracked_blobs()
+        cached = state['blames']
+        to_blame = sorted(path for path, blob in blobs.items() if blob not in cached)
+        logger.info(f"Blaming {len(to_blame)} of the {len(blobs)} files tracked at HEAD")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for path, authors in zip(to_blame, executor.map(self.blame, to_blame)):
+                cached[blobs[path]] = authors
+        blames = {blob: cached[blob] for blob in set(blobs.values())}
+
+        collaborator_dict = {collaborator['name']: collaborator for collaborator in collaborators}
+        collaborator_login_dict = {collaborator['login']: collaborator for collaborator in collaborators}
+        # File nodes are identified by the file name, like in GraphHandler
+        owned_lines = {}
+        for path, blob in blobs.items():
+            file_lines = owned_lines.setdefault(path.split('/')[-1], {})
+            for name, email, count in blames[blob]:
+                user_id, _ = commit_author(name, email, collaborator_dict, collaborator_login_dict)
+                file_lines[user_id] = file_lines.get(user_id, 0) + count
+        ownership = {}
+        for file_id, file_lines in owned_lines.items():
+            total = sum(file_lines.values())
+            if total:
+                ownership[file_id] = {user_id: [count, count / total] for user_id, count in file_lines.items()}
+
+        previous = state['ownership']
+        changed = sorted(file_id for file_id in set(ownership) | set(previous)
+                         if ownership.get(file_id) != previous.get(file_id))
+        rows = [{'source': user_id, 'target': file_id, 'attributes': {'lines': count, 'share': share}}
+                for file_id in changed for user_id, (count, share) in ownership.get(file_id, {}).items()]
+        logger.info(f"Ownership of {len(changed)} files changed, {len(rows)} owns_lines relationships written")
+        for start in range(0, len(changed), batch_size):
+            neo_client.write_rows(DELETE_OWNERSHIP_QUERY, changed[start:start + batch_size])
+        for start in range(0, len(rows), batch_size):
+            neo_client.upload_edges('User', 'owns_lines', 'File', rows[start:start + batch_size])
+        self.save({'blames': blames, 'ownership': ownership})
@@ -0,0 +1,285 @@
+import sys
+from array import array
+from logging import getLogger
+
+from scripts.graph_handler import GraphHandler
+
+logger = getLogger(__name__)
+
+# booleans stay in list columns, an array('b') would give them back as integers
+_TYPECODES = {int: 'q', float: 'd'}
+_DEFAULTS = {'q': 0, 'd': 0.0}
+
+# state of a cell: absent (the property was never set), null (explicitly set to None) or set
+_ABSENT, _NULL, _SET = 0, 1, 2
+
+# strings up to this size are interned, they are mostly repeated values (states, change types, emails)
+_INTERN_MAX_LENGTH = 64
+
+
+class Column:
+    """
+    Values of one property over the rows of a table. Integers and floats are kept in typed arrays as long as the
+    column only holds values of one of these types, every other column is a list.
+    """
+
+    __slots__ = ('typecode', 'values', 'states')
+
+    def __init__(self):
+        self.typecode = None
+        self.values = []
+        self.states = bytearray()
+
+    def _to_list(self):
+        self.values = [value if state == _SET else None for value, state in zip(self.values, self.states)]
+        self.typecode = None
+
+    def _grow(self, size):
+        missing = size - len(self.states)
+        if missing <= 0:
+            return
+        self.states.extend(bytes(missing))
+        if self.typecode is None:
+            self.values.extend([None] * missing)
+        else:
+            self.values.extend(array(self.typecode, [_DEFAULTS[self.typecode]]) * missing)
+
+    def set(self, row, value):
+        self._grow(row + 1)
+        if value is None:
+            self.states[row] = _NULL
+            return
+        typecode = _TYPECODES.get(type(value))
+        if self.typecode is None and typecode is not None and _SET not in self.states:
+            # first value of the column: keep the column in a typed array until another type shows up
+            self.typecode = typecode
+            self.values = array(typecode, [_DEFAULTS[typecode]]) * len(self.states)
+        elif self.typecode is not None and typecode != self.typecode:
+            self._to_list()
+        if isinstance(value, str) and len(value) <= _INTERN_MAX_LENGTH:
+            value = sys.intern(value)
+        try:
+            self.values[row] = value
+        except OverflowError:
+            self._to_list()
+            self.values[row] = value
+        self.states[row] = _SET
+
+    def get(self, row):
+        """ (present, value) of a row """
+        if row >= len(self.states) or self.states[row] == _ABSENT:
+            return False, None
+        return True, self.values[row] if self.states[row] == _SET else None
+
+
+class Table:
+    """ Rows of the nodes of one label or of the edges of one relationship type, one Column per property """
+
+    __slots__ = ('size', 'columns')
+
+    def __init__(self):
+        self.size = 0
+        self.columns = {}
+
+    def append(self, attributes):
+        row = self.size
+        self.size += 1
+        self.update(row, attributes)
+        return row
+
+    def update(self, row, attributes):
+        for key, value in attributes.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = self.columns[key] = Column()
+            column.set(row, value)
+
+    def row(self, row):
+        attributes = {}
+        for key, column in self.columns.items():
+            present, value = column.get(row)
+            if present:
+                attributes[key] = value
+        return attributes
+
+
+class _NodeView:
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __call__(self, data=False):
+        return self._graph.iter_nodes(data)
+
+    def __iter__(self):
+        return self._graph.iter_nodes(False)
+
+    def __getitem__(self, node):
+        return self._graph.node_attributes(node)
+
+    def __len__(self):
+        return len(self._graph._id_list)
+
+
+class _EdgeView:
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __call__(self, data=False, keys=False):
+        return self._graph.iter_edges(data, keys)
+
+    def __iter__(self):
+        return self._graph.iter_edges(False, False)
+
+    def __getitem__(self, edge):
+        source, target, relation = edge
+        attributes = self._graph.edge_attributes(source, target, relation)
+        if attributes is None:
+            raise KeyError(edge)
+        return attributes
+
+
+class ColumnarGraph:
+    """
+    Compact replacement of the networkx MultiDiGraph built by GraphHandler. Node ids are interned to integer
+    ordinals, nodes are stored in one columnar Table per label and edges in one Table per relationship type, with
+    their ends as arrays of ordinals. Edges are keyed by relationship type, like GraphHandler does with networkx.
+
+    It implements the part of the networkx API used by GraphHandler and by the uploaders: add_node, has_node,
+    add_edge, has_edge, nodes(data=True), nodes[id], edges(data=True, keys=True) and edges[u, v, key], plus
+    node_label to read the label of a node without its attributes. Attribute dicts are materialised one at a time
+    when read, and modifying them does not change the graph.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._id_list = []
+        self._labels = []
+        self._rows = array('q')
+        self.node_tables = {}
+        self.edge_tables = {}
+        self.edge_labels = False
+        self.nodes = _NodeView(self)
+        self.edges = _EdgeView(self)
+
+    def _ordinal(self, node):
+        ordinal = self._ids.get(node)
+        if ordinal is None:
+            # a node only known as the end of an edge, without label nor row until it is added
+            ordinal = self._ids[node] = len(self._id_list)
+            self._id_list.append(node)
+            self._labels.append(None)
+            self._rows.append(-1)
+        return ordinal
+
+    def add_node(self, node, **attributes):
+        ordinal = self._ordinal(node)
+        label = attributes.pop('type', None) or self._labels[ordinal]
+        current_label, row = self._labels[ordinal], self._rows[ordinal]
+        if current_label is not None and current_label != label:
+            # relabelled node: its properties move to the table of the new label
+            attributes = {**self.node_tables[current_label][1].row(row), **attributes}
+            row = -1
+        if label is None:
+            label = 'Node'
+        ordinals, table = self.node_tables.setdefault(label, (array('q'), Table()))
+        if row == -1:
+            self._rows[ordinal] = table.append(attributes)
+            ordinals.append(ordinal)
+        else:
+            table.update(row, attributes)
+        self._labels[ordinal] = label
+
+    def has_node(self, node):
+        return node in self._ids
+
+    def node_attributes(self, node):
+        ordinal = self._ids[node]
+        label = self._labels[ordinal]
+        if label is None:
+            return {}
+        attributes = self.node_tables[label][1].row(self._rows[ordinal])
+        if label != 'Node':
+            attributes['type'] = label
+        return attributes
+
+    def node_label(self, node):
+        """ label of a node, without materialising its attributes """
+        return self._labels[self._ids[node]] or 'Node'
+
+    def iter_nodes(self, data=False):
+        for label, (ordinals, table) in self.node_tables.items():
+            for row, ordinal in enumerate(ordinals):
+                if self._labels[ordinal] != label or self._rows[ordinal] != row:
+                    continue
+                node = self._id_list[ordinal]
+                if data:
+                    attributes = table.row(row)
+                    if label != 'Node':
+                        attributes['type'] = label
+                    yield node, attributes
+                else:
+                    yield node
+        for ordinal, label in enumerate(self._labels):
+            if label is None:
+                yield (self._id_list[ordinal], {}) if data else self._id_list[ordinal]
+
+    def add_edge(self, source, target, key, **attributes):
+        relation = attributes.pop('relation', key)
+        source_ordinal, target_ordinal = self._ordinal(source), self._ordinal(target)
+        sources, targets, index, table = self.edge_tables.setdefault(relation, (array('q'), array('q'), {}, Table()))
+        edge_key = (source_ordinal << 32) | target_ordinal
+        row = index.get(edge_key)
+        if row is None:
+            index[edge_key] = table.append(attributes)
+            sources.append(source_ordinal)
+            targets.append(target_ordinal)
+        else:
+            table.update(row, attributes)
+
+    def _edge_row(self, source, target, relation):
+        if relation not in self.edge_tables or source not in self._ids or target not in self._ids:
+            return None
+        return self.edge_tables[relation][2].get((self._ids[source] << 32) | self._ids[target])
+
+    def has_edge(self, source, target, key):
+        return self._edge_row(source, target, key) is not None
+
+    def edge_attributes(self, source, target, relation):
+        row = self._edge_row(source, target, relation)
+        if row is None:
+            return None
+        return self._edge_row_attributes(relation, self.edge_tables[relation][3], row)
+
+    def _edge_row_attributes(self, relation, table, row):
+        attributes = table.row(row)
+        attributes['relation'] = relation
+        if self.edge_labels:
+            attributes['label'] = relation
+        return attributes
+
+    def iter_edges(self, data=False, keys=False):
+        for relation, (sources, targets, _, table) in self.edge_tables.items():
+            for row in range(table.size):
+                edge = (self._id_list[sources[row]], self._id_list[targets[row]])
+                if keys:
+                    edge += (relation,)
+                if data:
+                    edge += (self._edge_row_attributes(relation, table, row),)
+                yield edge
+
+    def number_of_nodes(self):
+        return len(self._id_list)
+
+    def number_of_edges(self):
+        return sum(table.size for _, _, _, table in self.edge_tables.values())
+
+
+class ColumnarGraphHandler(GraphHandler):
+    """ GraphHandler building a ColumnarGraph instead of a networkx MultiDiGraph, for large repositories """
+
+    def __init__(self, patch_store=None):
+        super().__init__(patch_store)
+        self.G = ColumnarGraph()
+
+    def set_edge_labels(self):
+        self.G.edge_labels = True
@@ -0,0 +1,158 @@
+import json
+import os
+from collections import deque
+from logging import getLogger
+
+from scripts.neo4j_client import DEFAULT_BATCH_SIZE
+
+logger = getLogger(__name__)
+
+# properties stored on the Commit nodes, see reachability_labels
+LABEL_PROPERTIES = ['topoOrder', 'treeStart', 'treeEnd', 'reachLow', 'reachHigh']
+
+SET_LABELS_QUERY = """
+                UNWIND $rows AS row
+                MATCH (c:Commit {id: row.id})
+                WHERE $repo IS NULL OR c.repo = $repo
+                SET c += row.labels
+                """
+
+
+def commit_parents(commits):
+    """ commit hash -> hashes of its parents, for the collected commits whose parents are known """
+    return {commit['hash']: [parent['oid'] for parent in commit['parents']] for commit in commits if 'parents' in commit}
+
+
+def topological_order(parents):
+    """
+    Commits in a topological order, parents before children, and the children of every commit.
+
+    :param dict parents: commit hash -> hashes of its parents, in order. Unknown parents are ignored
+    :returns tuple (order, children)
+    """
+    children = {commit: [] for commit in parents}
+    indegree = {}
+    for commit, commit_parents in parents.items():
+        known = [parent for parent in commit_parents if parent in children]
+        indegree[commit] = len(known)
+        for parent in known:
+            children[parent].append(commit)
+
+    order = []
+    queue = deque(commit for commit in parents if indegree[commit] == 0)
+    while queue:
+        commit = queue.popleft()
+        order.append(commit)
+        for child in children[commit]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                queue.append(child)
+    return order, children
+
+
+def reachability_labels(parents):
+    """
+    Reachability labels of a commit DAG, answering most "is a an ancestor of b" questions with comparisons:
+
+    - topoOrder: position in a topological order, ancestors come first
+    - treeStart, treeEnd: pre-order interval in the first-parent spanning forest. b in [a.treeStart, a.treeEnd]
+      proves that a is an ancestor of b (a is on its first-parent history)
+    - reachLow, reachHigh: post-order interval of the DAG (GRAIL labeling). An ancestor's interval contains the
+      intervals of all its descendants, so a non contained interval proves that a is not an ancestor of b
+
+    Only the pairs with contained reach intervals, a lower topoOrder and no first-parent path need a traversal.
+
+    :param dict parents: commit hash -> hashes of its parents, in order. Unknown parents are ignored
+    :returns dict commit hash -> dict of the label properties
+    """
+    order, children = topological_order(parents)
+    labels = {commit: {'topoOrder': position} for position, commit in enumerate(order)}
+
+    tree_children = {commit: [] for commit in parents}
+    roots = []
+    for commit in order:
+        first_parent = next((parent for parent in parents[commit] if parent in children), None)
+        if first_parent is None:
+            roots.append(commit)
+        else:
+            tree_children[first_parent].append(commit)
+    counter = 0
+    for root in roots:
+        stack = [(root, False)]
+        while stack:
+            commit, done = stack.pop()
+            if done:
+                labels[commit]['treeEnd'] = counter - 1
+                continue
+            labels[commit]['treeStart'] = counter
+            counter += 1
+            stack.append((commit, True))
+            stack.extend((child, False) for child in reversed(tree_children[commit]))
+
+    rank = 0
+    visited = set()
+    for root in roots:
+        visited.add(root)
+        stack = [(root, iter(children[root]))]
+        while stack:
+            commit, pending = stack[-1]
+            child = next((child for child in pending if child not in visited), None)
+            if child is None:
+                stack.pop()
+                labels[commit]['reachHigh'] = rank
+                rank += 1
+            else:
+                visited.add(child)
+                stack.append((child, iter(children[child])))
+    for commit in reversed(order):
+        labels[commit]['reachLow'] = min([labels[commit]['reachHigh']] +
+                                         [labels[child]['reachLow'] for child in children[commit]])
+    return labels
+
+
+class AncestryIndex:
+    """
+    Reachability labels of the commits, stored as properties of the Commit nodes. The labels of the last upload
+    are kept in a json file next to the data files, so an update only writes the commits whose labels changed and
+    the parent_of relationships of the commits indexed for the first time, including those collected before the
+    parents were recorded.
+    """
+
+    def __init__(self, state_path):
+        self.state_path = state_path
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, labels):
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(labels, f)
+        os.replace(temp_path, self.state_path)
+
+    def update(self, neo_client, commits, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param list commits: all the collected commits, with their parents
+        """
+        parents = commit_parents(commits)
+        if not parents:
+            logger.info("No commit parents collected, skipping the ancestry index")
+            return
+        labels = reachability_labels(parents)
+        previous = self.load()
+
+        rows = [{'id': commit, 'labels': commit_labels} for commit, commit_labels in labels.items()
+                if previous.get(commit) != commit_labels]
+        edges = [{'source': parent, 'target': commit, 'attributes': {}}
+                 for commit, commit_parents in parents.items() if commit not in previous
+                 for parent in commit_parents if parent in parents]
+        logger.info(f"Ancestry index: {len(rows)} commits relabelled, {len(edges)} parent_of relationships written")
+
+        for start in range(0, len(edges), batch_size):
+            neo_client.upload_edges('Commit', 'parent_of', 'Commit', edges[start:start + batch_size])
+        for start in range(0, len(rows), batch_size):
+            neo_client.write_rows(SET_LABELS_QUERY, rows[start:start + batch_size])
+        self.save(labels)
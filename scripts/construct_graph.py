@@ -1,8 +1,24 @@
 import os
 from scripts.github_data_collector import GitHubDataCollector
 from scripts.graph_handler import GraphHandler, DataHandler
+from scripts.columnar_graph import ColumnarGraphHandler
 from scripts.link_bugs import LinkBugs
-from scripts.neo4j_client import Neo4jClient
+from scripts.neo4j_client import Neo4jClient, DEFAULT_BATCH_SIZE
+from scripts.neo4j_schema import provision_schema
+from scripts.neo4j_import import export_import_csv, run_import
+from scripts.graph_sync import GraphSync, graph_snapshot
+from scripts.graph_aggregates import AggregateCounters
+from scripts.embeddings import EmbeddingIndexer, get_embedder
+from scripts.co_change import CoChangeIndex, DEFAULT_TOP_K
+from scripts.commit_ancestry import AncestryIndex
+from scripts.release_containment import ReleaseContainment
+from scripts.code_ownership import OwnershipIndexer, DEFAULT_BLAME_WORKERS
+from scripts.activity_rollups import ActivityRollups
+from scripts.snapshot import export_snapshot
+from scripts.derived_stages import derived_pending_path, mark_derived_pending
+from scripts.upload_journal import UploadJournal
+from scripts.patch_store import PatchStore
+from scripts.tenancy import multi_tenant
 from logging import getLogger
 from os.path import join
 
@@ -16,15 +32,17 @@ def get_entities_path(current_working_dir, url, entity):
 
 def construct_graph(repo_url, token, neo4j_uri, neo4j_user, neo4j_password):
     try:
-        query = f"cypher MATCH (n:Repository) RETURN n.name, n.url LIMIT 25;"
+        query = f"cypher MATCH (n:Repository) RETURN n.name, n.url{'' if multi_tenant() else ' LIMIT 25'};"
         neo_client = Neo4jClient(neo4j_uri, neo4j_user, neo4j_password)
         result = neo_client.execute_query(query)
         neo_client.close()
 
         if not result:
             logger.info(f"Creating a new database for '{repo_url}'.")
-        elif result[0]['n.url'] == repo_url:
+        elif any(record['n.url'] == repo_url for record in result):
             logger.info(f"Using the existing database for '{repo_url}'. Information in the database will be updated.")
+        elif multi_tenant():
+            logger.info(f"Adding '{repo_url}' to the database shared with {len(result)} other repositories.")
         else:
             logger.error(f"Neo4j database already in use by {result[0]['n.url']}. Use a different database for '{repo_url}'.")
             raise Exception(f"Neo4j database already in use by a different project. Use a different database for '{repo_url.split('/')[-1]}'.")
@@ -39,26 +57,83 @@ def construct_graph(repo_url, token, neo4j_uri, neo4j_user, neo4j_password):
     commits_path, commits_updated = get_entities_path(current_working_dir, url, 'commits')
     issues_path, issues_updated = get_entities_path(current_working_dir, url, 'issues')
     bic_path, bics_updated = get_entities_path(current_working_dir, url, 'fixing_bic')
+    tags_path, tags_updated = get_entities_path(current_working_dir, url, 'tags')
+    releases_path, releases_updated = get_entities_path(current_working_dir, url, 'releases')
+
+    manifest_path = join(current_working_dir, f"data/{url}/{url}_graph_manifest.json")
+    journal_path = join(current_working_dir, f"data/{url}/{url}_upload_journal.jsonl")
+    delta_sync = os.getenv('NEO4J_DELTA_SYNC', 'false').lower() == 'true'
+
+    interrupted_upload = os.path.exists(journal_path)
+    # present while the first upload of the repository has not completed, it is then resumed from the full data
+    # files rather than updated with the data collected since
+    first_upload_path = join(current_working_dir, f"data/{url}/{url}_first_upload.pending")
+    interrupted_first_run = os.path.exists(first_upload_path)
+    data_dir = join(current_working_dir, f"data/{url}")
+    derived_pending = os.path.exists(derived_pending_path(data_dir, url))
 
     first_run = not any([os.path.exists(path) for path in [repositories_path, collaborators_path, commits_path, issues_path, bic_path]])
 
-    data_collector = GitHubDataCollector(token, repo_url)
-    data_collector.collect_data()
+    if first_run:
+        os.makedirs(os.path.dirname(first_upload_path), exist_ok=True)
+        open(first_upload_path, 'a').close()
+
+    # the journal of an interrupted update only matches the batches of the same update graph: it is rebuilt from the
+    # new_ files left by that update before any further collection overwrites them
+    resume_update = interrupted_upload and not (first_run or interrupted_first_run)
+    if resume_update:
+        logger.info("Resuming the interrupted upload of the graph before collecting new data")
+    else:
+        data_collector = GitHubDataCollector(token, repo_url)
+        data_collector.collect_data()
 
-    updated_file_paths = [repositories_updated, collaborators_updated, commits_updated, issues_updated, bics_updated]
+    updated_file_paths = [repositories_updated, collaborators_updated, commits_updated, issues_updated, bics_updated,
+                          tags_updated, releases_updated]
     
     updated_files = [path for path in updated_file_paths if os.path.exists(path)]
     any_updates = bool(updated_files)
     
-    if first_run or any_updates:
+    if first_run or interrupted_first_run or derived_pending or any_updates or interrupted_upload:
         if first_run:
             logger.info("Creating graph for the first time")
             repositories = DataHandler(repositories_path).load_data()
             collaborators = DataHandler(collaborators_path).load_data()
             commits = DataHandler(commits_path).load_data()
             issues = DataHandler(issues_path).load_data()
+            tags = DataHandler(tags_path).load_data() if os.path.exists(tags_path) else []
+            releases = DataHandler(releases_path).load_data() if os.path.exists(releases_path) else []
 
             bics = LinkBugs(repo_url).process_issues()
+        elif interrupted_first_run or derived_pending:
+            if interrupted_first_run:
+                logger.info("Resuming the interrupted first upload of the graph")
+            else:
+                logger.info("Computing the derived data of the imported graph")
+            repositories = DataHandler(repositories_path).load_data()
+            collaborators = DataHandler(collaborators_path).load_data()
+            commits = DataHandler(commits_path).load_data()
+            issues = DataHandler(issues_path).load_data()
+            tags = DataHandler(tags_path).load_data() if os.path.exists(tags_path) else []
+            releases = DataHandler(releases_path).load_data() if os.path.exists(releases_path) else []
+
+            if not os.path.exists(bic_path):
+                LinkBugs(repo_url).process_issues()
+            elif os.path.exists(issues_updated):
+                LinkBugs(repo_url).process_issues(True)
+            bics = DataHandler(bic_path).load_data() if os.path.exists(bic_path) else []
+        elif any_updates and delta_sync:
+            # the graph is rebuilt from the complete data and only its difference with the last upload is written
+            logger.info("Updating the graph with delta sync")
+            repositories = DataHandler(repositories_path).load_data()
+            collaborators = DataHandler(collaborators_path).load_data()
+            commits = DataHandler(commits_path).load_data()
+            issues = DataHandler(issues_path).load_data()
+            tags = DataHandler(tags_path).load_data() if os.path.exists(tags_path) else []
+            releases = DataHandler(releases_path).load_data() if os.path.exists(releases_path) else []
+
+            if os.path.exists(issues_updated):
+                LinkBugs(repo_url).process_issues(True)
+            bics = DataHandler(bic_path).load_data() if os.path.exists(bic_path) else []
         elif any_updates:
             logger.info("Updating the graph")
             collaborators = DataHandler(collaborators_path).load_data()
@@ -78,29 +153,127 @@ def construct_graph(repo_url, token, neo4j_uri, neo4j_user, neo4j_password):
             else:
                 bics = []
             
+            tags = DataHandler(tags_updated).load_data() if os.path.exists(tags_updated) else []
+            releases = DataHandler(releases_updated).load_data() if os.path.exists(releases_updated) else []
+
+            repositories = DataHandler(repositories_path).load_data()
+        else:
+            # the update files of the interrupted upload are gone: the graph is rebuilt from the complete data and
+            # replaces the aggregates, as none of its batches matches the journal
+            logger.info("Resuming the interrupted upload of the graph from the complete data")
             repositories = DataHandler(repositories_path).load_data()
+            collaborators = DataHandler(collaborators_path).load_data()
+            commits = DataHandler(commits_path).load_data()
+            issues = DataHandler(issues_path).load_data()
+            tags = DataHandler(tags_path).load_data() if os.path.exists(tags_path) else []
+            releases = DataHandler(releases_path).load_data() if os.path.exists(releases_path) else []
+            bics = DataHandler(bic_path).load_data() if os.path.exists(bic_path) else []
 
-        graph_handler = GraphHandler()
-        collaborators = graph_handler.add_nodes_and_edges(repositories, collaborators, commits, issues)
+        patch_store = PatchStore(join(current_working_dir, f"data/{url}/patches"))
+        if os.getenv('GRAPH_BUILDER', 'networkx') == 'columnar':
+            graph_handler = ColumnarGraphHandler(patch_store)
+        else:
+            graph_handler = GraphHandler(patch_store)
+        collaborators = graph_handler.add_nodes_and_edges(repositories, collaborators, commits, issues, tags, releases)
 
         if collaborators:
             DataHandler(collaborators_path).save_data(collaborators)
         if bics:
             graph_handler.add_bic_relationships(bics)
 
-        for u, v, k in graph_handler.G.edges(keys=True):
-            graph_handler.G[u][v][k]['label'] = k
+        graph_handler.set_edge_labels()
 
-        neo_client = Neo4jClient(neo4j_uri, neo4j_user, neo4j_password)
-        neo_client.upload_graph(graph_handler.G)
+        snapshot_dir = os.getenv('GRAPH_SNAPSHOT_DIR')
+        if snapshot_dir:
+            if first_run or interrupted_first_run or derived_pending or delta_sync:
+                export_snapshot(graph_handler.G, join(snapshot_dir, url), repo_url, patch_store=patch_store)
+            else:
+                # without delta sync an update graph only holds the new data
+                logger.info("Graph snapshot skipped, the graph of an update is only complete with NEO4J_DELTA_SYNC")
+
+        import_dir = os.getenv('NEO4J_IMPORT_DIR')
+        if first_run and import_dir and multi_tenant():
+            # neo4j-admin import replaces the whole database, with the graphs of the other repositories
+            logger.warning("NEO4J_IMPORT_DIR is ignored in a database shared by several repositories, "
+                           "uploading the graph transactionally")
+            import_dir = None
+        if first_run and import_dir:
+            # offline bulk load, the constraints and indexes are provisioned by the next transactional update
+            files = export_import_csv(graph_handler.G, join(import_dir, url), repo=repo_url if multi_tenant() else None)
+            if os.getenv('NEO4J_ADMIN'):
+                run_import(files, os.getenv('NEO4J_IMPORT_DATABASE', 'neo4j'), os.getenv('NEO4J_ADMIN'))
+                message = ("Graph imported with neo4j-admin, start the Neo4j database and run the ingestion again "
+                           "to compute its derived data")
+            else:
+                message = f"Graph exported as neo4j-admin import files to {join(import_dir, url)}"
+            os.remove(first_upload_path)
+            # the derived stages need the database to be running, they are left to the next ingestion
+            mark_derived_pending(data_dir, url)
+            logger.info(message)
+            return message
+
+        # a previous upload of the same graph that failed part way is resumed from its journal
+        journal = UploadJournal(journal_path)
+        # a graph built from the complete data replaces the aggregates of its relationships
+        complete_graph = delta_sync or first_run or interrupted_first_run or derived_pending or not any_updates
+        neo_client = Neo4jClient(neo4j_uri, neo4j_user, neo4j_password, journal=journal, accumulate=not complete_graph,
+                                 repo=repo_url if multi_tenant() else None)
+        embedder = get_embedder()
+        provision_schema(neo_client, vector_dimensions=embedder.dimensions if embedder else None)
+        batch_size = int(os.getenv('NEO4J_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+        concurrency = int(os.getenv('NEO4J_WRITE_CONCURRENCY', 1))
+        if derived_pending and not (any_updates or interrupted_upload):
+            # the imported graph is already in the database, only its derived data is missing
+            logger.info("Skipping the upload of the imported graph")
+            if delta_sync:
+                GraphSync(neo_client, manifest_path).save_manifest(*graph_snapshot(graph_handler.G))
+            written_edges = graph_handler.G.edges(keys=True)
+        elif delta_sync:
+            graph_sync = GraphSync(neo_client, manifest_path)
+            graph_sync.sync(graph_handler.G, batch_size, concurrency)
+            written_edges = graph_sync.changed_edges
+        else:
+            neo_client.upload_graph(graph_handler.G, batch_size=batch_size, concurrency=concurrency)
+            written_edges = graph_handler.G.edges(keys=True)
+        AggregateCounters(neo_client).refresh(written_edges, batch_size)
+        all_commits = DataHandler(commits_path).load_data()
+        all_bics = DataHandler(bic_path).load_data() if os.path.exists(bic_path) else []
+        ancestry_path = join(current_working_dir, f"data/{url}/{url}_ancestry.json")
+        AncestryIndex(ancestry_path).update(neo_client, all_commits, batch_size)
+        if os.path.exists(tags_path):
+            containment_path = join(current_working_dir, f"data/{url}/{url}_release_containment.json")
+            ReleaseContainment(containment_path).update(neo_client, all_commits, DataHandler(tags_path).load_data(),
+                                                        all_bics, batch_size)
+        blame_workers = int(os.getenv('OWNERSHIP_BLAME_WORKERS', DEFAULT_BLAME_WORKERS))
+        if blame_workers > 0:
+            ownership_path = join(current_working_dir, f"data/{url}/{url}_ownership.json")
+            OwnershipIndexer(join(current_working_dir, f"repos/{url}"), ownership_path, blame_workers).update(
+                neo_client, collaborators or [], batch_size)
+        if os.getenv('ACTIVITY_ROLLUPS', 'true').lower() == 'true':
+            rollups_path = join(current_working_dir, f"data/{url}/{url}_activity_rollups.json")
+            ActivityRollups(rollups_path).update(neo_client, all_commits, DataHandler(issues_path).load_data(),
+                                                 all_bics, collaborators or [], batch_size)
+        co_change_top_k = int(os.getenv('CO_CHANGE_TOP_K', DEFAULT_TOP_K))
+        if co_change_top_k > 0:
+            co_change_path = join(current_working_dir, f"data/{url}/{url}_co_change.npz")
+            CoChangeIndex(co_change_path, co_change_top_k).update(neo_client, graph_handler.G, batch_size)
+        if embedder:
+            EmbeddingIndexer(neo_client, embedder).index_graph(graph_handler.G, batch_size)
         neo_client.close()
+        journal.clear()
+        if interrupted_first_run or first_run:
+            os.remove(first_upload_path)
+        if derived_pending:
+            os.remove(derived_pending_path(data_dir, url))
 
-        if first_run:
-            message = "Graph created successfully"
-        elif any_updates:
-            message = "Graph updated successfully"
+        if first_run or interrupted_first_run or derived_pending or any_updates:
+            message = "Graph created successfully" if first_run or interrupted_first_run or derived_pending \
+                else "Graph updated successfully"
+            # data collected since an interrupted first run is already part of the uploaded graph
             for path in updated_files:
                 os.remove(path)
+        else:
+            message = "Interrupted graph upload completed successfully"
         logger.info(message)
         return message
     else:
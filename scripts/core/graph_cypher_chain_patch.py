@@ -4,9 +4,15 @@ from typing import Any, Dict, List, Optional
 from logging import getLogger
 from langchain_core.callbacks import CallbackManagerForChainRun
 from langchain.chains import GraphCypherQAChain
+from scripts.tenancy import scope_cypher
+from scripts.embeddings import strip_embeddings
+from scripts.neo4j_schema import VECTOR_INDEXES, vector_index_name
 
 INTERMEDIATE_STEPS_KEY = "intermediate_steps"
 
+# property access to the patch text of a changed relationship, e.g. r.patch, which only holds its digest in Neo4j
+PATCH_PROPERTY_PATTERN = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\.patch\b")
+
 logger = getLogger(__name__)
 
 
@@ -84,21 +90,96 @@ def construct_schema(structured_schema: Dict[str, Any], include_types: List[str]
     )
 
 
+def rewrite_patch_access(cypher: str) -> str:
+    """Read the digest of the patches asked for by the query, the text is fetched from the patch store afterwards."""
+    return PATCH_PROPERTY_PATTERN.sub(r"\1.patchDigest", cypher)
+
+
 class PatchedGraphCypherQAChain(GraphCypherQAChain):
+    schema_notes: str = ""
+    """Notes on the graph appended to the schema in the prompts."""
+    patch_store: Optional[Any] = None
+    """Store of the patch texts of the changed relationships, queried when the Cypher statement returns a patch."""
+    tenant_label: Optional[str] = None
+    """Tenant label of the repository in a database shared by several repositories, added to the node patterns."""
+    embedder: Optional[Any] = None
+    """Embedder of the commit and issue texts, the nodes closest to the question are given to the Cypher prompt."""
+    retrieval_k: int = 10
+    """Number of nodes of each label retrieved by semantic search."""
+    retrieval_overfetch: int = 10
+    """Factor by which the vector search over-fetches in a shared database, before the nodes of the other
+    repositories are filtered out."""
+
+    @property
+    def prompt_schema(self) -> str:
+        return f"{self.graph_schema}\n{self.schema_notes}" if self.schema_notes else self.graph_schema
+
+    def retrieve(self, question):
+        """
+        Ids of the Commit and Issue nodes semantically closest to the question, by label, most similar first. The
+        vector indexes span every repository of a shared database, so the search then fetches retrieval_overfetch
+        times more candidates and keeps the retrieval_k best ones of the repository.
+        """
+        vector = self.embedder.embed([question])[0]
+        if vector is None:
+            return {}
+        candidates = self.retrieval_k * (self.retrieval_overfetch if self.tenant_label is not None else 1)
+        retrieved = {}
+        for label in VECTOR_INDEXES:
+            records = self.graph.query(
+                """
+                CALL db.index.vector.queryNodes($index, $candidates, $vector) YIELD node, score
+                WHERE $tenant IS NULL OR $tenant IN labels(node)
+                RETURN node.id AS id, score
+                ORDER BY score DESC
+                LIMIT $k
+                """,
+                {"index": vector_index_name(label), "candidates": candidates, "k": self.retrieval_k,
+                 "vector": vector, "tenant": self.tenant_label})
+            if records:
+                retrieved[label] = [record["id"] for record in records]
+        return retrieved
+
+    def retrieval_notes(self, question):
+        """Schema notes seeding the Cypher prompt with the retrieved nodes, empty without embedder or results."""
+        if self.embedder is None:
+            return ""
+        try:
+            retrieved = self.retrieve(question)
+        except Exception as e:
+            logger.error(f"Semantic retrieval failed: {e}")
+            return ""
+        if not retrieved:
+            return ""
+        logger.info(f"Retrieved nodes: {retrieved}")
+        lines = [f"{label} nodes with an id in {ids}" for label, ids in retrieved.items()]
+        return ("Nodes semantically related to the question, most similar first: " + "; ".join(lines) + ". "
+                "When the question is about a topic rather than exact words, restrict the query to these nodes, "
+                "e.g. WHERE i.id IN [...].")
+
+    def query_graph(self, generated_cypher):
+        if self.tenant_label is not None:
+            generated_cypher = scope_cypher(generated_cypher, self.tenant_label)
+        if self.patch_store is None or not PATCH_PROPERTY_PATTERN.search(generated_cypher):
+            return strip_embeddings(self.graph.query(generated_cypher))
+        context = self.graph.query(rewrite_patch_access(generated_cypher))
+        return strip_embeddings(self.patch_store.hydrate(context))
 
     def generate_cypher(self, question, chat_history, callbacks, error_context=None):
         logger.info('Generating Cypher statement')
+        notes = self.retrieval_notes(question)
+        schema = f"{self.prompt_schema}\n{notes}" if notes else self.prompt_schema
 
         if error_context is None:
             logger.info("Standard prompt used to generate cypher statement")
-            prompt = {"question": question, "schema": self.graph_schema, "error_context": "",
+            prompt = {"question": question, "schema": schema, "error_context": "",
                       "history": chat_history,
                       "current_date": {datetime.now(timezone.utc).replace(microsecond=0).isoformat() + 'Z'}}
 
         else:
             logger.info("Error prompt used to generate cypher statement")
             prompt = {"question": question,
-                      "schema": self.graph_schema,
+                      "schema": schema,
                       "history": chat_history,
                       "error_context": error_context,
                       "current_date": {datetime.now(timezone.utc).replace(microsecond=0).isoformat() + 'Z'}}
@@ -117,7 +198,7 @@ class PatchedGraphCypherQAChain(GraphCypherQAChain):
     def get_context(self, question, generated_cypher, chat_history, callbacks):
         if generated_cypher:
             try:
-                context = self.graph.query(generated_cypher)
+                context = self.query_graph(generated_cypher)
             except Exception as e:
                 logger.error(f"Error executing Cypher query: {e}")
                 logger.info("Regenerating query...")
@@ -125,7 +206,7 @@ class PatchedGraphCypherQAChain(GraphCypherQAChain):
 
                 generated_cypher, _ = self.generate_cypher(question, chat_history, callbacks, error_context=error_context)
                 try:
-                    context = self.graph.query(generated_cypher)
+                    context = self.query_graph(generated_cypher)
                 except Exception as e:
                     logger.exception(f"Error executing Cypher query: {e} even after re-generating it.")
                     context = []
@@ -181,7 +262,7 @@ class PatchedGraphCypherQAChain(GraphCypherQAChain):
 
             result = self.qa_chain(
                 {
-                    "schema": self.graph_schema,
+                    "schema": self.prompt_schema,
                     "graph_query": generated_cypher,
                     "question": question,
                     "context": context},
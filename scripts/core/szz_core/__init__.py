@@ -1,6 +1,8 @@
 from .options import Options
 # from .comment_parser import CommentParser
 from .commands import CommandRunner
+from .diff_parser import FileDiff, Hunk, parse_diff
+from .budget import SZZBudget
 from .abstract_szz import AbstractSZZ, DetectLineMoved, LineChangeType, ImpactedFile, BlameData
 
-__all__ = ['Options', 'CommentParser', 'CommandRunner', 'AbstractSZZ', 'DetectLineMoved', 'LineChangeType', 'ImpactedFile', 'BlameData']
\ No newline at end of file
+__all__ = ['Options', 'CommentParser', 'CommandRunner', 'FileDiff', 'Hunk', 'parse_diff', 'AbstractSZZ', 'DetectLineMoved', 'LineChangeType', 'ImpactedFile', 'BlameData', 'SZZBudget']
\ No newline at end of file
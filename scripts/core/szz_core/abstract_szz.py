@@ -7,11 +7,12 @@ from enum import Enum
 from shutil import copytree
 from shutil import rmtree
 from tempfile import mkdtemp
-from typing import List, Set
+from typing import Iterator, List, Set
 
 from git import Commit, Repo
-from pydriller import ModificationType, Repository as PyDrillerGitRepo
 
+from scripts.core.szz_core.commands import CommandRunner
+from scripts.core.szz_core.diff_parser import parse_diff
 from scripts.core.szz_core.options import Options
 # from scripts.core.szz_core.comment_parser import CommentParser
 from scripts.core.szz_core.comment_parser import parse_comments
@@ -23,7 +24,7 @@ class AbstractSZZ(ABC):
     """
     AbstractSZZ is the base class for SZZ implementations. It has core methods for SZZ
     like blame and a diff parsing for impacted files. GitPython is used for base Git
-    commands and PyDriller to parse commit modifications.
+    commands, while the impacted files are read from a streamed 'git diff -U0'.
     """
 
     def __init__(self, repo_full_name: str, repo_url: str, repos_dir: str = None):
@@ -38,6 +39,7 @@ class AbstractSZZ(ABC):
         :param str repos_dir: temp folder where to clone the given repo
         """
         self._repository = None
+        self._budget = None
 
         os.makedirs(Options.TEMP_WORKING_DIR, exist_ok=True)
         self.__temp_dir = mkdtemp(dir=os.path.join(os.getcwd(), Options.TEMP_WORKING_DIR))
@@ -95,9 +97,9 @@ class AbstractSZZ(ABC):
                            file_ext_to_parse: List[str] = None,
                            only_deleted_lines: bool = True) -> List['ImpactedFile']:
         """
-         Parse the diff of given fix commit using PyDriller to obtain a list of ImpactedFile with
-         impacted file path and modified line ranges. As default behaviour, all deleted lines in the diff which
-         are also added are treated as modified lines.
+         Parse the diff of given fix commit to obtain a list of ImpactedFile with impacted file path and
+         modified line ranges. As default behaviour, all deleted lines in the diff which are also added are
+         treated as modified lines.
 
         :param List[str] file_ext_to_parse: parse only the given file extensions
         :param only_deleted_lines: considers as modified lines only the line numbers that are deleted and added.
@@ -105,47 +107,53 @@ class AbstractSZZ(ABC):
         :param str fix_commit_hash: hash of fix commit to parse
         :returns List[ImpactedFile] impacted_files
         """
-        impacted_files = list()
-
-        def get_commit_by_hash(repo_path, commit_hash):
-            # for commit in PyDrillerGitRepo(repo_path).traverse_commits():
-            #     if commit.hash == commit_hash:
-            #         # print(commit.hash)
-            #         return commit
-            return PyDrillerGitRepo(repo_path, single=commit_hash).traverse_commits()
-
-        # fix_commit = PyDrillerGitRepo(self.repository_path).get_commit(fix_commit_hash)
-        for fix_commit in get_commit_by_hash(self.repository_path, fix_commit_hash):
-            fix_commit = fix_commit
-        # fix_commit = get_commit_by_hash(self.repository_path, fix_commit_hash)
-        for mod in fix_commit.modified_files:
+        impacted_files = list(self.iter_impacted_files(fix_commit_hash, file_ext_to_parse, only_deleted_lines))
+        logger.info(impacted_files)
+
+        return impacted_files
+
+    def iter_impacted_files(self, fix_commit_hash: str,
+                            file_ext_to_parse: List[str] = None,
+                            only_deleted_lines: bool = True) -> Iterator['ImpactedFile']:
+        """
+         Stream the zero-context diff between the fix commit and its first parent ('git diff -U0') and yield an
+         ImpactedFile for each file, reading the line numbers straight from the hunk headers. Content lines are
+         never materialised.
+
+        :param str fix_commit_hash: hash of fix commit to parse
+        :param List[str] file_ext_to_parse: parse only the given file extensions
+        :param only_deleted_lines: considers as modified lines only the line numbers that are deleted and added.
+            By default, only deleted lines are considered
+        :returns Iterator[ImpactedFile] impacted_files
+        """
+        diff_lines = CommandRunner(self.repository_path).stream_command([
+            '-c', 'core.quotePath=false', 'diff', '-U0', '--no-color', '--no-ext-diff', '-M',
+            '--src-prefix=a/', '--dst-prefix=b/', f'{fix_commit_hash}^', fix_commit_hash
+        ])
+        for file_diff in parse_diff(diff_lines):
             # skip newly added files
-            if not mod.old_path:
+            if not file_diff.old_path:
                 continue
 
             # filter files by extension
             if file_ext_to_parse:
-                ext = mod.filename.split('.')
+                filename = ntpath.basename(file_diff.new_path or file_diff.old_path)
+                ext = filename.split('.')
                 if len(ext) < 2 or (len(ext) > 1 and ext[1].lower() not in file_ext_to_parse):
-                    logger.info(f"skip file: {mod.filename}")
+                    logger.info(f"skip file: {filename}")
                     continue
 
-            file_path = mod.new_path
-            if mod.change_type == ModificationType.DELETE or mod.change_type == ModificationType.RENAME:
-                file_path = mod.old_path
+            # deleted, renamed and modified files are all blamed on their path before the fix
+            file_path = file_diff.old_path
 
-            lines_deleted = [deleted[0] for deleted in mod.diff_parsed['deleted']]
+            lines_deleted = file_diff.deleted_lines()
             if len(lines_deleted) > 0:
-                impacted_files.append(ImpactedFile(file_path, lines_deleted, LineChangeType.DELETE))
+                yield ImpactedFile(file_path, lines_deleted, LineChangeType.DELETE)
 
             if not only_deleted_lines:
-                lines_added = [added[0] for added in mod.diff_parsed['added']]
+                lines_added = file_diff.added_lines()
                 if len(lines_added) > 0:
-                    impacted_files.append(ImpactedFile(file_path, lines_added, LineChangeType.ADD))
-
-        logger.info(impacted_files)
-
-        return impacted_files
+                    yield ImpactedFile(file_path, lines_added, LineChangeType.ADD)
 
     def _blame(self, rev: str,
                file_path: str,
@@ -191,6 +199,9 @@ class AbstractSZZ(ABC):
         if detect_move_from_other_files and detect_move_from_other_files == DetectLineMoved.ANY_COMMIT:
             kwargs['C'] = [True, True, True]
 
+        if self._budget:
+            self._budget.charge_blame()
+
         bug_introd_commits = set()
         mod_line_ranges = self._parse_line_ranges(modified_lines)
         logger.info(f"processing file: {file_path}")
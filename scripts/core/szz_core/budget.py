@@ -0,0 +1,36 @@
+from time import time as ts
+
+
+class SZZBudget:
+    """
+    Time and blame-call budget for the search of the bug introducing commits of one fix commit. SZZ
+    implementations stop blaming once the budget is exhausted and return the candidates found so far, with
+    the truncated flag set.
+    """
+
+    def __init__(self, time_limit: float = None, max_blame_calls: int = None, deadline: float = None):
+        """
+        :param float time_limit: seconds available from now, None for no time limit
+        :param int max_blame_calls: maximum number of git blame calls, None for no limit
+        :param float deadline: absolute timestamp (as time.time()) after which the budget is exhausted, e.g. the
+            end of the whole run. The earliest between deadline and now + time_limit is used
+        """
+        deadlines = [d for d in (deadline, ts() + time_limit if time_limit is not None else None) if d is not None]
+        self.deadline = min(deadlines) if deadlines else None
+        self.max_blame_calls = max_blame_calls
+        self.blame_calls = 0
+        self.truncated = False
+
+    def charge_blame(self):
+        """ Account for one git blame call """
+        self.blame_calls += 1
+
+    def exhausted(self) -> bool:
+        """ Check whether the budget is over, flagging the results as truncated if so """
+        if (self.deadline is not None and ts() > self.deadline) or \
+                (self.max_blame_calls is not None and self.blame_calls >= self.max_blame_calls):
+            self.truncated = True
+        return self.truncated
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(deadline={self.deadline},max_blame_calls={self.max_blame_calls},blame_calls={self.blame_calls},truncated={self.truncated})'
@@ -1,5 +1,8 @@
 import subprocess
 
+from git.exc import GitCommandError
+
+
 class CommandRunner:
     def __init__(self, repo_dir):
         self.repo_dir = repo_dir
@@ -20,6 +23,26 @@ class CommandRunner:
             return None, result.stderr.strip()
         return result.stdout.strip(), None
 
+    def stream_command(self, command):
+        """Runs a git command in the specified repository directory and yields its output line by line.
+
+        Args:
+            command (list): The git command to run as a list of arguments.
+
+        Yields:
+            str: Each line of the command's stdout, including the trailing newline.
+
+        Raises:
+            GitCommandError: once the output has been consumed, if the command failed, as GitPython does.
+        """
+        with subprocess.Popen(['git', '-C', self.repo_dir] + command, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace') as process:
+            yield from process.stdout
+            stderr = process.stderr.read()
+            status = process.wait()
+            if status != 0:
+                raise GitCommandError(['git'] + command, status, stderr.strip())
+
 # # Example usage
 # repo_directory = '/path/to/repo'
 # command_runner = CommandRunner(repo_directory)
@@ -0,0 +1,137 @@
+import codecs
+import re
+from collections import namedtuple
+from logging import getLogger
+from typing import Iterable, Iterator, List, Optional
+
+logger = getLogger(__name__)
+
+Hunk = namedtuple('Hunk', 'old_start old_count new_start new_count')
+
+HUNK_HEADER_PATTERN = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+DEV_NULL = '/dev/null'
+
+
+class FileDiff:
+    """ Data class to represent the hunks of a single file in a unified diff """
+    __slots__ = ('old_path', 'new_path', 'hunks')
+
+    def __init__(self, old_path: Optional[str], new_path: Optional[str]):
+        """
+        :param str old_path: path of the file before the change, None for newly added files
+        :param str new_path: path of the file after the change, None for deleted files
+        :returns FileDiff
+        """
+        self.old_path = old_path
+        self.new_path = new_path
+        self.hunks: List[Hunk] = list()
+
+    def deleted_lines(self) -> List[int]:
+        """ Line numbers, in the old revision, of the lines deleted by this diff """
+        return [line for h in self.hunks for line in range(h.old_start, h.old_start + h.old_count)]
+
+    def added_lines(self) -> List[int]:
+        """ Line numbers, in the new revision, of the lines added by this diff """
+        return [line for h in self.hunks for line in range(h.new_start, h.new_start + h.new_count)]
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(old_path="{self.old_path}",new_path="{self.new_path}",hunks={len(self.hunks)})'
+
+
+def _unquote_path(path: str) -> str:
+    """ Undo the C-style quoting git applies to paths containing special characters """
+    if len(path) > 1 and path[0] == '"' and path[-1] == '"':
+        return codecs.escape_decode(path[1:-1].encode('utf-8'))[0].decode('utf-8', 'replace')
+    return path
+
+
+def _strip_prefix(path: str) -> Optional[str]:
+    path = _unquote_path(path)
+    if path == DEV_NULL:
+        return None
+    if path.startswith('a/') or path.startswith('b/'):
+        return path[2:]
+    return path
+
+
+def _paths_from_git_header(header: str):
+    """
+    Best effort split of 'diff --git a/<old> b/<new>'. Only used when the diff carries no '---'/'+++'
+    lines (pure renames, mode changes or binary files), in which case both paths are usually equal.
+    """
+    if header.startswith('"'):
+        end = header.index('"', 1)
+        while header[end - 1] == '\\':
+            end = header.index('"', end + 1)
+        return _strip_prefix(header[:end + 1]), _strip_prefix(header[end + 2:])
+    half = (len(header) - 1) // 2
+    if header[half] == ' ' and header[2:half] == header[half + 3:]:
+        return header[2:half], header[half + 3:]
+    old, _, new = header.partition(' b/')
+    return _strip_prefix(old), new
+
+
+def parse_diff(lines: Iterable[str]) -> Iterator[FileDiff]:
+    """
+    Stream parser for the output of 'git diff' (ideally with -U0). Only the file headers and the hunk headers
+    are interpreted, content lines are skipped while counting them, so the memory used is proportional to the
+    number of hunks of the file being parsed and not to the size of the diff.
+
+    :param Iterable[str] lines: lines of the diff, with or without trailing newline
+    :returns Iterator[FileDiff] one FileDiff per file in the diff, in the order given by git
+    """
+    current = None
+    old_remaining = new_remaining = 0
+
+    for line in lines:
+        line = line.rstrip('\n')
+
+        # content lines of the current hunk
+        if old_remaining > 0 or new_remaining > 0:
+            if line.startswith('-'):
+                old_remaining -= 1
+                continue
+            if line.startswith('+'):
+                new_remaining -= 1
+                continue
+            if line.startswith(' '):
+                old_remaining -= 1
+                new_remaining -= 1
+                continue
+            if line.startswith('\\'):
+                continue
+            # malformed hunk: fall through and treat the line as a header
+            old_remaining = new_remaining = 0
+
+        if line.startswith('diff --git '):
+            if current is not None:
+                yield current
+            old_path, new_path = _paths_from_git_header(line[len('diff --git '):])
+            current = FileDiff(old_path, new_path)
+        elif current is None or line.startswith('\\'):
+            continue
+        elif line.startswith('@@ '):
+            match = HUNK_HEADER_PATTERN.match(line)
+            if not match:
+                logger.warning(f"unable to parse hunk header: {line}")
+                continue
+            old_start, old_count, new_start, new_count = match.groups()
+            hunk = Hunk(int(old_start), 1 if old_count is None else int(old_count),
+                        int(new_start), 1 if new_count is None else int(new_count))
+            current.hunks.append(hunk)
+            old_remaining, new_remaining = hunk.old_count, hunk.new_count
+        elif line.startswith('--- '):
+            current.old_path = _strip_prefix(line[4:].rstrip('\t'))
+        elif line.startswith('+++ '):
+            current.new_path = _strip_prefix(line[4:].rstrip('\t'))
+        elif line.startswith('new file mode'):
+            current.old_path = None
+        elif line.startswith('deleted file mode'):
+            current.new_path = None
+        elif line.startswith('rename from ') or line.startswith('copy from '):
+            current.old_path = _unquote_path(line.split(' ', 2)[2])
+        elif line.startswith('rename to ') or line.startswith('copy to '):
+            current.new_path = _unquote_path(line.split(' ', 2)[2])
+
+    if current is not None:
+        yield current
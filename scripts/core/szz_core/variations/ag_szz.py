@@ -1,11 +1,11 @@
 import logging as log
 import traceback
 from typing import List, Set
-from time import time as ts
 from git import Commit
 from pydriller import Repository
 # from pyszz.common.issue_date import filter_by_date
 from scripts.core.szz_core.abstract_szz import AbstractSZZ, ImpactedFile
+from scripts.core.szz_core.budget import SZZBudget
 
 
 class AGSZZ(AbstractSZZ):
@@ -42,6 +42,9 @@ class AGSZZ(AbstractSZZ):
     def _ag_annotate(self, impacted_files: List['ImpactedFile'], rev_pointer: str = 'HEAD^', **kwargs) -> Set[Commit]:
         blame_data = set()
         for imp_file in impacted_files:
+            if self._budget and self._budget.exhausted():
+                log.error(f"blame budget exhausted for {self.repository_path}, skipping remaining files")
+                break
             try:
                 blame_info = self._blame(
                     rev=rev_pointer,
@@ -67,6 +70,9 @@ class AGSZZ(AbstractSZZ):
         :key ignore_revs_file_path (str): specify ignore revs file for git blame to ignore specific commits.
         :key max_change_size (int): if the number of modified files exceeds the threshold, the commit will be excluded (default 20)
         :key exclude_merge_commits (bool): if true, merge commits will be excluded (default False)
+        :key budget (SZZBudget): time and blame-call budget, the flag budget.truncated tells whether the result is
+            partial (default SZZBudget(time_limit=time_budget))
+        :key time_budget (float): seconds available when no budget is given (default 1 hour)
         :returns Set[Commit] a set of bug introducing commits candidates, represented by Commit object
         """
 
@@ -75,6 +81,7 @@ class AGSZZ(AbstractSZZ):
         self._set_working_tree_to_commit(fix_commit_hash)
 
         max_change_size = kwargs.get('max_change_size', 20)
+        self._budget = kwargs.get('budget') or SZZBudget(time_limit=kwargs.get('time_budget', 60 * 60 * 1))
 
         params = dict()
         params['ignore_revs_file_path'] = kwargs.get('ignore_revs_file_path', None)
@@ -82,12 +89,15 @@ class AGSZZ(AbstractSZZ):
 
         log.info("staring blame")
         to_blame = True
-        start = ts()
-        blame_data = list()
+        blame_data = None
         commits_to_ignore = set()
         while to_blame:
             log.info(f"excluding commits: {params['ignore_revs_list']}")
-            blame_data = self._ag_annotate(impacted_files, **params)
+            new_blame_data = self._ag_annotate(impacted_files, **params)
+            if self._budget.truncated and blame_data is not None:
+                # interrupted pass, keep the result of the previous one
+                break
+            blame_data = new_blame_data
 
             new_commits_to_ignore = set()
             for bd in blame_data:
@@ -97,7 +107,7 @@ class AGSZZ(AbstractSZZ):
 
             if len(new_commits_to_ignore) == 0:
                 to_blame = False
-            elif ts() - start > (60 * 60 * 1):  # 1 hour max time
+            elif self._budget.exhausted():
                 log.error(f"blame timeout for {self.repository_path}")
                 to_blame = False
 
@@ -105,6 +115,7 @@ class AGSZZ(AbstractSZZ):
             params['ignore_revs_list'] = list(commits_to_ignore)
 
         bic = {bd.commit for bd in blame_data if bd.commit.hexsha not in self._exclude_commits_by_change_size(bd.commit.hexsha, max_change_size)}
+        self._budget = None
 
         # if kwargs.get('issue_date_filter', False):
         #     bic = filter_by_date(bic, kwargs['issue_date'])
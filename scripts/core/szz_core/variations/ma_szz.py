@@ -1,11 +1,11 @@
 import logging as log
 from typing import List, Set
-from time import time as ts
 from git import Commit
 from pydriller import Repository, ModificationType
 # from pyszz.common.issue_date import filter_by_date
 from scripts.core.szz_core.variations.ag_szz import AGSZZ
 from scripts.core.szz_core.abstract_szz import ImpactedFile, DetectLineMoved
+from scripts.core.szz_core.budget import SZZBudget
 
 
 class MASZZ(AGSZZ):
@@ -90,6 +90,9 @@ class MASZZ(AGSZZ):
             excluded (default 20)
         :key detect_move_from_other_files (DetectLineMoved): Detect lines moved or copied from other files that were
             modified in the same commit, from parent commits or from any commit (default DetectLineMoved.SAME_COMMIT)
+        :key budget (SZZBudget): time and blame-call budget, the flag budget.truncated tells whether the result is
+            partial (default SZZBudget(time_limit=time_budget))
+        :key time_budget (float): seconds available when no budget is given (default 1 hour)
         :returns Set[Commit] a set of bug introducing commits candidates, represented by Commit object
         """
 
@@ -98,6 +101,7 @@ class MASZZ(AGSZZ):
 
         max_change_size = kwargs.get('max_change_size', MASZZ.DEFAULT_MAX_CHANGE_SIZE)
         filter_revert = kwargs.get('filter_revert_commits', False)
+        budget = kwargs.get('budget') or SZZBudget(time_limit=kwargs.get('time_budget', 60 * 60 * 1))
 
         params = dict()
         params['ignore_revs_file_path'] = kwargs.get('ignore_revs_file_path', None)
@@ -108,18 +112,28 @@ class MASZZ(AGSZZ):
             params['rev_pointer'] = kwargs['blame_rev_pointer']
 
         log.info("staring blame")
-        start = ts()
         blame_data = list()
         commits_to_ignore = set()
         commits_to_ignore_current_file = set()
         bic = set()
         for imp_file in impacted_files:
+            if budget.exhausted():
+                log.error(f"blame budget exhausted for {self.repository_path}, skipping remaining files")
+                break
             commits_to_ignore_current_file = commits_to_ignore.copy()
 
+            file_blame_data = None
             to_blame = True
             while to_blame:
                 log.info(f"excluding commits: {params['ignore_revs_list']}")
+                self._budget = budget
                 blame_data = self._ag_annotate([imp_file], **params)
+                self._budget = None
+                if budget.truncated and file_blame_data is not None:
+                    # interrupted pass, keep the result of the previous one
+                    blame_data = file_blame_data
+                    break
+                file_blame_data = blame_data
 
                 new_commits_to_ignore = set()
                 new_commits_to_ignore_current_file = set()
@@ -132,7 +146,7 @@ class MASZZ(AGSZZ):
 
                 if len(new_commits_to_ignore) == 0 and len(new_commits_to_ignore_current_file) == 0:
                     to_blame = False
-                elif ts() - start > (60 * 60 * 1):  # 1 hour max time
+                elif budget.exhausted():
                     log.error(f"blame timeout for {self.repository_path}")
                     to_blame = False
 
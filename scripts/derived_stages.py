@@ -0,0 +1,49 @@
+import json
+import os
+from logging import getLogger
+from os.path import join
+
+logger = getLogger(__name__)
+
+# state files of the upload and of the derived stages, data/<repo>/<repo>_<name>, describing what the database
+# already holds
+STATE_FILES = ['graph_manifest.json', 'upload_journal.jsonl', 'ancestry.json', 'release_containment.json',
+               'activity_rollups.json', 'co_change.npz']
+OWNERSHIP_STATE_FILE = 'ownership.json'
+
+
+def derived_pending_path(data_dir, url):
+    """
+    Marker of a graph loaded without its derived data (schema, counters, ancestry labels, containment, ownership,
+    rollups, co-change, embeddings), e.g. by neo4j-admin import. The next ingestion runs the derived stages over the
+    complete data even when nothing new was collected.
+
+    :param str data_dir: directory of the data files of the repository, data/<repo>
+    :param str url: name of the repository
+    """
+    return join(data_dir, f"{url}_derived_stages.pending")
+
+
+def mark_derived_pending(data_dir, url):
+    os.makedirs(data_dir, exist_ok=True)
+    open(derived_pending_path(data_dir, url), 'a').close()
+
+
+def reset_derived_state(data_dir, url):
+    """
+    Forget what the stages wrote to the database, after it was replaced (e.g. by a snapshot restore), and mark the
+    derived stages pending so the next ingestion writes everything again. The blame cache of the ownership stage is
+    kept, it does not depend on the database.
+    """
+    for name in STATE_FILES:
+        path = join(data_dir, f"{url}_{name}")
+        if os.path.exists(path):
+            os.remove(path)
+            logger.info(f"Removed the state file {path}")
+    ownership_path = join(data_dir, f"{url}_{OWNERSHIP_STATE_FILE}")
+    if os.path.exists(ownership_path):
+        with open(ownership_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        with open(ownership_path, 'w', encoding='utf-8') as f:
+            json.dump({'blames': state.get('blames', {}), 'ownership': {}}, f)
+    mark_derived_pending(data_dir, url)
@@ -0,0 +1,185 @@
+import hashlib
+import math
+import os
+import re
+import threading
+from logging import getLogger
+
+from scripts.neo4j_client import DEFAULT_BATCH_SIZE
+
+logger = getLogger(__name__)
+
+# text properties embedded for each label, the vectors are stored in the embedding property of the nodes
+EMBEDDED_PROPERTIES = {
+    'Commit': ['message'],
+    'Issue': ['title', 'body'],
+}
+EMBEDDING_PROPERTY = 'embedding'
+# content hash of the embedded text, so unchanged nodes are not embedded again
+EMBEDDING_HASH_PROPERTY = 'embeddingHash'
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# embedders already built, by configuration: a model is loaded once per process, not once per chat request
+_embedders = {}
+_embedders_lock = threading.Lock()
+
+
+class HashingEmbedder:
+    """
+    Deterministic embedder without model nor dependency: words and word pairs are hashed into a fixed number of
+    signed buckets and the vector is L2 normalised. Texts sharing words get close vectors, which is enough to find
+    the issues and commits about a topic, and the same text always gets the same vector.
+    """
+
+    name = 'hashing'
+
+    def __init__(self, dimensions=256):
+        self.dimensions = dimensions
+
+    def _features(self, text):
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        return tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+
+    def embed(self, texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimensions
+            for feature in self._features(text):
+                value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+                vector[value % self.dimensions] += 1.0 if value >> 63 else -1.0
+            norm = math.sqrt(sum(component * component for component in vector))
+            vectors.append([component / norm for component in vector] if norm else None)
+        return vectors
+
+
+class SentenceTransformerEmbedder:
+    """ Embedder running a sentence-transformers model on the CPU, the package is only needed when it is used """
+
+    name = 'sentence-transformers'
+
+    def __init__(self, model_name='all-MiniLM-L6-v2'):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("EMBEDDER=sentence-transformers requires the sentence-transformers package") from e
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts):
+        vectors = self.model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True)
+        return [vector.tolist() if text.strip() else None for text, vector in zip(texts, vectors)]
+
+
+def get_embedder():
+    """
+    Embedder selected by EMBEDDER (hashing or sentence-transformers), None when embeddings are disabled. The
+    embedder is built on the first call and shared by the later calls with the same configuration.
+    """
+    embedder = os.getenv('EMBEDDER', '').lower()
+    if not embedder:
+        return None
+    if embedder == HashingEmbedder.name:
+        key = (embedder, int(os.getenv('EMBEDDING_DIMENSIONS', 256)))
+        factory = lambda: HashingEmbedder(key[1])
+    elif embedder == SentenceTransformerEmbedder.name:
+        key = (embedder, os.getenv('EMBEDDING_MODEL') or 'all-MiniLM-L6-v2')
+        factory = lambda: SentenceTransformerEmbedder(key[1])
+    else:
+        raise ValueError(f"Unsupported embedder: {embedder}")
+    with _embedders_lock:
+        if key not in _embedders:
+            _embedders[key] = factory()
+        return _embedders[key]
+
+
+def embedding_text(label, attributes):
+    # texts are stored wrapped in double quotes by GraphHandler
+    parts = [str(attributes.get(prop) or '').strip('"') for prop in EMBEDDED_PROPERTIES[label]]
+    return '\n'.join(part for part in parts if part)
+
+
+def text_hash(embedder, text):
+    return hashlib.blake2b(f"{embedder.name}:{embedder.dimensions}:{text}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+def strip_embeddings(value):
+    """ Query results without the embedding properties, which are long and meaningless to the LLM """
+    if isinstance(value, dict):
+        return {key: strip_embeddings(item) for key, item in value.items()
+                if key not in (EMBEDDING_PROPERTY, EMBEDDING_HASH_PROPERTY)}
+    if isinstance(value, list):
+        return [strip_embeddings(item) for item in value]
+    return value
+
+
+class EmbeddingIndexer:
+    """
+    Embedding stage of the graph construction: computes the vectors of the commit messages and issue texts and
+    stores them on the nodes, where the vector indexes of the schema pick them up. Nodes whose text did not change
+    since they were embedded are skipped.
+    """
+
+    def __init__(self, neo_client, embedder):
+        self.neo_client = neo_client
+        self.embedder = embedder
+
+    def index_graph(self, graph, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Embed the Commit and Issue nodes of the uploaded graph, then the nodes of the database that have no
+        embedding yet (e.g. after a bulk import).
+        """
+        texts = {label: {} for label in EMBEDDED_PROPERTIES}
+        for node, data in graph.nodes(data=True):
+            label = data.get('type')
+            # nodes only known by their id here, e.g. the parents of new commits, keep their embedding
+            if label in texts and any(prop in data for prop in EMBEDDED_PROPERTIES[label]):
+                texts[label][node] = embedding_text(label, data)
+        for label, node_texts in texts.items():
+            self._index(label, list(node_texts.items()), batch_size)
+            missing = self.missing_texts(label)
+            if missing:
+                logger.info(f"Embedding {len(missing)} {label} nodes without embedding")
+                self._index(label, missing, batch_size)
+
+    def missing_texts(self, label):
+        properties = ', '.join(f"n.`{prop}` AS `{prop}`" for prop in EMBEDDED_PROPERTIES[label])
+        query = f"""
+                MATCH (n:`{label}`)
+                WHERE n.{EMBEDDING_HASH_PROPERTY} IS NULL AND ($repo IS NULL OR n.repo = $repo)
+                RETURN n.id AS id, {properties}
+                """
+        records = self.neo_client.execute_query(query, repo=self.neo_client.repo)
+        return [(record['id'], embedding_text(label, record)) for record in records]
+
+    def _index(self, label, node_texts, batch_size):
+        embedded = 0
+        for start in range(0, len(node_texts), batch_size):
+            batch = node_texts[start:start + batch_size]
+            current = self.current_hashes(label, [node for node, _ in batch])
+            changed = [(node, text, text_hash(self.embedder, text)) for node, text in batch]
+            changed = [entry for entry in changed if current.get(entry[0]) != entry[2]]
+            if not changed:
+                continue
+            vectors = self.embedder.embed([text for _, text, _ in changed])
+            rows = [{'id': node, 'embedding': vector, 'hash': digest}
+                    for (node, _, digest), vector in zip(changed, vectors)]
+            self.neo_client.write_rows(f"""
+                UNWIND $rows AS row
+                MATCH (n:`{label}` {{id: row.id}})
+                WHERE $repo IS NULL OR n.repo = $repo
+                SET n.{EMBEDDING_PROPERTY} = row.embedding, n.{EMBEDDING_HASH_PROPERTY} = row.hash
+                """, rows)
+            embedded += len(rows)
+        if embedded:
+            logger.info(f"{embedded} {label} nodes embedded")
+
+    def current_hashes(self, label, ids):
+        query = f"""
+                UNWIND $ids AS id
+                MATCH (n:`{label}` {{id: id}})
+                WHERE $repo IS NULL OR n.repo = $repo
+                RETURN n.id AS id, n.{EMBEDDING_HASH_PROPERTY} AS hash
+                """
+        records = self.neo_client.execute_query(query, ids=ids, repo=self.neo_client.repo)
+        return {record['id']: record['hash'] for record in records}
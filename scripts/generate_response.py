@@ -6,7 +6,7 @@ logger = getLogger(__name__)
 
 def generate_response(repo_url, user_input, learning_type, session_id, api_key, model, neo4j_uri, neo4j_user, neo4j_password):
     logger.info(f"Generating response for '{user_input}' using '{model}' model")
-    kg_chat = KGChat(api_key, model, neo4j_uri, neo4j_user, neo4j_password)
+    kg_chat = KGChat(api_key, model, neo4j_uri, neo4j_user, neo4j_password, repo_url)
     res = kg_chat.query(user_input, session_id, learning_type)
     data = {
         "query": res['query'],
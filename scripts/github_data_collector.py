@@ -19,6 +19,8 @@ class GitHubDataCollector:
         self.repo_owner = repo_url.split("/")[-2]
         self.repo_name = repo_url.split("/")[-1]
         self.base_dir = f'data/{self.repo_name}'
+        # the first collection of a repository is uploaded from the full data files, it writes no new_ files
+        self.first_collection = False
         self.repo_path = f'repos/{self.repo_name}'
         os.makedirs(self.base_dir, exist_ok=True)
         self.headers = {"Authorization": f"Bearer {token}"}
@@ -184,7 +186,7 @@ class GitHubDataCollector:
 
         try:
             git_log_output = self.run_git_command([
-                'log', '--pretty=format:%H%x09%an%x09%ae%x09%ad%x09%s', '--date=iso'
+                'log', '--pretty=format:%H%x09%P%x09%an%x09%ae%x09%ad%x09%s', '--date=iso'
             ])
 
             if not git_log_output:
@@ -193,9 +195,9 @@ class GitHubDataCollector:
 
             commits = []
             for line in git_log_output.split('\n'):
-                parts = line.strip().split('\t')
-                if len(parts) >= 5:
-                    commit_hash, author_name, author_email, committed_date, message = parts[:5]
+                parts = line.strip().split('\t', 5)
+                if len(parts) >= 6:
+                    commit_hash, parents, author_name, author_email, committed_date, message = parts
 
                     modified_files = self.get_additional_commit_details(commit_hash)
 
@@ -212,6 +214,7 @@ class GitHubDataCollector:
                         "message": message,
                         "branches": branches,
                         "modified_files": modified_files,
+                        "parents": [{"oid": parent} for parent in parents.split()],
                     }
                     commits.append(commit_data)
 
@@ -236,7 +239,7 @@ class GitHubDataCollector:
 
             git_log_output = self.run_git_command([
                 'log', '--since', last_collected_date,
-                '--pretty=format:%H%x09%an%x09%ae%x09%ad%x09%s', '--date=iso'
+                '--pretty=format:%H%x09%P%x09%an%x09%ae%x09%ad%x09%s', '--date=iso'
             ])
 
             if not git_log_output:
@@ -245,9 +248,9 @@ class GitHubDataCollector:
 
             new_commits = []
             for line in git_log_output.split('\n'):
-                parts = line.strip().split('\t')
-                if len(parts) >= 5:
-                    commit_hash, author_name, author_email, committed_date, message = parts[:5]
+                parts = line.strip().split('\t', 5)
+                if len(parts) >= 6:
+                    commit_hash, parents, author_name, author_email, committed_date, message = parts
 
                     if any(commit['hash'] == commit_hash for commit in existing_commits):
                         continue
@@ -267,6 +270,7 @@ class GitHubDataCollector:
                         "message": message,
                         "branches": branches,
                         "modified_files": modified_files,
+                        "parents": [{"oid": parent} for parent in parents.split()],
                     }
                     new_commits.append(commit_data)
 
@@ -297,6 +301,114 @@ class GitHubDataCollector:
             logger.error(f"Error occurred while updating commits: {e}", exc_info=True)
 
 
+    def backfill_parents(self):
+        """ Add the parents of the commits collected before they were recorded, with a single git log pass """
+        file_path = os.path.join(self.base_dir, f'{self.repo_name}_commits.json')
+        if not os.path.exists(file_path):
+            return
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                commits = json.load(f)
+            missing = [commit for commit in commits if 'parents' not in commit]
+            if not missing:
+                return
+            logger.info(f"Backfilling the parents of {len(missing)} commits")
+
+            git_log_output = self.run_git_command(['log', '--all', '--pretty=format:%H%x09%P'])
+            if not git_log_output:
+                return
+            parents = {}
+            for line in git_log_output.split('\n'):
+                commit_hash, _, commit_parents = line.strip().partition('\t')
+                parents[commit_hash] = commit_parents.split()
+
+            for commit in missing:
+                if commit['hash'] in parents:
+                    commit['parents'] = [{"oid": parent} for parent in parents[commit['hash']]]
+
+            temp_file_path = file_path + '.tmp'
+            with open(temp_file_path, 'w', encoding='utf-8') as f:
+                json.dump(commits, f, ensure_ascii=False, indent=4)
+            os.replace(temp_file_path, file_path)
+        except Exception as e:
+            logger.error(f"Error occurred while backfilling commit parents: {e}", exc_info=True)
+
+    def save_with_updates(self, entity, records, key):
+        """
+        Replace the collected records of an entity that is fully recollected on every run, and write the new or
+        changed ones to its new_ file for the graph update. The first collection of the repository writes no new_
+        file, its graph is built from the full data files.
+        """
+        file_path = f'{self.base_dir}/{self.repo_name}_{entity}.json'
+        update_path = f'{self.base_dir}/new_{self.repo_name}_{entity}.json'
+        existing = {}
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                existing = {record[key]: record for record in json.load(f)}
+        updated = [record for record in records if existing.get(record[key]) != record]
+
+        if updated and not self.first_collection:
+            with open(update_path, 'w', encoding='utf-8') as f:
+                json.dump(updated, f, ensure_ascii=False, indent=4)
+        temp_file_path = file_path + '.tmp'
+        with open(temp_file_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=4)
+        os.replace(temp_file_path, file_path)
+        logger.info(f"{len(records)} {entity} collected, {len(updated)} new or changed")
+
+    def collect_tags(self):
+        logger.info("Collecting tags")
+        try:
+            # *objectname is the commit of an annotated tag, objectname the commit of a lightweight one
+            tags_output = self.run_git_command([
+                'for-each-ref', 'refs/tags',
+                '--format=%(refname:short)%09%(objectname)%09%(*objectname)%09%(creatordate:iso-strict)'
+            ])
+            if tags_output is None:
+                return
+
+            tags = []
+            for line in tags_output.splitlines():
+                parts = line.strip().split('\t')
+                if len(parts) == 4:
+                    name, object_name, peeled_object_name, created_date = parts
+                    tags.append({
+                        "name": name,
+                        "commit": peeled_object_name or object_name,
+                        "date": created_date,
+                    })
+            self.save_with_updates('tags', tags, 'name')
+        except Exception as e:
+            logger.error(f"Error occurred while collecting tags: {e}", exc_info=True)
+
+    def collect_releases(self):
+        logger.info("Collecting releases")
+        has_next_page = True
+        after_cursor = None
+
+        try:
+            releases = []
+            while has_next_page:
+                data = self.get_all_instances_of_entity('releases', after_cursor=after_cursor)
+                for release in data['repository']['releases']['nodes']:
+                    releases.append({
+                        'id': release['id'],
+                        'name': release['name'],
+                        'tag_name': release['tagName'],
+                        'tag_commit': release['tagCommit']['oid'] if release['tagCommit'] else None,
+                        'description': release['description'],
+                        'url': release['url'],
+                        'is_latest': release['isLatest'],
+                        'created_at': release['createdAt'],
+                        'published_at': release['publishedAt'],
+                        'author_id': release['author']['id'] if release['author'] else None,
+                    })
+                has_next_page = data['repository']['releases']['pageInfo']['hasNextPage']
+                after_cursor = data['repository']['releases']['pageInfo']['endCursor']
+            self.save_with_updates('releases', releases, 'id')
+        except Exception as e:
+            logger.error(f"Error occurred while collecting releases: {e}", exc_info=True)
+
     def collect_all_issues(self):
         logger.info("Collecting all issues")
         file_path = f'{self.base_dir}/{self.repo_name}_issues.json'
@@ -481,6 +593,7 @@ class GitHubDataCollector:
         logger.info("Collecting COMMIT data")
         commit_path = f'{self.base_dir}/{self.repo_name}_commits.json'
         commits = []
+        self.first_collection = not os.path.exists(commit_path)
         if os.path.exists(commit_path):
             with open(commit_path, 'r', encoding='utf-8') as f:
                 try:
@@ -493,6 +606,7 @@ class GitHubDataCollector:
         else:
             last_collected_date = None
         if last_collected_date:
+            self.backfill_parents()
             self.update_commits(last_collected_date)
         else:
             self.collect_all_commits()
@@ -525,4 +639,10 @@ class GitHubDataCollector:
         else:
             self.collect_all_issues()
 
+        logger.info("Collecting TAG data")
+        self.collect_tags()
+
+        logger.info("Collecting RELEASE data")
+        self.collect_releases()
+
         print("Data collection complete")
@@ -0,0 +1,159 @@
+from logging import getLogger
+
+from scripts.neo4j_client import DEFAULT_BATCH_SIZE
+
+logger = getLogger(__name__)
+
+# counters stored on the nodes, refreshed after every upload for the nodes it touched
+USER_COUNTERS = ['commitCount', 'additions', 'deletions', 'bugsIntroduced', 'bugsFixed']
+FILE_COUNTERS = ['changeCount', 'churn', 'bugCount']
+ISSUE_COUNTERS = ['fixingCommitCount', 'inducingCommitCount', 'impactedFileCount']
+
+USER_COUNTERS_QUERY = """
+                CALL {
+                    WITH u
+                    OPTIONAL MATCH (u)-[:author]->(c:Commit)
+                    OPTIONAL MATCH (c)-[r:changed]->(:File)
+                    RETURN count(DISTINCT c) AS commits, sum(r.additions) AS additions, sum(r.deletions) AS deletions
+                }
+                CALL {
+                    WITH u
+                    OPTIONAL MATCH (u)-[:author]->(:Commit)-[:introduced]->(i:Issue)
+                    RETURN count(DISTINCT i) AS introduced
+                }
+                CALL {
+                    WITH u
+                    OPTIONAL MATCH (u)-[:author]->(:Commit)-[:fixed]->(i:Issue)
+                    RETURN count(DISTINCT i) AS fixed
+                }
+                SET u.commitCount = commits, u.additions = additions, u.deletions = deletions,
+                    u.bugsIntroduced = introduced, u.bugsFixed = fixed
+                """
+
+FILE_COUNTERS_QUERY = """
+                UNWIND $rows AS id
+                MATCH (f:File {id: id})
+                WHERE $repo IS NULL OR f.repo = $repo
+                CALL {
+                    WITH f
+                    OPTIONAL MATCH (:Commit)-[r:changed]->(f)
+                    RETURN count(r) AS changes, sum(r.additions + r.deletions) AS churn
+                }
+                CALL {
+                    WITH f
+                    OPTIONAL MATCH (i:Issue)-[:impacted]->(f)
+                    RETURN count(DISTINCT i) AS bugs
+                }
+                SET f.changeCount = changes, f.churn = churn, f.bugCount = bugs
+                """
+
+ISSUE_COUNTERS_QUERY = """
+                UNWIND $rows AS id
+                MATCH (i:Issue {id: id})
+                WHERE $repo IS NULL OR i.repo = $repo
+                CALL {
+                    WITH i
+                    OPTIONAL MATCH (c:Commit)-[:fixed]->(i)
+                    RETURN count(DISTINCT c) AS fixing
+                }
+                CALL {
+                    WITH i
+                    OPTIONAL MATCH (c:Commit)-[:introduced]->(i)
+                    RETURN count(DISTINCT c) AS inducing
+                }
+                CALL {
+                    WITH i
+                    OPTIONAL MATCH (i)-[:impacted]->(f:File)
+                    RETURN count(DISTINCT f) AS files
+                }
+                SET i.fixingCommitCount = fixing, i.inducingCommitCount = inducing, i.impactedFileCount = files
+                """
+
+
+def touched_nodes(edges):
+    """
+    Nodes whose counters depend on the given relationships, e.g. the author of a commit whose changed relationships
+    were written. Users are only known through their commits for most relationships, they are resolved in Neo4j.
+
+    :param edges: (source, target, relation) of the written or deleted relationships
+    :returns dict 'users', 'commits', 'files' and 'issues' -> set of ids
+    """
+    touched = {'users': set(), 'commits': set(), 'files': set(), 'issues': set()}
+    for source, target, relation in edges:
+        if relation == 'author':
+            touched['users'].add(source)
+        elif relation == 'changed':
+            touched['commits'].add(source)
+            touched['files'].add(target)
+        elif relation in ('introduced', 'fixed'):
+            touched['commits'].add(source)
+            touched['issues'].add(target)
+        elif relation == 'impacted':
+            touched['issues'].add(source)
+            touched['files'].add(target)
+    return touched
+
+
+class AggregateCounters:
+    """
+    Denormalised counters on the User, File and Issue nodes, so that questions like "who made the most commits" are
+    answered by reading a property instead of aggregating over every relationship. They are recomputed from the
+    relationships of the nodes touched by an upload, which keeps them exact after deletions and re-uploads.
+    """
+
+    def __init__(self, neo_client):
+        self.neo_client = neo_client
+
+    def refresh(self, edges, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Recompute the counters of the nodes touched by the given relationships, then of the nodes that never had
+        them (e.g. after a bulk import or on a database created by an earlier version).
+
+        :param edges: (source, target, relation) of the relationships written or deleted by the upload
+        """
+        touched = touched_nodes(edges)
+        logger.info(f"Refreshing the counters of {len(touched['users'])} users, {len(touched['commits'])} commit "
+                    f"authors, {len(touched['files'])} files and {len(touched['issues'])} issues")
+        self._refresh(self.user_query('User'), touched['users'], batch_size)
+        self._refresh(self.user_query('Commit'), touched['commits'], batch_size)
+        self._refresh(FILE_COUNTERS_QUERY, touched['files'], batch_size)
+        self._refresh(ISSUE_COUNTERS_QUERY, touched['issues'], batch_size)
+
+        for label, counter, query in [('User', USER_COUNTERS[0], self.user_query('User')),
+                                      ('File', FILE_COUNTERS[0], FILE_COUNTERS_QUERY),
+                                      ('Issue', ISSUE_COUNTERS[0], ISSUE_COUNTERS_QUERY)]:
+            missing = self.missing(label, counter)
+            if missing:
+                logger.info(f"Computing the counters of {len(missing)} {label} nodes without them")
+                self._refresh(query, missing, batch_size)
+
+    @staticmethod
+    def user_query(label):
+        """ Counters query of the users given by their id, or by the id of one of their commits """
+        if label == 'User':
+            match = """
+                UNWIND $rows AS id
+                MATCH (u:User {id: id})
+                WHERE $repo IS NULL OR u.repo = $repo
+                """
+        else:
+            match = """
+                UNWIND $rows AS id
+                MATCH (u:User)-[:author]->(c:Commit {id: id})
+                WHERE $repo IS NULL OR c.repo = $repo
+                WITH DISTINCT u
+                """
+        return match + USER_COUNTERS_QUERY
+
+    def missing(self, label, counter):
+        query = f"""
+                MATCH (n:`{label}`)
+                WHERE n.{counter} IS NULL AND ($repo IS NULL OR n.repo = $repo)
+                RETURN n.id AS id
+                """
+        return [record['id'] for record in self.neo_client.execute_query(query, repo=self.neo_client.repo)]
+
+    def _refresh(self, query, ids, batch_size):
+        ids = list(ids)
+        for start in range(0, len(ids), batch_size):
+            self.neo_client.write_rows(query, ids[start:start + batch_size])
@@ -1,5 +1,6 @@
 import networkx as nx
 import json
+from datetime import datetime
 from logging import getLogger
 
 logger = getLogger(__name__)
@@ -20,6 +21,44 @@ class DataHandler:
             json.dump(data, file, indent=4)
 
 
+def _parse_date(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _native_date(value):
+    """ ISO date string as a timezone aware datetime, stored as a native Neo4j DateTime """
+    if not value:
+        return None
+    try:
+        return _parse_date(value)
+    except ValueError:
+        logger.warning(f"Unable to parse the date '{value}', no datetime property is stored for it")
+        return None
+
+
+def commit_author(author_name, author_email, collaborator_dict, collaborator_login_dict):
+    """
+    Id of the User node of a commit author and the collaborator it is, if any: authors are matched to the
+    collaborators by name or login, the other ones are identified by their name and email.
+    """
+    if author_name in collaborator_dict or author_name in collaborator_login_dict:
+        collaborator = collaborator_dict.get(author_name) or collaborator_login_dict.get(author_name)
+        return collaborator['id'], collaborator
+    return f"{author_name}<{author_email if author_email is not None else ''}>", None
+
+
+def tag_node_id(name):
+    # tag names can be branch names too, the ref keeps the ids apart
+    return f"refs/tags/{name}"
+
+
+def node_label(graph, node):
+    """ Label of a node of a networkx graph or of a ColumnarGraph, which reads it without building the node's row """
+    if hasattr(graph, 'node_label'):
+        return graph.node_label(node)
+    return graph.nodes[node].get('type', 'Node')
+
+
 def remove_single_quotes(text):
     result = text.replace("'", "")
     result = '"' + result + '"'
@@ -27,8 +66,44 @@ def remove_single_quotes(text):
 
 
 class GraphHandler:
-    def __init__(self):
+    def __init__(self, patch_store=None):
+        """
+        :param PatchStore patch_store: store receiving the patch texts of the changed relationships, which then only
+            carry the patchDigest and patchSize of their patch. Without a store the text is kept as patch
+        """
         self.G = nx.MultiDiGraph()
+        self.patch_store = patch_store
+
+    def add_edge(self, source, target, relation, **attributes):
+        """ Add or update the relationship of the given type between two nodes, as MERGE does in Neo4j """
+        self.G.add_edge(source, target, key=relation, relation=relation, **attributes)
+
+    def add_aggregated_edge(self, source, target, relation, seen=None):
+        """
+        Add an occurrence of a relationship repeated between the same nodes (e.g. one contributes_to per commit),
+        collapsed into a single edge with the count of occurrences and the dates they were first and last seen.
+        """
+        if not self.G.has_edge(source, target, key=relation):
+            self.add_edge(source, target, relation, count=1, firstSeen=seen, lastSeen=seen)
+            return
+        data = self.G.edges[source, target, relation]
+        first_seen, last_seen = data['firstSeen'], data['lastSeen']
+        if seen is not None:
+            if first_seen is None or _parse_date(seen) < _parse_date(first_seen):
+                first_seen = seen
+            if last_seen is None or _parse_date(seen) > _parse_date(last_seen):
+                last_seen = seen
+        self.add_edge(source, target, relation, count=data['count'] + 1, firstSeen=first_seen, lastSeen=last_seen)
+
+    def set_edge_labels(self):
+        for u, v, k in self.G.edges(keys=True):
+            self.G[u][v][k]['label'] = k
+
+    def patch_properties(self, patch):
+        if self.patch_store is None:
+            return {'patch': patch}
+        # patch set to None clears the text uploaded inline by earlier versions
+        return {'patch': None, 'patchDigest': self.patch_store.put(patch), 'patchSize': len(patch or '')}
 
     def add_collaborator_nodes_and_edges(self, collaborators):
         logger.info('Adding collaborator nodes and edges')
@@ -83,11 +158,11 @@ class GraphHandler:
                         })
 
             if owner_id is not None:
-                self.G.add_edge(owner_id, repository['id'], relation='owns')
+                self.add_edge(owner_id, repository['id'], 'owns')
 
             for branch in repository['branches']['nodes']:
                 self.G.add_node(branch['name'], type='Branch', name=branch['name'])
-                self.G.add_edge(branch['name'], repository['id'], relation='branch_of')
+                self.add_edge(branch['name'], repository['id'], 'branch_of')
         return collaborators
 
     def add_commit_nodes_and_edges(self, commits, collaborators, repository_id):
@@ -102,9 +177,9 @@ class GraphHandler:
             author_name = commit['author_name']
             author_email = commit['author_email'] if commit['author_email'] is not None else ''
             # author_key = (author_name, author_email)
-            if author_name in collaborator_dict or author_name in collaborator_login_dict:
-                collaborator = collaborator_dict.get(author_name) or collaborator_login_dict.get(author_name)
-                author_id = collaborator['id']
+            author_id, collaborator = commit_author(author_name, author_email, collaborator_dict,
+                                                    collaborator_login_dict)
+            if collaborator is not None:
                 if not self.G.has_node(author_id):
                     self.G.add_node(
                         author_id,
@@ -115,33 +190,36 @@ class GraphHandler:
                         id=author_id
                     )
             else:
-                author_id = f"{author_name}<{author_email}>"
                 if not self.G.has_node(author_id):
                     self.G.add_node(author_id, type='User', name=author_name, email=author_email, id=author_id)
-            self.G.add_node(commit_hash, type='Commit', hash=commit_hash, message=message, committedDate=committed_date)
-            self.G.add_edge(author_id, commit_hash, relation='author')
-            self.G.add_edge(author_id, repository_id, relation='contributes_to')
+            self.G.add_node(commit_hash, type='Commit', hash=commit_hash, message=message, committedDate=committed_date,
+                            committedDateTime=_native_date(committed_date))
+            self.add_edge(author_id, commit_hash, 'author')
+            self.add_aggregated_edge(author_id, repository_id, 'contributes_to', seen=committed_date)
             branches = commit['branches']
             for branch in branches:
                 self.G.add_node(branch, type='Branch', name=branch)
-                self.G.add_edge(commit_hash, branch, relation="committed_to")
+                self.add_edge(commit_hash, branch, 'committed_to')
             for file in commit.get('modified_files', []):
                 file['path'] = file['path']
                 file['filename'] = file['filename']
                 file_id = file['filename']
                 self.G.add_node(file_id, type='File', path=file['path'], name=file['filename'])
-                self.G.add_edge(
+                self.add_edge(
                     commit_hash,
                     file_id,
-                    relation='changed',
+                    'changed',
                     changeType=file['change_type'],
                     additions=file['additions'],
                     deletions=file['deletions'],
-                    patch=file['diff']
+                    **self.patch_properties(file['diff'])
                 )
             for parent in commit.get('parents', []):
                 parent_id = parent['oid']
-                self.G.add_edge(parent_id, commit_hash, relation='parent_of')
+                if not self.G.has_node(parent_id):
+                    # a parent collected earlier, or later in the list, which completes its properties
+                    self.G.add_node(parent_id, type='Commit', hash=parent_id)
+                self.add_edge(parent_id, commit_hash, 'parent_of')
 
     def add_issue_nodes_and_edges(self, issues, collaborators):
         logger.info('Adding issue nodes and edges')
@@ -166,7 +244,9 @@ class GraphHandler:
                 body=body,
                 state=state,
                 createdAt=created_at,
-                closedAt=closed_at
+                closedAt=closed_at,
+                createdDateTime=_native_date(created_at),
+                closedDateTime=_native_date(closed_at)
             )
             repository_id = issue['repository_id']
             author_id = issue['author_id']
@@ -205,7 +285,7 @@ class GraphHandler:
                                 'permission': 'author'
                             })
 
-                self.G.add_edge(author_id, issue_id, relation='creates')
+                self.add_edge(author_id, issue_id, 'creates')
                 # self.G.add_edge(author_id, repository_id, relation='contributes_to')
             for assignee in assignees:
                 assignee_id = assignee['id']
@@ -244,7 +324,7 @@ class GraphHandler:
                                     'permission': 'assignee'
                                 })
 
-                    self.G.add_edge(assignee_id, issue_id, relation='assigned')
+                    self.add_edge(assignee_id, issue_id, 'assigned')
                     # self.G.add_edge(assignee_id, repository_id, relation='contributes_to')
             for participant in participants:
                 participant_id = participant['id']
@@ -283,7 +363,7 @@ class GraphHandler:
                                     'permission': 'participant'
                                 })
 
-                    self.G.add_edge(participant_id, issue_id, relation='participates_in')
+                    self.add_edge(participant_id, issue_id, 'participates_in')
                     # self.G.add_edge(participant_id, repository_id, relation='contributes_to')
         return collaborators
 
@@ -297,22 +377,53 @@ class GraphHandler:
 
             for fixing_commit in fixing_commits:
                 if self.G.has_node(fixing_commit):
-                    self.G.add_edge(fixing_commit, number, relation='fixed')
+                    self.add_edge(fixing_commit, number, 'fixed')
 
             for inducing_commit in inducing_commits:
                 if self.G.has_node(inducing_commit):
-                    self.G.add_edge(inducing_commit, number, relation='introduced')
+                    self.add_edge(inducing_commit, number, 'introduced')
 
+            fix_dates = [self.G.nodes[c]['committedDate'] for c in fixing_commits
+                         if self.G.has_node(c) and self.G.nodes[c].get('committedDate')]
             for impacted_file in impacted_files:
                 if self.G.has_node(impacted_file):
-                    self.G.add_edge(number, impacted_file, relation='impacted')
+                    self.add_aggregated_edge(number, impacted_file, 'impacted',
+                                             seen=max(fix_dates, key=_parse_date) if fix_dates else None)
+
+    def add_tag_and_release_nodes_and_edges(self, tags, releases):
+        logger.info('Adding tag and release nodes and edges')
+        for tag in tags:
+            tag_id = tag_node_id(tag['name'])
+            self.G.add_node(tag_id, type='Tag', name=tag['name'], date=tag['date'], dateTime=_native_date(tag['date']))
+            if not self.G.has_node(tag['commit']):
+                self.G.add_node(tag['commit'], type='Commit', hash=tag['commit'])
+            self.add_edge(tag_id, tag['commit'], 'points_to')
+        for release in releases:
+            self.G.add_node(
+                release['id'],
+                type='Release',
+                name=release['name'],
+                tagName=release['tag_name'],
+                description=release['description'],
+                url=release['url'],
+                isLatest=release['is_latest'],
+                createdAt=release['created_at'],
+                publishedAt=release['published_at'],
+                publishedDateTime=_native_date(release['published_at'])
+            )
+            if release['tag_name']:
+                tag_id = tag_node_id(release['tag_name'])
+                if not self.G.has_node(tag_id):
+                    self.G.add_node(tag_id, type='Tag', name=release['tag_name'])
+                self.add_edge(release['id'], tag_id, 'release_of')
 
-    def add_nodes_and_edges(self, repositories, collaborators, commits, issues):
+    def add_nodes_and_edges(self, repositories, collaborators, commits, issues, tags=None, releases=None):
         logger.info('Adding all nodes and edges')
         repository_id = repositories[0]['id']
         self.add_collaborator_nodes_and_edges(collaborators)
         collaborators = self.add_repository_nodes(repositories, collaborators)
         collaborators = self.add_issue_nodes_and_edges(issues, collaborators)
         self.add_commit_nodes_and_edges(commits, collaborators, repository_id)
+        self.add_tag_and_release_nodes_and_edges(tags or [], releases or [])
         logger.info('All nodes and edges added')
         return collaborators
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+from logging import getLogger
+
+from scripts.graph_handler import node_label
+from scripts.neo4j_client import DEFAULT_BATCH_SIZE
+
+logger = getLogger(__name__)
+
+
+def content_hash(attributes):
+    return hashlib.blake2b(json.dumps(attributes, sort_keys=True, default=str).encode('utf-8'),
+                           digest_size=16).hexdigest()
+
+
+def graph_snapshot(graph):
+    """
+    Rows and content hash of every node and relationship of a networkx graph, keyed the way they are stored in
+    Neo4j: nodes by (label, id), relationships by (start label, source, type, end label, target). Parallel edges
+    are merged in order, as MERGE and SET += do on upload.
+
+    :returns tuple (nodes, edges) of dicts key -> (hash, labels, row)
+    """
+    nodes = {}
+    for node, data in graph.nodes(data=True):
+        label = data.get('type', 'Node')
+        nodes[json.dumps([label, node])] = (content_hash(data), (label,), {'id': node, 'attributes': data})
+
+    merged = {}
+    for source, target, data in graph.edges(data=True):
+        labels = (node_label(graph, source), data['relation'], node_label(graph, target))
+        key = json.dumps([labels[0], source, labels[1], labels[2], target])
+        _, row = merged.setdefault(key, (labels, {'source': source, 'target': target, 'attributes': {}}))
+        row['attributes'].update(data)
+    edges = {key: (content_hash(row['attributes']), labels, row) for key, (labels, row) in merged.items()}
+    return nodes, edges
+
+
+def _grouped(entries, batch_size):
+    """ (labels, rows) batches of at most batch_size rows sharing the same labels """
+    groups = {}
+    for labels, row in entries:
+        groups.setdefault(labels, []).append(row)
+    for labels, rows in groups.items():
+        for start in range(0, len(rows), batch_size):
+            yield labels, rows[start:start + batch_size]
+
+
+class GraphSync:
+    """
+    Delta upload of a graph built from the complete collected data. A manifest next to the data files keeps the
+    content hash of every node and relationship of the last successful upload, so an update only writes what was
+    added or changed since, and deletes what disappeared.
+    """
+
+    def __init__(self, neo_client, manifest_path):
+        self.neo_client = neo_client
+        self.manifest_path = manifest_path
+        # (source, target, relation) of the relationships written or deleted by the last sync
+        self.changed_edges = []
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_manifest(self, nodes, edges):
+        manifest = {
+            'nodes': {key: [entry[0], *entry[1]] for key, entry in nodes.items()},
+            'edges': {key: [entry[0], *entry[1]] for key, entry in edges.items()},
+        }
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    def sync(self, graph, batch_size=DEFAULT_BATCH_SIZE, concurrency=1):
+        """
+        Upload the difference between the graph and the manifest, or the whole graph when there is no manifest yet.
+        The manifest is only written once the upload succeeded.
+
+        :returns dict number of 'upserted' and 'deleted' nodes and edges
+        """
+        nodes, edges = graph_snapshot(graph)
+        manifest = self.load_manifest()
+        if manifest is None:
+            logger.info("No graph manifest found, uploading the whole graph")
+            self.neo_client.upload_graph(graph, batch_size, concurrency)
+            self.save_manifest(nodes, edges)
+            self.changed_edges = [(row['source'], row['target'], labels[1]) for _, labels, row in edges.values()]
+            return {'upserted_nodes': len(nodes), 'upserted_edges': len(edges), 'deleted_nodes': 0, 'deleted_edges': 0}
+
+        changed_nodes = [(labels, row) for key, (digest, labels, row) in nodes.items()
+                         if manifest['nodes'].get(key, [None])[0] != digest]
+        changed_edges = [(labels, row) for key, (digest, labels, row) in edges.items()
+                         if manifest['edges'].get(key, [None])[0] != digest]
+        removed_edges = [(tuple(entry[1:]), {'source': json.loads(key)[1], 'target': json.loads(key)[4]})
+                         for key, entry in manifest['edges'].items() if key not in edges]
+        removed_nodes = [(tuple(entry[1:]), json.loads(key)[1])
+                         for key, entry in manifest['nodes'].items() if key not in nodes]
+        logger.info(f"Delta sync: {len(changed_nodes)} nodes and {len(changed_edges)} edges to upload, "
+                    f"{len(removed_nodes)} nodes and {len(removed_edges)} edges to delete")
+
+        for (label,), rows in _grouped(changed_nodes, batch_size):
+            self.neo_client.upload_nodes(label, rows)
+        for (start_label, relation, end_label), rows in _grouped(changed_edges, batch_size):
+            self.neo_client.upload_edges(start_label, relation, end_label, rows)
+        for (start_label, relation, end_label), rows in _grouped(removed_edges, batch_size):
+            self.neo_client.delete_edges(start_label, relation, end_label, rows)
+        for (label,), ids in _grouped(removed_nodes, batch_size):
+            self.neo_client.delete_nodes(label, ids)
+
+        self.save_manifest(nodes, edges)
+        self.changed_edges = [(row['source'], row['target'], labels[1]) for labels, row in changed_edges + removed_edges]
+        return {'upserted_nodes': len(changed_nodes), 'upserted_edges': len(changed_edges),
+                'deleted_nodes': len(removed_nodes), 'deleted_edges': len(removed_edges)}
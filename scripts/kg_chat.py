@@ -8,16 +8,21 @@ from dotenv import load_dotenv
 from os import getenv
 from langsmith import traceable
 from consts import (FEW_SHOT_CYPHER_TEMPLATE, GENERATION_TEMPLATE,
-                    ZERO_SHOT_CYPHER_TEMPLATE_LLAMA, FEW_SHOT_CYPHER_TEMPLATE_LLAMA, GENERATION_TEMPLATE_LLAMA)
+                    ZERO_SHOT_CYPHER_TEMPLATE_LLAMA, FEW_SHOT_CYPHER_TEMPLATE_LLAMA, GENERATION_TEMPLATE_LLAMA,
+                    SCHEMA_NOTES)
 from scripts.core.graph_cypher_chain_patch import PatchedGraphCypherQAChain
+from scripts.patch_store import PatchStore
+from scripts.embeddings import get_embedder
+from scripts.tenancy import multi_tenant, tenant_label, TENANT_LABEL_PREFIX
 from logging import getLogger
 
 logger = getLogger(__name__)
 
 
 class KGChat:
-    def __init__(self, api_key, model, neo4j_uri, neo4j_user, neo4j_password):
+    def __init__(self, api_key, model, neo4j_uri, neo4j_user, neo4j_password, repo_url=None):
         logger.info("Creating KGChat Instance")
+        self.repo_url = repo_url
         self.uri = neo4j_uri 
         self.user = neo4j_user 
         self.password = neo4j_password
@@ -64,11 +69,33 @@ class KGChat:
             verbose=True,
             validate_cypher=False,
             graph=self.graph,
-            allow_dangerous_requests=True
+            allow_dangerous_requests=True,
+            schema_notes=SCHEMA_NOTES,
+            patch_store=self.get_patch_store(),
+            tenant_label=self.get_tenant_label(),
+            exclude_types=self.get_tenant_labels(),
+            embedder=get_embedder(),
+            retrieval_k=int(getenv('RETRIEVAL_TOP_K', 10)),
+            retrieval_overfetch=int(getenv('RETRIEVAL_OVERFETCH', 10))
         )
         logger.info(f"Created LLM chain, model: {self.model}, learning type: {learning_type}")
         return self.chain
 
+    def get_patch_store(self):
+        if self.repo_url is None:
+            return None
+        return PatchStore(f"data/{self.repo_url.split('/')[-1]}/patches")
+
+    def get_tenant_label(self):
+        if not multi_tenant() or self.repo_url is None:
+            return None
+        return tenant_label(self.repo_url)
+
+    def get_tenant_labels(self):
+        """ Tenant labels of the repositories in the database, kept out of the schema given to the LLM """
+        node_labels = self.graph.get_structured_schema.get('node_props', {})
+        return [label for label in node_labels if label.startswith(TENANT_LABEL_PREFIX)]
+
     def get_chain_with_message_history(self, learning_type):
         chain = self.make_chain(learning_type)
         chain_with_history = RunnableWithMessageHistory(
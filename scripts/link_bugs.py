@@ -1,12 +1,29 @@
 import pandas as pd
 import json
 import logging
+import time
 from scripts.core import RSZZ
+from scripts.core.szz_core import SZZBudget
+from scripts.szz_queue import SZZTaskQueue
 import os
+from git.exc import GitCommandError
+
+
+DEFAULT_FIX_TIME_BUDGET = 60 * 60
+DEFAULT_GLOBAL_TIME_BUDGET = 24 * 60 * 60
+
+
+def _budget_from_env(name, default):
+    """ number of seconds or of blame calls configured in the environment, None when set to an empty value """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return int(value) if value.strip() else None
 
 
 class LinkBugs():
-    def __init__(self, repo_url):
+    def __init__(self, repo_url, redis_url=None, distributed_timeout=24 * 60 * 60,
+                 fix_time_budget=None, max_blame_calls=None, global_time_budget=None):
         self.repo_url = repo_url
         self.repo_name = repo_url.split("/")[-1]
         self.repo_owner = repo_url.split("/")[-2]
@@ -15,6 +32,14 @@ class LinkBugs():
         self.updated_issue_json = f"data/{self.repo_name}/new_{self.repo_name}_issues.json"
         self.output = f"data/{self.repo_name}/{self.repo_name}_fixing_bic.json"
         self.updated_output = f"data/new_{self.repo_name}/{self.repo_name}_fixing_bic.json"
+        self.redis_url = redis_url or os.getenv('SZZ_REDIS_URL')
+        self.distributed_timeout = distributed_timeout
+        self.fix_time_budget = fix_time_budget if fix_time_budget is not None \
+            else _budget_from_env('SZZ_FIX_TIME_BUDGET', DEFAULT_FIX_TIME_BUDGET)
+        self.max_blame_calls = max_blame_calls if max_blame_calls is not None \
+            else _budget_from_env('SZZ_MAX_BLAME_CALLS', None)
+        self.global_time_budget = global_time_budget if global_time_budget is not None \
+            else _budget_from_env('SZZ_GLOBAL_TIME_BUDGET', DEFAULT_GLOBAL_TIME_BUDGET)
 
 
         logging.basicConfig(filename=f'{self.repo_owner}_{self.repo_name}_console.log', filemode='w',
@@ -39,13 +64,95 @@ class LinkBugs():
         return results
 
     def process_issues_df(self, issues_df):
+        """
+        Run SZZ on the fixing commits of every issue, scheduling the cheapest fixing commits (fewest impacted
+        lines) first. Each fixing commit gets its own time and blame-call budget, and the whole run stops at
+        the global deadline; issues whose SZZ run was cut short are flagged with "Truncated".
+        """
+        if self.redis_url:
+            return self.process_issues_distributed(issues_df)
+        self.r_szz_instance = RSZZ(repo_full_name=self.repo_name, repo_url=self.repo_url, repos_dir="repos")
+        deadline = time.time() + self.global_time_budget if self.global_time_budget is not None else None
+
+        results = []
+        jobs = []
+        for row in issues_df.itertuples():
+            bug_id = str(row.number)
+            logging.info(f"Collecting fixing commits of bug {bug_id}")
+            result = self.create_result_structure(row, bug_id)
+            for fixing_commit in self.r_szz_instance.find_bug_fix_commit(bug_id):
+                result["FixingCommit"].append(fixing_commit)
+                try:
+                    impacted_files = self.r_szz_instance.get_impacted_files(fixing_commit)
+                except GitCommandError as e:
+                    logging.error(f"Unable to read the impacted files of fixing commit {fixing_commit} of bug {bug_id}, "
+                                  f"skipping it: {e}")
+                    result["Truncated"] = True
+                    continue
+                cost = sum(len(impacted_file.modified_lines) for impacted_file in impacted_files)
+                jobs.append((cost, result, fixing_commit, impacted_files))
+            results.append(result)
+
+        jobs.sort(key=lambda job: job[0])
+        for cost, result, fixing_commit, impacted_files in jobs:
+            if deadline is not None and time.time() > deadline:
+                logging.error(f"SZZ deadline reached, skipping fixing commit {fixing_commit} of bug {result['Number']}")
+                result["Truncated"] = True
+                self.add_impacted_files_and_bics(result, impacted_files, set())
+                continue
+
+            logging.info(f"Processing fixing commit {fixing_commit} of bug {result['Number']} ({cost} impacted lines)")
+            budget = SZZBudget(time_limit=self.fix_time_budget, max_blame_calls=self.max_blame_calls, deadline=deadline)
+            bic = self.r_szz_instance.find_bic(fixing_commit, impacted_files, budget=budget)
+            if budget.truncated:
+                logging.warning(f"SZZ budget exhausted for fixing commit {fixing_commit}, results are partial")
+                result["Truncated"] = True
+            self.add_impacted_files_and_bics(result, impacted_files, bic)
+        return results
+
+    def process_issues_distributed(self, issues_df, poll_interval=10):
+        """
+        Publish one task per (issue, fixing commit) on the Redis queue and wait for the SZZ workers
+        (scripts/szz_worker.py) to process them. Fixing commits are still looked up locally. The tasks carry the
+        per-fix budgets and the global deadline; issues whose tasks were cut short, failed or did not complete in
+        time are flagged with "Truncated".
+        """
+        queue = SZZTaskQueue(self.redis_url)
+        r_szz_instance = RSZZ(repo_full_name=self.repo_name, repo_url=self.repo_url, repos_dir="repos")
+        budget = {'time_limit': self.fix_time_budget, 'max_blame_calls': self.max_blame_calls,
+                  'deadline': time.time() + self.global_time_budget if self.global_time_budget is not None else None}
         results = []
+        task_ids = {}
         for row in issues_df.itertuples():
             bug_id = str(row.number)
-            logging.info(f"Processing bug {bug_id}")
             result = self.create_result_structure(row, bug_id)
-            self.process_fixing_commits(result, bug_id)
+            for fixing_commit in r_szz_instance.find_bug_fix_commit(bug_id):
+                result["FixingCommit"].append(fixing_commit)
+                task_ids[queue.publish(self.repo_url, bug_id, fixing_commit, budget)] = result
             results.append(result)
+        logging.info(f"Published {len(task_ids)} SZZ tasks to the distributed queue")
+
+        deadline = time.time() + self.distributed_timeout
+        pending = set(task_ids)
+        while pending and time.time() < deadline:
+            done, dead = queue.results(pending)
+            for task_id, task_result in done.items():
+                result = task_ids[task_id]
+                result["ImpactedFiles"].extend(task_result["ImpactedFiles"])
+                result["InducingCommit"].extend(task_result["InducingCommit"])
+                if task_result.get("Truncated"):
+                    result["Truncated"] = True
+            for task_id, error in dead.items():
+                logging.error(f"SZZ task {task_id} failed: {error}")
+                task_ids[task_id]["Truncated"] = True
+            pending -= set(done) | set(dead)
+            if pending:
+                time.sleep(poll_interval)
+
+        if pending:
+            logging.error(f"{len(pending)} SZZ tasks not completed within {self.distributed_timeout} seconds")
+            for task_id in pending:
+                task_ids[task_id]["Truncated"] = True
         return results
 
     def create_result_structure(self, row, bug_id):
@@ -55,21 +162,12 @@ class LinkBugs():
             "Number": bug_id,
             "FixingCommit": [],
             "InducingCommit": [],
-            "ImpactedFiles": []
+            "ImpactedFiles": [],
+            "Truncated": False
         }
 
-    def process_fixing_commits(self, result, bug_id):
-        self.r_szz_instance = RSZZ(repo_full_name=self.repo_name, repo_url=self.repo_url, repos_dir="repos")
-        fixing_commits = self.r_szz_instance.find_bug_fix_commit(bug_id)
-        if fixing_commits:
-            for fixing_commit in fixing_commits:
-                logging.info(f"Processing fixing commit {fixing_commit}")
-                result["FixingCommit"].append(fixing_commit)
-                impacted_files = self.r_szz_instance.get_impacted_files(fixing_commit)
-                bic = self.r_szz_instance.find_bic(fixing_commit, impacted_files)
-                self.add_impacted_files_and_bics(result, impacted_files, bic)
-
-    def add_impacted_files_and_bics(self, result, impacted_files, bic):
+    @staticmethod
+    def add_impacted_files_and_bics(result, impacted_files, bic):
         for impacted_file in impacted_files:
             filename = impacted_file.file_path.split("/")[-1]
             result["ImpactedFiles"].append(filename)
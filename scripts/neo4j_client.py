@@ -1,42 +1,283 @@
+import random
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from neo4j import GraphDatabase
+from neo4j.exceptions import TransientError, ServiceUnavailable, SessionExpired
 from logging import getLogger
 
+from scripts.graph_handler import node_label
+from scripts.tenancy import tenant_label
+from scripts.upload_journal import batch_id
+
 logger = getLogger(__name__)
 
+DEFAULT_BATCH_SIZE = 1000
+
+# errors after which the same transaction can succeed when sent again
+RETRYABLE_ERRORS = (TransientError, ServiceUnavailable, SessionExpired)
+
+
+def _node_pattern(variable, label, key, tenant=None):
+    """
+    :param str tenant: tenant label of the repository in a database shared by several repositories, nodes are then
+        identified by their repo and id
+    """
+    # nodes only known from an edge (e.g. parent commits outside the collected range) have no type, match them by id
+    if tenant is not None:
+        if label == 'Node':
+            return f"({variable}:`{tenant}` {{id: row.{key}}})"
+        return f"({variable}:`{label}` {{repo: $repo, id: row.{key}}})"
+    if label == 'Node':
+        return f"({variable} {{id: row.{key}}})"
+    return f"({variable}:`{label}` {{id: row.{key}}})"
+
+
+def node_query(label, tenant=None):
+    if tenant is not None:
+        return f"""
+            UNWIND $rows AS row
+            MERGE (n:`{label}` {{repo: $repo, id: row.id}})
+            SET n += row.attributes, n:`{tenant}`
+            """
+    return f"""
+            UNWIND $rows AS row
+            MERGE (n:`{label}` {{id: row.id}})
+            SET n += row.attributes
+            """
+
+
+def edge_query(start_label, relation, end_label, accumulate=False, tenant=None):
+    """
+    :param bool accumulate: the rows are aggregated edges (count, firstSeen, lastSeen) of the new data only, added to
+        the aggregates of an existing relationship instead of replacing them
+    """
+    if not accumulate:
+        return f"""
+            UNWIND $rows AS row
+            MATCH {_node_pattern('n1', start_label, 'source', tenant)}
+            MATCH {_node_pattern('n2', end_label, 'target', tenant)}
+            MERGE (n1)-[r:`{relation}`]->(n2)
+            SET r += row.attributes
+            """
+    return f"""
+            UNWIND $rows AS row
+            MATCH {_node_pattern('n1', start_label, 'source', tenant)}
+            MATCH {_node_pattern('n2', end_label, 'target', tenant)}
+            MERGE (n1)-[r:`{relation}`]->(n2)
+            ON CREATE SET r += row.attributes
+            ON MATCH SET r.count = coalesce(r.count, 0) + row.attributes.count,
+                r.firstSeen = CASE WHEN r.firstSeen IS NULL OR datetime(row.attributes.firstSeen) < datetime(r.firstSeen)
+                              THEN coalesce(row.attributes.firstSeen, r.firstSeen) ELSE r.firstSeen END,
+                r.lastSeen = CASE WHEN r.lastSeen IS NULL OR datetime(row.attributes.lastSeen) > datetime(r.lastSeen)
+                             THEN coalesce(row.attributes.lastSeen, r.lastSeen) ELSE r.lastSeen END
+            """
+
+
+def partition_of(node_id, partitions):
+    """ Stable partition of a node id, the same in every process """
+    return zlib.crc32(str(node_id).encode('utf-8')) % partitions
+
+
+def pair_rounds(partitions):
+    """
+    Round-robin schedule (circle method) of the pairs of distinct partitions, for an even number of partitions.
+    The pairs of a round are disjoint and every pair appears in exactly one round.
+    """
+    players = list(range(partitions))
+    rounds = []
+    for _ in range(partitions - 1):
+        rounds.append([tuple(sorted((players[i], players[-1 - i]))) for i in range(partitions // 2)])
+        players = [players[0], players[-1]] + players[1:-1]
+    return rounds
+
+
+def _batched(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+def node_batches(graph, batch_size=DEFAULT_BATCH_SIZE):
+    """ Group the nodes of a networkx graph by label, yielding (label, rows) batches of at most batch_size rows """
+    buffers = {}
+    for node, data in graph.nodes(data=True):
+        label = data.get('type', 'Node')
+        rows = buffers.setdefault(label, [])
+        rows.append({'id': node, 'attributes': data})
+        if len(rows) >= batch_size:
+            yield label, buffers.pop(label)
+    for label, rows in buffers.items():
+        yield label, rows
+
+
+def edge_batches(graph, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Group the edges of a networkx graph by (start label, relationship type, end label), yielding
+    (key, rows) batches of at most batch_size rows
+    """
+    buffers = {}
+    for source, target, data in graph.edges(data=True):
+        key = (node_label(graph, source), data['relation'], node_label(graph, target))
+        rows = buffers.setdefault(key, [])
+        rows.append({'source': source, 'target': target, 'attributes': data})
+        if len(rows) >= batch_size:
+            yield key, buffers.pop(key)
+    for key, rows in buffers.items():
+        yield key, rows
+
 
 class Neo4jClient:
-    def __init__(self, neo4j_uri, neo4j_user, neo4j_password):
-        self.uri = neo4j_uri 
-        self.user = neo4j_user 
+    def __init__(self, neo4j_uri, neo4j_user, neo4j_password, database='neo4j', max_retries=5, retry_backoff=0.5,
+                 journal=None, accumulate=True, repo=None):
+        """
+        :param UploadJournal journal: log of the committed write batches, batches found in it are skipped so an
+            interrupted upload can be resumed
+        :param bool accumulate: add the counts of the aggregated edges to those already in the database, which is
+            right when the graph only holds new data. Uploads of a graph built from all the data replace them
+        :param str repo: url of the repository of the uploaded graph when the database hosts several repositories,
+            its nodes then get a repo property and a tenant label and are only matched within the repository
+        """
+        self.uri = neo4j_uri
+        self.user = neo4j_user
         self.password = neo4j_password
+        self.database = database
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.journal = journal
+        self.accumulate = accumulate
+        self.repo = repo
+        self.tenant = tenant_label(repo) if repo is not None else None
         self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
 
     def get_graph(self):
         return self.driver
 
-    def upload_graph(self, graph):
+    def upload_graph(self, graph, batch_size=DEFAULT_BATCH_SIZE, concurrency=1):
+        """
+        Upload a networkx graph with one UNWIND query per batch of nodes of the same label, then per batch of
+        edges of the same (start label, relationship type, end label), each batch in its own transaction.
+        With a concurrency above 1 the batches are written in parallel, see upload_graph_parallel.
+        """
+        if concurrency > 1:
+            return self.upload_graph_parallel(graph, batch_size, concurrency)
+
         logger.info("Uploading graph to Neo4j")
+        node_count = 0
+        for label, rows in node_batches(graph, batch_size):
+            self.upload_nodes(label, rows)
+            node_count += len(rows)
+        logger.info(f"{node_count} nodes uploaded to Neo4j")
+
+        edge_count = 0
+        for (start_label, relation, end_label), rows in edge_batches(graph, batch_size):
+            self.upload_edges(start_label, relation, end_label, rows)
+            edge_count += len(rows)
+        logger.info(f"{edge_count} edges uploaded to Neo4j")
+
+    def upload_graph_parallel(self, graph, batch_size=DEFAULT_BATCH_SIZE, concurrency=4):
+        """
+        Upload a networkx graph from concurrency sessions without lock contention between them. Nodes are split in
+        2 * concurrency partitions by id hash and edges in cells by the partitions of their two ends. Node
+        partitions are written all at once, then edge cells round by round: a round only holds cells whose
+        partitions are disjoint, so no two concurrent transactions lock the same node.
+        """
+        partitions = 2 * concurrency
+        logger.info(f"Uploading graph to Neo4j with {concurrency} writers over {partitions} partitions")
+
+        node_cells = {}
         for node, data in graph.nodes(data=True):
-            node_type = data.get('type', 'Node')
-            query = f"""
-                    MERGE (n:{node_type} {{id: $node}})
-                    SET n += $attributes
-                    """
-            self.driver.execute_query(query_=query, node=node, attributes=data, database_="neo4j")
-        logger.info("Nodes uploaded to Neo4j")
+            cell = node_cells.setdefault(partition_of(node, partitions), {})
+            cell.setdefault(node_query(data.get('type', 'Node'), self.tenant), []).append({'id': node, 'attributes': data})
 
+        edge_cells = {}
         for source, target, data in graph.edges(data=True):
-            edge_type = data['relation']
-            query = f"""
-                    MATCH (n1 {{id: $source}})
-                    WITH n1
-                    MATCH (n2 {{id: $target}})
-                    MERGE (n1)-[r:{edge_type}]->(n2)
-                    SET r += $attributes
-                    """
-
-            self.driver.execute_query(query_=query, source=source, target=target, attributes=data, database_="neo4j")
-        logger.info("Edges uploaded to Neo4j")
+            pair = tuple(sorted((partition_of(source, partitions), partition_of(target, partitions))))
+            query = edge_query(node_label(graph, source), data['relation'], node_label(graph, target),
+                               self.accumulate and 'count' in data, self.tenant)
+            edge_cells.setdefault(pair, {}).setdefault(query, []).append(
+                {'source': source, 'target': target, 'attributes': data})
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            node_count = self._run_round(executor, list(node_cells.values()), batch_size)
+            logger.info(f"{node_count} nodes uploaded to Neo4j")
+
+            edge_count = 0
+            diagonal = [(p, p) for p in range(partitions)]
+            for pairs in [diagonal] + pair_rounds(partitions):
+                edge_count += self._run_round(executor, [edge_cells[pair] for pair in pairs if pair in edge_cells],
+                                              batch_size)
+            logger.info(f"{edge_count} edges uploaded to Neo4j")
+
+    def _run_round(self, executor, cells, batch_size):
+        """ Write the cells concurrently, one session per cell, and wait for all of them """
+        futures = [executor.submit(self._upload_cell, cell, batch_size) for cell in cells]
+        return sum(future.result() for future in futures)
+
+    def _upload_cell(self, cell, batch_size):
+        count = 0
+        with self.driver.session(database=self.database) as session:
+            for query, rows in cell.items():
+                for batch in _batched(rows, batch_size):
+                    self._write(query, batch, session)
+                    count += len(batch)
+        return count
+
+    def upload_nodes(self, label, rows):
+        """ MERGE a batch of {'id', 'attributes'} rows as nodes with the given label """
+        self._write(node_query(label, self.tenant), rows)
+
+    def upload_edges(self, start_label, relation, end_label, rows):
+        """ MERGE a batch of {'source', 'target', 'attributes'} rows as relationships between existing nodes """
+        accumulate = self.accumulate and any('count' in row['attributes'] for row in rows)
+        self._write(edge_query(start_label, relation, end_label, accumulate, self.tenant), rows)
+
+    def delete_nodes(self, label, ids):
+        """ DETACH DELETE the nodes of the given label and ids """
+        query = f"""
+                UNWIND $rows AS id
+                MATCH (n:`{label}` {{id: id}})
+                WHERE $repo IS NULL OR n.repo = $repo
+                DETACH DELETE n
+                """
+        self._write(query, ids)
+
+    def delete_edges(self, start_label, relation, end_label, rows):
+        """ DELETE the relationships of a batch of {'source', 'target'} rows """
+        query = f"""
+                UNWIND $rows AS row
+                MATCH {_node_pattern('n1', start_label, 'source', self.tenant)}-[r:`{relation}`]->{_node_pattern('n2', end_label, 'target', self.tenant)}
+                DELETE r
+                """
+        self._write(query, rows)
+
+    def write_rows(self, query, rows):
+        """ Run a query over a batch of rows ($rows, and $repo for the tenant) with the retries and journal of uploads """
+        self._write(query, rows)
+
+    def _write(self, query, rows, session=None):
+        """
+        Run the query over the rows in one write transaction, retrying transient and connection errors with
+        exponential backoff. With a journal, batches already committed are skipped and new ones are recorded.
+        """
+        batch = batch_id(query, rows) if self.journal is not None else None
+        if batch is not None and batch in self.journal:
+            return
+        if session is None:
+            with self.driver.session(database=self.database) as session:
+                return self._write(query, rows, session)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                session.execute_write(lambda tx: tx.run(query, rows=rows, repo=self.repo).consume())
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * 2 ** attempt * (1 + random.random())
+                logger.warning(f"{type(e).__name__} on a batch of {len(rows)} rows, retrying in {delay:.1f}s")
+                time.sleep(delay)
+        if batch is not None:
+            self.journal.record(batch, len(rows))
 
     def execute_query(self, query_, **kwargs):
         with self.driver.session() as session:
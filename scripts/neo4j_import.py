@@ -0,0 +1,162 @@
+import csv
+import os
+import re
+import subprocess
+from datetime import date, datetime
+from logging import getLogger
+
+from scripts.graph_handler import node_label
+from scripts.tenancy import multi_tenant, tenant_label
+
+logger = getLogger(__name__)
+
+ARRAY_DELIMITER = ';'
+
+_SCALAR_TYPES = [(bool, 'boolean'), (int, 'long'), (float, 'double'), (str, 'string'), (datetime, 'datetime'),
+                 (date, 'date')]
+
+
+def _value_type(value):
+    """ neo4j-admin type of a single property value, None when the value has no usable type """
+    if isinstance(value, (list, tuple)):
+        element_types = {_value_type(v) for v in value if v is not None}
+        if len(element_types) == 1 and '[]' not in next(iter(element_types)):
+            return next(iter(element_types)) + '[]'
+        return 'string[]'
+    for python_type, neo4j_type in _SCALAR_TYPES:
+        if isinstance(value, python_type):
+            return neo4j_type
+    return None
+
+
+def infer_property_types(rows):
+    """
+    Declared type of every property found in the rows: long and double widen to double, every other mix falls
+    back to string.
+
+    :param list rows: property dicts
+    :returns dict property name -> neo4j-admin type
+    """
+    seen = {}
+    for row in rows:
+        for key, value in row.items():
+            value_type = _value_type(value)
+            if value_type is not None:
+                seen.setdefault(key, set()).add(value_type)
+
+    types = {}
+    for key, value_types in seen.items():
+        if len(value_types) == 1:
+            types[key] = next(iter(value_types))
+        elif value_types == {'long', 'double'}:
+            types[key] = 'double'
+        elif value_types == {'long[]', 'double[]'}:
+            types[key] = 'double[]'
+        else:
+            types[key] = 'string[]' if all(t.endswith('[]') for t in value_types) else 'string'
+    return types
+
+
+def _cell(value, value_type):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ARRAY_DELIMITER.join(_cell(v, value_type[:-2]) for v in value if v is not None)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if value_type == 'double':
+        return repr(float(value))
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _file_name(*parts):
+    return '_'.join(re.sub(r'[^0-9A-Za-z]+', '-', str(part)) for part in parts)
+
+
+def _write_csv(output_dir, name, header, rows):
+    header_path = os.path.join(output_dir, f"{name}_header.csv")
+    data_path = os.path.join(output_dir, f"{name}.csv")
+    with open(header_path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerow(header)
+    with open(data_path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(rows)
+    return header_path, data_path
+
+
+def export_import_csv(graph, output_dir, repo=None):
+    """
+    Write a networkx graph as neo4j-admin import files: one header file and one data file per node label and per
+    (start label, relationship type, end label). Nodes keep their id as a typed 'id' property, the import ids live
+    in one id space per label. Parallel edges of the same type are merged, as MERGE does on the transactional path.
+
+    :param graph: networkx graph built by GraphHandler
+    :param str output_dir: directory receiving the csv files
+    :param str repo: url of the repository when the database hosts several repositories, the nodes then get its
+        repo property and tenant label
+    :returns dict with the 'nodes' and 'relationships' (label or type, header path, data path) entries
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info(f"Exporting graph as neo4j-admin import files to {output_dir}")
+
+    nodes_by_label = {}
+    for node, data in graph.nodes(data=True):
+        props = {**data, 'id': node, 'repo': repo} if repo is not None else {**data, 'id': node}
+        nodes_by_label.setdefault(data.get('type', 'Node'), []).append((node, props))
+
+    edges_by_key = {}
+    for source, target, data in graph.edges(data=True):
+        start_label = node_label(graph, source)
+        end_label = node_label(graph, target)
+        edges = edges_by_key.setdefault((start_label, data['relation'], end_label), {})
+        edges.setdefault((source, target), {}).update(data)
+
+    files = {'nodes': [], 'relationships': []}
+    for label, nodes in nodes_by_label.items():
+        types = infer_property_types(props for _, props in nodes)
+        columns = list(types)
+        header = [f':ID({label})'] + [f'{column}:{types[column]}' for column in columns]
+        rows = ([str(node)] + [_cell(props.get(column), types[column]) for column in columns] for node, props in nodes)
+        header_path, data_path = _write_csv(output_dir, _file_name('nodes', label), header, rows)
+        files['nodes'].append((f"{label}:{tenant_label(repo)}" if repo is not None else label, header_path, data_path))
+        logger.info(f"{len(nodes)} {label} nodes exported")
+
+    for (start_label, relation, end_label), edges in edges_by_key.items():
+        types = infer_property_types(edges.values())
+        columns = list(types)
+        header = [f':START_ID({start_label})', f':END_ID({end_label})'] + \
+                 [f'{column}:{types[column]}' for column in columns]
+        rows = ([str(source), str(target)] + [_cell(props.get(column), types[column]) for column in columns]
+                for (source, target), props in edges.items())
+        header_path, data_path = _write_csv(output_dir, _file_name('rels', start_label, relation, end_label), header, rows)
+        files['relationships'].append((relation, header_path, data_path))
+        logger.info(f"{len(edges)} {start_label}-{relation}->{end_label} relationships exported")
+    return files
+
+
+def import_command(files, database='neo4j', neo4j_admin='neo4j-admin'):
+    """ neo4j-admin (5.x) command loading the exported files into a new, stopped database """
+    command = [neo4j_admin, 'database', 'import', 'full', '--overwrite-destination=true',
+               '--multiline-fields=true', f'--array-delimiter={ARRAY_DELIMITER}']
+    command += [f'--nodes={label}={header},{data}' for label, header, data in files['nodes']]
+    command += [f'--relationships={relation}={header},{data}' for relation, header, data in files['relationships']]
+    command.append(database)
+    return command
+
+
+def run_import(files, database='neo4j', neo4j_admin='neo4j-admin'):
+    """
+    Run neo4j-admin against the local Neo4j installation, the target database must be stopped. The import replaces
+    the whole database, so it is refused when the database is shared by several repositories.
+    """
+    if multi_tenant():
+        raise RuntimeError("neo4j-admin import would overwrite the graphs of the other repositories of the shared "
+                           "database, use the transactional upload with NEO4J_MULTI_TENANT=true")
+    command = import_command(files, database, neo4j_admin)
+    logger.info(f"Running {' '.join(command[:5])} for database '{database}'")
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        logger.error(f"neo4j-admin import failed: {result.stderr}")
+        raise RuntimeError(f"neo4j-admin import failed for database '{database}': {result.stderr.strip()[-500:]}")
+    logger.info(result.stdout)
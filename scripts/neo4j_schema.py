@@ -0,0 +1,176 @@
+from logging import getLogger
+
+from scripts.tenancy import tenant_label
+
+logger = getLogger(__name__)
+
+# labels created by GraphHandler, each one gets a uniqueness constraint on its id
+NODE_LABELS = ['Repository', 'User', 'Branch', 'Commit', 'File', 'Issue', 'Tag', 'Release', 'UserActivity', 'FileActivity']
+
+# properties filtered on by the chat prompts and the generated Cypher queries, the range indexes of the datetime
+# properties also serve the time window filters
+PROPERTY_INDEXES = {
+    'Commit': ['hash', 'committedDateTime'],
+    'Issue': ['number', 'state', 'createdDateTime', 'closedDateTime'],
+    'User': ['login', 'name'],
+    'File': ['name', 'path'],
+    'Tag': ['name'],
+    'Release': ['name', 'tagName'],
+    'UserActivity': ['startDate'],
+    'FileActivity': ['startDate'],
+}
+
+# native datetime properties and the ISO date string they are parsed from, both stored by GraphHandler
+DATETIME_PROPERTIES = {
+    'Commit': [('committedDate', 'committedDateTime')],
+    'Issue': [('createdAt', 'createdDateTime'), ('closedAt', 'closedDateTime')],
+    'Tag': [('date', 'dateTime')],
+    'Release': [('publishedAt', 'publishedDateTime')],
+}
+
+# ISO 8601 date and time strings, the only ones datetime() is given by the backfill
+ISO_DATETIME_PATTERN = r'\d{4}-\d{2}-\d{2}T.+'
+
+# text properties searched by the generated Cypher queries, through db.index.fulltext.queryNodes
+FULLTEXT_INDEXES = {
+    'Commit': ['message'],
+    'Issue': ['title', 'body'],
+}
+
+# labels whose embedding property gets a vector index, used by the semantic retrieval of the chat
+VECTOR_INDEXES = ['Commit', 'Issue']
+
+INDEX_TIMEOUT = 300
+
+
+def constraint_name(label, prop='id'):
+    return f"{label.lower()}_{prop}_unique"
+
+
+def index_name(label, prop):
+    return f"{label.lower()}_{prop}_index"
+
+
+def fulltext_index_name(label):
+    return f"{label.lower()}_fulltext"
+
+
+def vector_index_name(label):
+    return f"{label.lower()}_embedding"
+
+
+def schema_statements(multi_tenant=False, vector_dimensions=None):
+    """
+    Idempotent statements creating the constraints and indexes of the graph, as (name, statement) pairs. In a
+    database shared by several repositories, ids are only unique within a repository: the uniqueness constraints
+    are on (repo, id), and their index also serves the lookups of the nodes of one repository. Vector indexes are
+    only created when embeddings are enabled, with the dimensions of the embedder.
+    """
+    for label in NODE_LABELS:
+        if multi_tenant:
+            name = constraint_name(label, 'repo_id')
+            yield name, f"CREATE CONSTRAINT {name} IF NOT EXISTS FOR (n:`{label}`) REQUIRE (n.repo, n.id) IS UNIQUE"
+        else:
+            name = constraint_name(label)
+            yield name, f"CREATE CONSTRAINT {name} IF NOT EXISTS FOR (n:`{label}`) REQUIRE n.id IS UNIQUE"
+    for label, properties in PROPERTY_INDEXES.items():
+        for prop in properties:
+            name = index_name(label, prop)
+            yield name, f"CREATE INDEX {name} IF NOT EXISTS FOR (n:`{label}`) ON (n.`{prop}`)"
+    for label, properties in FULLTEXT_INDEXES.items():
+        name = fulltext_index_name(label)
+        fields = ', '.join(f"n.`{prop}`" for prop in properties)
+        yield name, f"CREATE FULLTEXT INDEX {name} IF NOT EXISTS FOR (n:`{label}`) ON EACH [{fields}]"
+    if vector_dimensions:
+        for label in VECTOR_INDEXES:
+            name = vector_index_name(label)
+            yield name, (f"CREATE VECTOR INDEX {name} IF NOT EXISTS FOR (n:`{label}`) ON (n.embedding) "
+                         f"OPTIONS {{indexConfig: {{`vector.dimensions`: {int(vector_dimensions)}, "
+                         f"`vector.similarity_function`: 'cosine'}}}}")
+
+
+def scope_legacy_nodes(neo_client):
+    """
+    Give the nodes of a database created before it was shared by several repositories the repo property and tenant
+    label of their repository, before the single repository constraints are dropped: otherwise the (repo, id)
+    MERGE of the next upload would create a second copy of each of them. The unscoped nodes must hold the graph of a
+    single repository, identified by its Repository node.
+    """
+    unscoped = neo_client.execute_query("MATCH (n) WHERE n.repo IS NULL RETURN count(n) AS count")[0]['count']
+    if not unscoped:
+        return
+    urls = [record['url'] for record in
+            neo_client.execute_query("MATCH (r:Repository) WHERE r.repo IS NULL RETURN DISTINCT r.url AS url")]
+    if len(urls) != 1 or urls[0] is None:
+        raise RuntimeError(f"The database holds {unscoped} nodes outside of any repository, which cannot be "
+                           f"attributed to a single repository ({len(urls)} unscoped Repository nodes). Scope or "
+                           f"remove them before sharing the database")
+    logger.info(f"Scoping the {unscoped} nodes of the single repository database to {urls[0]}")
+    neo_client.execute_query(f"""
+        MATCH (n) WHERE n.repo IS NULL
+        CALL {{ WITH n SET n.repo = $repo, n:`{tenant_label(urls[0])}` }} IN TRANSACTIONS OF 10000 ROWS
+        """, repo=urls[0])
+
+
+def backfill_datetimes(neo_client):
+    """
+    Set the native datetime properties missing on the nodes uploaded before they were stored, from their ISO date
+    strings, so time window filters on them also cover the earlier history. Nodes that already have them are left
+    untouched, running it again only costs the lookups.
+    """
+    for label, properties in DATETIME_PROPERTIES.items():
+        for source, target in properties:
+            try:
+                neo_client.execute_query(f"""
+                    MATCH (n:`{label}`) WHERE n.`{target}` IS NULL AND n.`{source}` =~ $pattern
+                    CALL {{ WITH n SET n.`{target}` = datetime(n.`{source}`) }} IN TRANSACTIONS OF 10000 ROWS
+                    """, pattern=ISO_DATETIME_PATTERN)
+            except Exception as e:
+                logger.error(f"Unable to backfill {label}.{target} from {label}.{source}: {e}")
+
+
+def provision_schema(neo_client, timeout=INDEX_TIMEOUT, vector_dimensions=None):
+    """
+    Create the missing constraints and indexes, then wait for them to be online. A constraint that cannot be
+    created, e.g. because the database already holds duplicated ids, is logged and skipped so the upload can go on.
+    The datetime properties of the nodes uploaded before they existed are then backfilled.
+    """
+    logger.info("Provisioning Neo4j constraints and indexes")
+    multi_tenant = neo_client.repo is not None
+    if multi_tenant:
+        scope_legacy_nodes(neo_client)
+        # ids of different repositories can collide, the single repository constraints must go
+        for label in NODE_LABELS:
+            neo_client.execute_query(f"DROP CONSTRAINT {constraint_name(label)} IF EXISTS")
+    for name, statement in schema_statements(multi_tenant, vector_dimensions):
+        try:
+            neo_client.execute_query(statement)
+        except Exception as e:
+            logger.error(f"Unable to create '{name}': {e}")
+    neo_client.execute_query("CALL db.awaitIndexes($timeout)", timeout=timeout)
+    backfill_datetimes(neo_client)
+    return verify_schema(neo_client, vector_dimensions)
+
+
+def verify_schema(neo_client, vector_dimensions=None):
+    """
+    Check that every expected constraint and index exists and is online.
+
+    :returns dict with the names of the 'missing' entries and of the indexes 'not_online', both empty when the
+        coverage is complete
+    """
+    indexes = {record['name']: record for record in
+               neo_client.execute_query("SHOW INDEXES YIELD name, state, owningConstraint")}
+    constraints = {record['name'] for record in neo_client.execute_query("SHOW CONSTRAINTS YIELD name")}
+
+    expected = [name for name, _ in schema_statements(neo_client.repo is not None, vector_dimensions)]
+    missing = [name for name in expected if name not in indexes and name not in constraints]
+    # constraints are backed by an index named after them, or referencing them as owner
+    not_online = [record['owningConstraint'] or name for name, record in indexes.items()
+                  if (record['owningConstraint'] or name) in expected and record['state'] != 'ONLINE']
+
+    if missing or not_online:
+        logger.warning(f"Incomplete Neo4j schema, missing: {missing}, not online: {not_online}")
+    else:
+        logger.info("All Neo4j constraints and indexes are online")
+    return {'missing': missing, 'not_online': not_online}
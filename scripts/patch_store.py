@@ -0,0 +1,59 @@
+import hashlib
+import os
+import re
+import zlib
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class PatchStore:
+    """
+    Content-addressed store of the patch texts of the changed relationships, kept out of Neo4j. Each patch is
+    zlib-compressed in a file named after the sha256 digest of its text, so identical patches are stored once.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def put(self, text):
+        """ Store a patch text, returning its digest """
+        data = (text or '').encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(zlib.compress(data))
+            os.replace(temp_path, path)
+        return digest
+
+    def get(self, digest):
+        """ Patch text of a digest, None when the store does not have it """
+        if not isinstance(digest, str) or not DIGEST_PATTERN.match(digest):
+            return None
+        try:
+            with open(self._path(digest), 'rb') as f:
+                return zlib.decompress(f.read()).decode('utf-8')
+        except FileNotFoundError:
+            return None
+        except zlib.error:
+            logger.error(f"Corrupted patch {digest} in {self.root}")
+            return None
+
+    def hydrate(self, value):
+        """ Replace the patch digests found in a query result (rows, dicts, lists) with their text """
+        if isinstance(value, dict):
+            return {key.replace('patchDigest', 'patch'): self.hydrate(v) for key, v in value.items()}
+        if isinstance(value, list):
+            return [self.hydrate(v) for v in value]
+        if isinstance(value, str):
+            text = self.get(value)
+            return text if text is not None else value
+        return value
@@ -0,0 +1,118 @@
+import json
+import os
+from datetime import datetime
+from logging import getLogger
+
+from scripts.commit_ancestry import commit_parents, topological_order
+from scripts.graph_handler import tag_node_id
+from scripts.neo4j_client import DEFAULT_BATCH_SIZE
+
+logger = getLogger(__name__)
+
+# relationship type -> label of the nodes it points to
+CONTAINMENT_RELATIONS = {
+    'contains': 'Commit',
+    'contains_fix': 'Issue',
+    'contains_bug': 'Issue',
+}
+
+
+def first_containing_tags(parents, tag_commits):
+    """
+    Index of the first tag containing each commit, in one pass over the commit DAG: every commit gets the bitset of
+    the tags containing it, the union of the bitsets of its children and of the tags pointing to it.
+
+    :param dict parents: commit hash -> hashes of its parents
+    :param list tag_commits: commit of every tag, the tags in chronological order
+    :returns dict commit hash -> index of the first tag containing it, for the commits in a tag
+    """
+    order, children = topological_order(parents)
+    tagged = {}
+    for index, commit in enumerate(tag_commits):
+        tagged[commit] = tagged.get(commit, 0) | 1 << index
+
+    contained = {}
+    first = {}
+    for commit in reversed(order):
+        bits = tagged.get(commit, 0)
+        for child in children[commit]:
+            bits |= contained[child]
+        contained[commit] = bits
+        if bits:
+            first[commit] = (bits & -bits).bit_length() - 1
+    return first
+
+
+def _first_tag(first, tags, commits):
+    indexes = [first[commit] for commit in commits if commit in first]
+    return tag_node_id(tags[min(indexes)]['name']) if indexes else None
+
+
+class ReleaseContainment:
+    """
+    Relationships from the first tag shipping a commit (contains), the first fixing commit of an issue
+    (contains_fix) or the first commit inducing it (contains_bug). The tag of every commit and issue of the last
+    upload is kept in a json file next to the data files, so an update only rewrites the relationships whose tag
+    changed, e.g. for the commits of a new tag.
+    """
+
+    def __init__(self, state_path):
+        self.state_path = state_path
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return {relation: {} for relation in CONTAINMENT_RELATIONS}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            # lists of (target, tag) pairs, issue numbers stay integers
+            return {relation: dict(map(tuple, pairs)) for relation, pairs in json.load(f).items()}
+
+    def save(self, assignments):
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({relation: list(targets.items()) for relation, targets in assignments.items()}, f)
+        os.replace(temp_path, self.state_path)
+
+    def update(self, neo_client, commits, tags, bics, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param list commits: all the collected commits, with their parents
+        :param list tags: all the collected tags
+        :param list bics: all the fixing and bug inducing commits found by LinkBugs
+        """
+        parents = commit_parents(commits)
+        if not parents or not tags:
+            logger.info("No tags or commit parents collected, skipping the release containment")
+            return
+        tags = sorted(tags, key=lambda tag: (datetime.fromisoformat(tag['date']), tag['name']))
+        first = first_containing_tags(parents, [tag['commit'] for tag in tags])
+
+        assignments = {relation: {} for relation in CONTAINMENT_RELATIONS}
+        for commit, index in first.items():
+            assignments['contains'][commit] = tag_node_id(tags[index]['name'])
+        for bic in bics:
+            number = int(bic['Number'])
+            fix_tag = _first_tag(first, tags, bic['FixingCommit'])
+            bug_tag = _first_tag(first, tags, bic['InducingCommit'])
+            if fix_tag:
+                assignments['contains_fix'][number] = fix_tag
+            if bug_tag:
+                assignments['contains_bug'][number] = bug_tag
+
+        previous = self.load()
+        for relation, label in CONTAINMENT_RELATIONS.items():
+            current, before = assignments[relation], previous.get(relation, {})
+            changed = [target for target in sorted(set(current) | set(before), key=str)
+                       if current.get(target) != before.get(target)]
+            stale = [target for target in changed if target in before]
+            rows = [{'source': current[target], 'target': target, 'attributes': {}}
+                    for target in changed if target in current]
+            logger.info(f"{len(rows)} {relation} relationships written, {len(stale)} replaced or removed")
+            for start in range(0, len(stale), batch_size):
+                neo_client.write_rows(f"""
+                    UNWIND $rows AS id
+                    MATCH (:Tag)-[r:`{relation}`]->(n:`{label}` {{id: id}})
+                    WHERE $repo IS NULL OR n.repo = $repo
+                    DELETE r
+                    """, stale[start:start + batch_size])
+            for start in range(0, len(rows), batch_size):
+                neo_client.upload_edges('Tag', relation, label, rows[start:start + batch_size])
+        self.save(assignments)
@@ -0,0 +1,387 @@
+import argparse
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from logging import getLogger, basicConfig, INFO
+
+import networkx as nx
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from scripts.graph_handler import node_label
+from scripts.neo4j_client import Neo4jClient, DEFAULT_BATCH_SIZE
+from scripts.neo4j_import import infer_property_types, export_import_csv, run_import, _file_name
+from scripts.neo4j_schema import provision_schema
+from scripts.patch_store import PatchStore
+from scripts.derived_stages import reset_derived_state
+from scripts.tenancy import multi_tenant
+
+logger = getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+PATCHES_FILE = 'patches'
+SNAPSHOT_VERSION = 1
+COMPRESSION = 'zstd'
+# companion column of a datetime column, holding the UTC offset in seconds of each value (null for naive values)
+OFFSET_PREFIX = ':OFFSET:'
+# names of the properties explicitly set to null on each row, told apart from the properties the row does not have
+NULLS_COLUMN = ':NULLS'
+
+_ARROW_TYPES = {
+    'boolean': pa.bool_(),
+    'long': pa.int64(),
+    'double': pa.float64(),
+    'string': pa.string(),
+    'datetime': pa.timestamp('us', tz='UTC'),
+    'date': pa.date32(),
+}
+
+READ_NODES_QUERY = """
+                MATCH (n)
+                WHERE $repo IS NULL OR n.repo = $repo
+                RETURN elementId(n) AS element, properties(n) AS properties,
+                       [label IN labels(n) WHERE $tenant IS NULL OR label <> $tenant] AS labels
+                """
+
+READ_RELATIONSHIPS_QUERY = """
+                MATCH (a)-[r]->(b)
+                WHERE $repo IS NULL OR a.repo = $repo
+                RETURN elementId(a) AS source, elementId(b) AS target, type(r) AS relation, properties(r) AS properties
+                """
+
+
+def _arrow_type(value_type):
+    if value_type.endswith('[]'):
+        return pa.list_(_ARROW_TYPES[value_type[:-2]])
+    return _ARROW_TYPES[value_type]
+
+
+def _coerce(value, value_type):
+    """ value as an instance of its column type, mixed columns were declared as strings """
+    if value is None:
+        return None
+    if value_type.endswith('[]'):
+        values = value if isinstance(value, (list, tuple)) else [value]
+        return [_coerce(v, value_type[:-2]) for v in values if v is not None]
+    if value_type == 'double':
+        return float(value)
+    if value_type == 'string' and not isinstance(value, str):
+        return str(value)
+    return value
+
+
+def _offset(value):
+    """ UTC offset in seconds of a datetime, or of each datetime of a list, None for naive datetimes """
+    if isinstance(value, (list, tuple)):
+        return [_offset(v) for v in value]
+    if not isinstance(value, datetime) or value.utcoffset() is None:
+        return None
+    return int(value.utcoffset().total_seconds())
+
+
+def _with_offset(value, offset):
+    """ datetime read back as a UTC instant, in the timezone offset it had when exported """
+    if isinstance(value, list):
+        return [_with_offset(v, o) for v, o in zip(value, offset or [None] * len(value))]
+    if not isinstance(value, datetime):
+        return value
+    if offset is None:
+        return value.replace(tzinfo=None)
+    return value.astimezone(timezone(timedelta(seconds=offset)))
+
+
+def _table(columns):
+    """
+    Arrow table of row columns, typed like the neo4j-admin import files. Arrow timestamps share one timezone per
+    column, so each datetime column is followed by the UTC offsets of its values.
+
+    :param dict columns: column name -> list of values, one per row
+    """
+    arrays, names = [], []
+    for name, values in columns.items():
+        value_type = infer_property_types({name: value} for value in values).get(name, 'string')
+        arrays.append(pa.array([_coerce(value, value_type) for value in values], type=_arrow_type(value_type)))
+        names.append(name)
+        if value_type in ('datetime', 'datetime[]'):
+            offset_type = pa.list_(pa.int32()) if value_type.endswith('[]') else pa.int32()
+            arrays.append(pa.array([_offset(value) for value in values], type=offset_type))
+            names.append(OFFSET_PREFIX + name)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def _rows_columns(keys, rows):
+    """
+    key columns, named like in the neo4j-admin headers, followed by one column per property of the rows, and by the
+    names of the properties set to null on each row when there are any
+    """
+    properties = list(dict.fromkeys(name for row in rows for name in row[-1]))
+    columns = {key: [row[position] for row in rows] for position, key in enumerate(keys)}
+    columns.update({name: [row[-1].get(name) for row in rows] for name in properties})
+    nulls = [sorted(name for name, value in row[-1].items() if value is None) for row in rows]
+    if any(nulls):
+        columns[NULLS_COLUMN] = nulls
+    return columns
+
+
+def _row_attributes(row):
+    """ properties of a snapshot row, with their datetimes back in their timezone offset and their explicit nulls """
+    nulls = set(row.pop(NULLS_COLUMN, None) or ())
+    for name in [name for name in row if name.startswith(OFFSET_PREFIX)]:
+        offsets = row.pop(name)
+        row[name[len(OFFSET_PREFIX):]] = _with_offset(row[name[len(OFFSET_PREFIX):]], offsets)
+    return {name: value for name, value in row.items() if value is not None or name in nulls}
+
+
+def _checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_table(output_dir, name, table):
+    path = os.path.join(output_dir, f"{name}.parquet")
+    pq.write_table(table, path, compression=COMPRESSION)
+    return {'file': os.path.basename(path), 'rows': table.num_rows, 'sha256': _checksum(path)}
+
+
+def _patch_table(graph, patch_store):
+    """ digest and text of the patches referenced by the changed relationships """
+    digests = sorted({data['patchDigest'] for _, _, data in graph.edges(data=True) if data.get('patchDigest')})
+    texts = [patch_store.get(digest) for digest in digests]
+    missing = sum(text is None for text in texts)
+    if missing:
+        logger.warning(f"{missing} of the {len(digests)} patches are missing from {patch_store.root}")
+    rows = [(digest, text) for digest, text in zip(digests, texts) if text is not None]
+    return pa.Table.from_arrays([pa.array([digest for digest, _ in rows], type=pa.string()),
+                                 pa.array([text for _, text in rows], type=pa.large_string())],
+                                names=['digest', 'patch'])
+
+
+def export_snapshot(graph, output_dir, repo=None, source='graph', patch_store=None):
+    """
+    Write a networkx graph as a compressed snapshot: one Parquet file per node label and per (start label,
+    relationship type, end label), and a manifest listing them with their row counts and checksums. Parallel edges
+    of the same type are merged, as MERGE does on upload. Datetimes are stored as UTC instants with their offset,
+    and properties explicitly set to null are recorded.
+
+    :param graph: networkx graph built by GraphHandler, or read back from Neo4j by read_graph
+    :param str output_dir: directory receiving the snapshot
+    :param str repo: url of the repository the graph belongs to
+    :param str source: where the graph comes from, recorded in the manifest
+    :param PatchStore patch_store: store of the patch texts of the changed relationships, which only carry their
+        patchDigest. The patches they reference are copied into the snapshot
+    :returns dict manifest
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info(f"Exporting a snapshot of the graph to {output_dir}")
+
+    nodes_by_label = {}
+    for node, data in graph.nodes(data=True):
+        nodes_by_label.setdefault(data.get('type', 'Node'), []).append((node, data))
+    edges_by_key = {}
+    for source_node, target, data in graph.edges(data=True):
+        key = (node_label(graph, source_node), data['relation'], node_label(graph, target))
+        edges = edges_by_key.setdefault(key, {})
+        edges.setdefault((source_node, target), {}).update(data)
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'createdAt': datetime.now(timezone.utc).isoformat(),
+        'source': source,
+        'repo': repo,
+        'compression': COMPRESSION,
+        'nodes': [],
+        'relationships': [],
+        'patches': None,
+    }
+    for label, nodes in sorted(nodes_by_label.items()):
+        entry = _write_table(output_dir, _file_name('nodes', label), _table(_rows_columns([':ID'], nodes)))
+        manifest['nodes'].append({'label': label, **entry})
+        logger.info(f"{len(nodes)} {label} nodes exported")
+    for (start_label, relation, end_label), edges in sorted(edges_by_key.items()):
+        rows = [(source_node, target, data) for (source_node, target), data in edges.items()]
+        entry = _write_table(output_dir, _file_name('rels', start_label, relation, end_label),
+                             _table(_rows_columns([':START_ID', ':END_ID'], rows)))
+        manifest['relationships'].append({'startLabel': start_label, 'type': relation, 'endLabel': end_label, **entry})
+        logger.info(f"{len(rows)} {start_label}-{relation}->{end_label} relationships exported")
+
+    if patch_store is not None:
+        manifest['patches'] = _write_table(output_dir, PATCHES_FILE, _patch_table(graph, patch_store))
+        logger.info(f"{manifest['patches']['rows']} patches exported")
+
+    temp_path = os.path.join(output_dir, MANIFEST_FILE + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, os.path.join(output_dir, MANIFEST_FILE))
+    return manifest
+
+
+def _native(value):
+    """ Neo4j temporal values as Python ones """
+    if isinstance(value, list):
+        return [_native(v) for v in value]
+    return value.to_native() if hasattr(value, 'to_native') else value
+
+
+def read_graph(neo_client):
+    """
+    Read the graph stored in Neo4j back as a networkx graph, including the nodes, relationships and properties
+    added after the upload (counters, rollups, co-change, ownership, embeddings). In a shared database only the
+    nodes of the repository of the client are read, without their repo property.
+    """
+    logger.info("Reading the graph back from Neo4j")
+    graph = nx.MultiDiGraph()
+    nodes = {}
+    for record in neo_client.execute_query(READ_NODES_QUERY, repo=neo_client.repo, tenant=neo_client.tenant):
+        properties = {key: _native(value) for key, value in record['properties'].items() if key != 'repo'}
+        if 'id' not in properties:
+            continue
+        node = properties.pop('id')
+        properties.setdefault('type', record['labels'][0] if record['labels'] else 'Node')
+        graph.add_node(node, **properties)
+        nodes[record['element']] = node
+    for record in neo_client.execute_query(READ_RELATIONSHIPS_QUERY, repo=neo_client.repo):
+        if record['source'] not in nodes or record['target'] not in nodes:
+            continue
+        properties = {key: _native(value) for key, value in record['properties'].items()}
+        properties['relation'] = record['relation']
+        graph.add_edge(nodes[record['source']], nodes[record['target']], key=record['relation'], **properties)
+    logger.info(f"{graph.number_of_nodes()} nodes and {graph.number_of_edges()} relationships read from Neo4j")
+    return graph
+
+
+def load_manifest(snapshot_dir):
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {manifest.get('version')} in {snapshot_dir}")
+    return manifest
+
+
+def _read_table(snapshot_dir, entry):
+    path = os.path.join(snapshot_dir, entry['file'])
+    if _checksum(path) != entry['sha256']:
+        raise ValueError(f"Checksum mismatch for {path}, the snapshot is corrupted")
+    table = pq.read_table(path)
+    if table.num_rows != entry['rows']:
+        raise ValueError(f"{path} holds {table.num_rows} rows, {entry['rows']} expected")
+    return table.to_pylist()
+
+
+def load_snapshot(snapshot_dir, patch_store=None):
+    """
+    networkx graph of a snapshot, checked against its manifest
+
+    :param PatchStore patch_store: store receiving the patches of the snapshot
+    :returns tuple (graph, manifest)
+    """
+    manifest = load_manifest(snapshot_dir)
+    if patch_store is not None and manifest.get('patches'):
+        for row in _read_table(snapshot_dir, manifest['patches']):
+            if patch_store.put(row['patch']) != row['digest']:
+                raise ValueError(f"Patch {row['digest']} does not match its digest, the snapshot is corrupted")
+        logger.info(f"{manifest['patches']['rows']} patches restored to {patch_store.root}")
+    graph = nx.MultiDiGraph()
+    for entry in manifest['nodes']:
+        for row in _read_table(snapshot_dir, entry):
+            node = row.pop(':ID')
+            graph.add_node(node, **_row_attributes(row))
+    for entry in manifest['relationships']:
+        for row in _read_table(snapshot_dir, entry):
+            source_node, target = row.pop(':START_ID'), row.pop(':END_ID')
+            graph.add_edge(source_node, target, key=entry['type'], **_row_attributes(row))
+    logger.info(f"Snapshot of {manifest['repo']} loaded: {graph.number_of_nodes()} nodes, "
+                f"{graph.number_of_edges()} relationships")
+    return graph, manifest
+
+
+def _restored_data(manifest, data_root):
+    """ directory of the data files of the repository of a snapshot, and its patch store """
+    url = manifest['repo'].split('/')[-1]
+    data_dir = os.path.join(data_root, url)
+    return data_dir, url, PatchStore(os.path.join(data_dir, 'patches'))
+
+
+def restore_snapshot(snapshot_dir, import_dir, database='neo4j', neo4j_admin=None, data_root='data'):
+    """
+    Restore a snapshot into an empty database through the bulk path: the graph is written as neo4j-admin import
+    files, loaded with neo4j-admin when its path is given. The import replaces the whole database, which must be
+    stopped, the constraints and indexes are provisioned by the next transactional update. A database shared by
+    several repositories is never overwritten, use upload_snapshot.
+
+    The patches of the snapshot are added to the patch store of the repository, and the state files of its derived
+    stages are reset, so the next ingestion writes the counters, labels, rollups and other derived data again.
+
+    :returns dict of the import files, see export_import_csv
+    """
+    if multi_tenant():
+        raise RuntimeError("A bulk restore would overwrite the other repositories of the shared database, "
+                           "restore the snapshot with --upload")
+    data_dir, url, patch_store = _restored_data(load_manifest(snapshot_dir), data_root)
+    graph, _ = load_snapshot(snapshot_dir, patch_store)
+    files = export_import_csv(graph, import_dir)
+    if neo4j_admin:
+        run_import(files, database, neo4j_admin)
+    reset_derived_state(data_dir, url)
+    return files
+
+
+def upload_snapshot(snapshot_dir, neo_client, batch_size=DEFAULT_BATCH_SIZE, concurrency=1, data_root='data'):
+    """
+    Restore a snapshot with batched transactions, for a running or shared database where neo4j-admin cannot be
+    used. The patches and state files are handled as by restore_snapshot.
+    """
+    data_dir, url, patch_store = _restored_data(load_manifest(snapshot_dir), data_root)
+    graph, _ = load_snapshot(snapshot_dir, patch_store)
+    provision_schema(neo_client)
+    neo_client.upload_graph(graph, batch_size=batch_size, concurrency=concurrency)
+    reset_derived_state(data_dir, url)
+
+
+def _neo4j_client(args, repo):
+    return Neo4jClient(args.neo4j_uri, args.neo4j_user, args.neo4j_password, accumulate=False,
+                       repo=repo if multi_tenant() else None)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Export and restore compressed snapshots of the graph of a repository")
+    parser.add_argument('--neo4j-uri', default=os.getenv('NEO4J_URI'))
+    parser.add_argument('--neo4j-user', default=os.getenv('NEO4J_USER'))
+    parser.add_argument('--neo4j-password', default=os.getenv('NEO4J_PASSWORD'))
+    parser.add_argument('--data-dir', default='data', help="directory of the collected data, holding the patches")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help="read the graph of a repository from Neo4j into a snapshot")
+    export_parser.add_argument('repo_url')
+    export_parser.add_argument('output_dir')
+    restore_parser = commands.add_parser('restore', help="restore a snapshot into an empty database")
+    restore_parser.add_argument('snapshot_dir')
+    restore_parser.add_argument('--import-dir', default=os.getenv('NEO4J_IMPORT_DIR'),
+                                help="directory receiving the neo4j-admin import files")
+    restore_parser.add_argument('--neo4j-admin', default=os.getenv('NEO4J_ADMIN'))
+    restore_parser.add_argument('--database', default=os.getenv('NEO4J_IMPORT_DATABASE', 'neo4j'))
+    restore_parser.add_argument('--upload', action='store_true',
+                                help="write through batched transactions instead of neo4j-admin import files")
+    args = parser.parse_args()
+
+    basicConfig(level=INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == 'export':
+        client = _neo4j_client(args, args.repo_url)
+        try:
+            patch_store = PatchStore(os.path.join(args.data_dir, args.repo_url.split('/')[-1], 'patches'))
+            export_snapshot(read_graph(client), args.output_dir, args.repo_url, source='neo4j', patch_store=patch_store)
+        finally:
+            client.close()
+    elif args.upload or not args.import_dir or multi_tenant():
+        client = _neo4j_client(args, load_manifest(args.snapshot_dir)['repo'])
+        try:
+            upload_snapshot(args.snapshot_dir, client, int(os.getenv('NEO4J_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+                            int(os.getenv('NEO4J_WRITE_CONCURRENCY', 1)), args.data_dir)
+        finally:
+            client.close()
+    else:
+        restore_snapshot(args.snapshot_dir, args.import_dir, args.database, args.neo4j_admin, args.data_dir)
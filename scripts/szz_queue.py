@@ -0,0 +1,130 @@
+import json
+from collections import namedtuple
+from logging import getLogger
+
+import redis
+
+logger = getLogger(__name__)
+
+SZZTask = namedtuple('SZZTask', 'id payload attempts')
+
+# Pops the first visible task and hides it for the visibility timeout. Tasks over the attempt limit are moved to
+# the dead letter hash instead of being handed out again.
+RESERVE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local timeout = tonumber(ARGV[1])
+local max_attempts = tonumber(ARGV[2])
+while true do
+    local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, 1)
+    if #ids == 0 then
+        return nil
+    end
+    local id = ids[1]
+    local attempts = redis.call('HINCRBY', KEYS[2], id, 1)
+    if attempts > max_attempts then
+        redis.call('ZREM', KEYS[1], id)
+        redis.call('HSET', KEYS[4], id, 'maximum number of attempts exceeded')
+    else
+        redis.call('ZADD', KEYS[1], now + timeout, id)
+        return {id, redis.call('HGET', KEYS[3], id), attempts}
+    end
+end
+"""
+
+# Makes a reserved task visible again after the given delay.
+RELEASE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+return redis.call('ZADD', KEYS[1], 'XX', now + tonumber(ARGV[2]), ARGV[1])
+"""
+
+
+class SZZTaskQueue:
+    """
+    Reliable task queue on Redis for distributed SZZ runs. Pending and in-flight tasks live in one sorted set,
+    scored by the time they become visible: reserving a task pushes its score forward by the visibility timeout,
+    so a task whose worker dies is handed out again once the timeout expires. Task ids are derived from the
+    repository, the issue and the fix commit, which makes publishing and writing results idempotent.
+    """
+
+    def __init__(self, redis_url, prefix='szz', visibility_timeout=2 * 60 * 60, max_attempts=3):
+        self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.queue_key = f'{prefix}:queue'
+        self.tasks_key = f'{prefix}:tasks'
+        self.attempts_key = f'{prefix}:attempts'
+        self.results_key = f'{prefix}:results'
+        self.dead_key = f'{prefix}:dead'
+        self._reserve = self.redis.register_script(RESERVE_SCRIPT)
+        self._release = self.redis.register_script(RELEASE_SCRIPT)
+
+    @staticmethod
+    def task_id(repo_url, bug_id, fixing_commit):
+        return f'{repo_url}#{bug_id}:{fixing_commit}'
+
+    def publish(self, repo_url, bug_id, fixing_commit, budget=None):
+        """
+        Queue an SZZ task unless it is already queued or has a result. Returns the task id.
+
+        :param dict budget: SZZBudget arguments of the task (time_limit, max_blame_calls and the absolute deadline)
+        """
+        task_id = self.task_id(repo_url, bug_id, fixing_commit)
+        if self.redis.hexists(self.results_key, task_id):
+            return task_id
+        payload = json.dumps({'repo_url': repo_url, 'bug_id': bug_id, 'fixing_commit': fixing_commit,
+                              'budget': budget or {}})
+        pipe = self.redis.pipeline()
+        pipe.hset(self.tasks_key, task_id, payload)
+        if self.redis.hdel(self.dead_key, task_id):
+            # a dead-lettered task published again gets a fresh set of attempts
+            pipe.hdel(self.attempts_key, task_id)
+        pipe.zadd(self.queue_key, {task_id: 0}, nx=True)
+        pipe.execute()
+        return task_id
+
+    def reserve(self):
+        """ Take the next visible task, or None if there is nothing to do. """
+        reserved = self._reserve(keys=[self.queue_key, self.attempts_key, self.tasks_key, self.dead_key],
+                                 args=[self.visibility_timeout, self.max_attempts])
+        if not reserved:
+            return None
+        task_id, payload, attempts = reserved
+        return SZZTask(task_id, json.loads(payload), int(attempts))
+
+    def complete(self, task_id, result):
+        """ Store the result of a task and remove it from the queue. Writing the same result twice is harmless. """
+        pipe = self.redis.pipeline()
+        pipe.hset(self.results_key, task_id, json.dumps(result))
+        pipe.zrem(self.queue_key, task_id)
+        pipe.hdel(self.attempts_key, task_id)
+        pipe.execute()
+
+    def fail(self, task, error, retry_delay=30):
+        """ Release a failed task for a retry with exponential backoff, or dead-letter it after the last attempt. """
+        if task.attempts >= self.max_attempts:
+            pipe = self.redis.pipeline()
+            pipe.hset(self.dead_key, task.id, error)
+            pipe.zrem(self.queue_key, task.id)
+            pipe.hdel(self.attempts_key, task.id)
+            pipe.execute()
+            logger.error(f"SZZ task {task.id} failed {task.attempts} times, giving up: {error}")
+        else:
+            self._release(keys=[self.queue_key], args=[task.id, retry_delay * 2 ** (task.attempts - 1)])
+            logger.warning(f"SZZ task {task.id} failed (attempt {task.attempts}), retrying: {error}")
+
+    def extend(self, task_id):
+        """ Push the visibility timeout of a reserved task forward, for tasks running longer than expected. """
+        self._release(keys=[self.queue_key], args=[task_id, self.visibility_timeout])
+
+    def results(self, task_ids):
+        """ Results of the given tasks: (results by task id, errors by task id) for the finished ones. """
+        task_ids = list(task_ids)
+        if not task_ids:
+            return {}, {}
+        results = self.redis.hmget(self.results_key, task_ids)
+        errors = self.redis.hmget(self.dead_key, task_ids)
+        done = {task_id: json.loads(result) for task_id, result in zip(task_ids, results) if result is not None}
+        dead = {task_id: error for task_id, error in zip(task_ids, errors) if error is not None}
+        return done, dead
@@ -0,0 +1,105 @@
+import argparse
+import os
+import signal
+import time
+import traceback
+from logging import getLogger, basicConfig, INFO
+
+from dotenv import load_dotenv
+
+from scripts.core import RSZZ
+from scripts.core.szz_core import CommandRunner, SZZBudget
+from scripts.link_bugs import LinkBugs
+from scripts.szz_queue import SZZTaskQueue
+
+logger = getLogger(__name__)
+
+
+class SZZWorker:
+    """
+    Consumes SZZ tasks published by LinkBugs on a Redis queue. Each worker keeps its own clone of every repository
+    it has seen under repos_dir and reuses one RSZZ instance per repository across tasks.
+    """
+
+    def __init__(self, redis_url, repos_dir='repos', poll_interval=5):
+        self.queue = SZZTaskQueue(redis_url)
+        self.repos_dir = repos_dir
+        self.poll_interval = poll_interval
+        self.szz_instances = {}
+        self._stopped = False
+
+    def stop(self, *args):
+        logger.info("Stopping SZZ worker after the current task")
+        self._stopped = True
+
+    def run(self, max_idle=None):
+        """ Process tasks until stopped, or until the queue has been empty for max_idle seconds. """
+        idle_since = time.time()
+        while not self._stopped:
+            task = self.queue.reserve()
+            if task is None:
+                if max_idle is not None and time.time() - idle_since > max_idle:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+
+            logger.info(f"Processing SZZ task {task.id} (attempt {task.attempts})")
+            try:
+                result = self.process_task(task.payload)
+                self.queue.complete(task.id, result)
+            except Exception:
+                self.queue.fail(task, traceback.format_exc())
+            idle_since = time.time()
+
+    def process_task(self, payload):
+        szz = self.get_szz_instance(payload['repo_url'], payload['fixing_commit'])
+        fixing_commit = payload['fixing_commit']
+        result = {"ImpactedFiles": [], "InducingCommit": [], "Truncated": False}
+        impacted_files = szz.get_impacted_files(fixing_commit)
+        # budget published with the task, the deadline is the end of the whole LinkBugs run
+        budget = SZZBudget(**payload.get('budget', {}))
+        if budget.exhausted():
+            logger.error(f"SZZ deadline reached, skipping fixing commit {fixing_commit}")
+            bic = set()
+        else:
+            bic = szz.find_bic(fixing_commit, impacted_files, budget=budget)
+        result["Truncated"] = budget.truncated
+        LinkBugs.add_impacted_files_and_bics(result, impacted_files, bic)
+        return result
+
+    def get_szz_instance(self, repo_url, fixing_commit):
+        """ RSZZ instance for the repository, refreshing the local clone when it misses the fixing commit. """
+        repo_name = repo_url.split("/")[-1]
+        repo_path = os.path.join(self.repos_dir, repo_name)
+        if not os.path.isdir(repo_path):
+            logger.info(f"Cloning repository {repo_url} into {repo_path}")
+            os.makedirs(self.repos_dir, exist_ok=True)
+            _, error = CommandRunner(self.repos_dir).run_command(['clone', repo_url, repo_name])
+            if error is not None and not os.path.isdir(repo_path):
+                raise RuntimeError(f"unable to clone {repo_url}: {error}")
+
+        _, missing = CommandRunner(repo_path).run_command(['cat-file', '-e', f'{fixing_commit}^{{commit}}'])
+        if missing is not None:
+            logger.info(f"Fetching {repo_url} for commit {fixing_commit}")
+            CommandRunner(repo_path).run_command(['fetch', '--all'])
+            CommandRunner(repo_path).run_command(['pull', '--ff-only'])
+            self.szz_instances.pop(repo_url, None)
+
+        if repo_url not in self.szz_instances:
+            self.szz_instances[repo_url] = RSZZ(repo_full_name=repo_name, repo_url=repo_url, repos_dir=self.repos_dir)
+        return self.szz_instances[repo_url]
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run a distributed SZZ worker")
+    parser.add_argument('--redis-url', default=os.getenv('SZZ_REDIS_URL') or os.getenv('REDIS_HOST'))
+    parser.add_argument('--repos-dir', default='repos')
+    parser.add_argument('--max-idle', type=int, default=None, help="exit after being idle for this many seconds")
+    args = parser.parse_args()
+
+    basicConfig(level=INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    worker = SZZWorker(args.redis_url, repos_dir=args.repos_dir)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run(max_idle=args.max_idle)
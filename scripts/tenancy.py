@@ -0,0 +1,50 @@
+import os
+import re
+import zlib
+
+TENANT_LABEL_PREFIX = 'Repo_'
+
+# node pattern opening, e.g. "(c:Commit", "(:`File`", "(c" or "(", followed by its properties or closing
+# parenthesis, with its labels if any. Function calls such as "count(c)" are excluded by the lookbehind
+NODE_PATTERN = re.compile(r"(?<![\w`])\(\s*([A-Za-z_][A-Za-z0-9_]*)?((?:\s*:\s*(?:[A-Za-z_][A-Za-z0-9_]*|`[^`]+`))*)"
+                          r"(?=\s*[){])")
+# clause or relationship right before an unlabelled node pattern, e.g. "MATCH (n", ", (n" or "]->(n"
+PATTERN_BEFORE = re.compile(r"(?:\b(?:MATCH|MERGE)|->|[-,])\s*$", re.IGNORECASE)
+# relationship right after an unlabelled node pattern, e.g. "(n)-[", "(n {id: 1})<-[" or "(n)--"
+PATTERN_AFTER = re.compile(r"\s*(?:\{[^{}]*\}\s*)?\)\s*<?-\s*[-\[>]")
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+
+
+def multi_tenant():
+    """ Whether several repositories share the Neo4j database, see NEO4J_MULTI_TENANT """
+    return os.getenv('NEO4J_MULTI_TENANT', 'false').lower() == 'true'
+
+
+def tenant_label(repo_url):
+    """
+    Label given to every node of a repository in a shared database, readable and made unique by the checksum of the
+    repository url, e.g. Repo_sabedu_repositoryChat_1a2b3c4d
+    """
+    name = '_'.join(repo_url.rstrip('/').split('/')[-2:])
+    return f"{TENANT_LABEL_PREFIX}{re.sub(r'[^0-9A-Za-z_]', '_', name)}_{zlib.crc32(repo_url.encode('utf-8')):08x}"
+
+
+def scope_cypher(cypher, label):
+    """
+    Restrict a Cypher statement to one repository by adding its tenant label to every node pattern outside of its
+    string literals, labelled or not: an unlabelled starting point such as MATCH (n) would otherwise match the nodes
+    of every repository. Unlabelled patterns are told apart from parenthesised expressions by the clause or the
+    relationship next to them.
+    """
+    # string literals are blanked out so that parentheses in them are never taken for patterns
+    masked = STRING_LITERAL.sub(lambda m: m.group(0)[0] + ' ' * (len(m.group(0)) - 2) + m.group(0)[-1], cypher)
+    scoped, last = [], 0
+    for match in NODE_PATTERN.finditer(masked):
+        if not match.group(2) and not (PATTERN_BEFORE.search(masked, 0, match.start())
+                                       or PATTERN_AFTER.match(masked, match.end())):
+            continue
+        scoped.append(cypher[last:match.end()])
+        scoped.append(f":`{label}`")
+        last = match.end()
+    scoped.append(cypher[last:])
+    return ''.join(scoped)
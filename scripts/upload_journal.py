@@ -0,0 +1,58 @@
+import hashlib
+import json
+import os
+import threading
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+
+def batch_id(query, rows):
+    """ Deterministic id of a write batch: the same query over the same rows always gets the same id """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(query.encode('utf-8'))
+    digest.update(json.dumps(rows, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class UploadJournal:
+    """
+    Append-only log of the write batches committed to Neo4j. An upload that fails part way, or whose process is
+    restarted, skips the batches already in the journal when it is run again over the same graph. The journal file
+    is created when the upload starts and removed once the whole upload succeeded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.committed = set()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.committed.add(json.loads(line)['batch'])
+                    except (ValueError, KeyError):
+                        # a line cut by a crash while being written, its batch is simply sent again
+                        continue
+            logger.info(f"Resuming upload, {len(self.committed)} batches already committed")
+        else:
+            # the journal exists for as long as the upload has not completed, even before its first batch
+            open(path, 'a', encoding='utf-8').close()
+
+    def __contains__(self, batch):
+        return batch in self.committed
+
+    def record(self, batch, rows):
+        """ Durably record a committed batch """
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'batch': batch, 'rows': rows}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.committed.add(batch)
+
+    def clear(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.committed = set()
@@ -0,0 +1,36 @@
+"""Repository data shared by the tests, collected like GitHubDataCollector and LinkBugs write it"""
+from scripts.patch_store import PatchStore
+
+COLLABORATORS = [{'id': f'U{i}', 'name': f'name{i}', 'login': f'login{i}', 'email': None if i % 2 else 'user@example.com',
+                  'permission': 'WRITE'} for i in range(4)]
+REPOSITORIES = [{'id': 'R1', 'name': 'repo', 'description': None, 'url': 'https://github.com/owner/repo', 'stars': 3,
+                 'visibility': 'PUBLIC', 'forksCount': 1, 'isTemplate': False, 'primaryLanguage': 'Python',
+                 'owner_login': 'owner', 'owner_name': None, 'owner_email': None, 'owner_id': 'O1',
+                 'branches': {'nodes': [{'name': 'main'}, {'name': 'dev'}]}}]
+COMMITS = [{'hash': f'h{i}', 'author_name': ['name1', 'name2', 'someone', 'login3'][i % 4],
+            'author_email': 'author@example.com', 'committedDate': f'2020-01-{1 + i % 28:02d}T10:00:00+02:00',
+            'message': "it's a change", 'branches': ['main'],
+            'modified_files': [{'path': f'src/f{j}.py', 'filename': f'f{j}.py', 'change_type': 'MODIFY',
+                                'additions': j, 'deletions': 1, 'diff': f'@@ {i} {j}'} for j in range(i % 4)],
+            'parents': [{'oid': f'h{i - 1}'}] if i else []} for i in range(30)]
+ISSUES = [{'url': f'https://github.com/owner/repo/issues/{k}', 'number': k, 'assignees': [COLLABORATORS[1]],
+           'participants': [{'id': 'P9', 'name': 'participant', 'login': 'participant', 'email': None}],
+           'title': 'title', 'body': 'body', 'state': 'CLOSED', 'created_at': '2020-01-02T10:00:00Z',
+           'closed_at': '2020-01-05T10:00:00Z', 'repository_id': 'R1', 'author_id': 'U2', 'author_name': 'name2',
+           'author_login': 'login2', 'author_email': None} for k in range(1, 5)]
+TAGS = [{'name': 'v1.0', 'commit': 'h10', 'date': '2020-01-11T10:00:00+02:00'}]
+RELEASES = [{'id': 'REL1', 'name': 'v1.0', 'tag_name': 'v1.0', 'is_latest': True, 'description': None,
+             'url': 'https://github.com/owner/repo/releases/v1.0', 'created_at': '2020-01-12T10:00:00Z',
+             'published_at': '2020-01-12T10:00:00Z'}]
+BICS = [{'Number': str(k), 'FixingCommit': [f'h{k * 3}'], 'InducingCommit': [f'h{k}'],
+         'ImpactedFiles': ['f1.py', 'f2.py']} for k in range(1, 5)]
+
+
+def build(handler_class, tmp_path):
+    """ graph of the repository data built by a GraphHandler class, with its patches in tmp_path """
+    handler = handler_class(PatchStore(str(tmp_path / 'patches')))
+    handler.add_nodes_and_edges([dict(r) for r in REPOSITORIES], [dict(c) for c in COLLABORATORS],
+                                [dict(c) for c in COMMITS], ISSUES, TAGS, RELEASES)
+    handler.add_bic_relationships(BICS)
+    handler.set_edge_labels()
+    return handler.G
@@ -0,0 +1,28 @@
+from scripts.columnar_graph import ColumnarGraphHandler
+from scripts.graph_handler import GraphHandler, node_label
+from scripts.graph_sync import graph_snapshot
+from tests.graph_data import build
+
+
+def test_columnar_graph_matches_networkx_graph(tmp_path):
+    networkx_nodes, networkx_edges = graph_snapshot(build(GraphHandler, tmp_path))
+    columnar_nodes, columnar_edges = graph_snapshot(build(ColumnarGraphHandler, tmp_path))
+
+    assert networkx_nodes.keys() == columnar_nodes.keys()
+    assert {key: entry[0] for key, entry in networkx_nodes.items()} == \
+           {key: entry[0] for key, entry in columnar_nodes.items()}
+    assert networkx_edges.keys() == columnar_edges.keys()
+    assert {key: entry[0] for key, entry in networkx_edges.items()} == \
+           {key: entry[0] for key, entry in columnar_edges.items()}
+
+
+def test_columnar_graph_keeps_booleans(tmp_path):
+    graph = build(ColumnarGraphHandler, tmp_path)
+    assert graph.nodes['R1']['isTemplate'] is False
+    assert graph.nodes['REL1']['isLatest'] is True
+
+
+def test_node_label_reads_the_same_label(tmp_path):
+    networkx_graph, columnar_graph = build(GraphHandler, tmp_path), build(ColumnarGraphHandler, tmp_path)
+    for node in networkx_graph.nodes:
+        assert node_label(columnar_graph, node) == node_label(networkx_graph, node)
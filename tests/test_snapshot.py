@@ -0,0 +1,24 @@
+from scripts.graph_handler import GraphHandler
+from scripts.graph_sync import graph_snapshot
+from scripts.patch_store import PatchStore
+from scripts.snapshot import export_snapshot, load_snapshot
+from tests.graph_data import build
+
+
+def test_snapshot_round_trip(tmp_path):
+    graph = build(GraphHandler, tmp_path)
+    export_snapshot(graph, str(tmp_path / 'snapshot'), 'https://github.com/owner/repo',
+                    patch_store=PatchStore(str(tmp_path / 'patches')))
+    restored, _ = load_snapshot(str(tmp_path / 'snapshot'), PatchStore(str(tmp_path / 'restored_patches')))
+
+    assert graph_snapshot(restored) == graph_snapshot(graph)
+
+
+def test_snapshot_keeps_timezone_offsets_and_explicit_nulls(tmp_path):
+    graph = build(GraphHandler, tmp_path)
+    export_snapshot(graph, str(tmp_path / 'snapshot'))
+    restored, _ = load_snapshot(str(tmp_path / 'snapshot'))
+
+    assert restored.nodes['h1']['committedDateTime'].isoformat() == '2020-01-02T10:00:00+02:00'
+    modified = [data for _, _, data in restored.edges(data=True) if data['relation'] == 'changed']
+    assert modified and all('patch' in data and data['patch'] is None for data in modified)
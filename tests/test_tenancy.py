@@ -0,0 +1,28 @@
+from scripts.tenancy import scope_cypher, tenant_label
+
+LABEL = tenant_label('https://github.com/owner/repo')
+SCOPE = f":`{LABEL}`"
+
+
+def test_labelled_patterns_get_the_tenant_label():
+    assert scope_cypher("MATCH (c:Commit)-[:author]->(:`User` {login: 'a'}) RETURN c", LABEL) == \
+        f"MATCH (c:Commit{SCOPE})-[:author]->(:`User`{SCOPE} {{login: 'a'}}) RETURN c"
+
+
+def test_unlabelled_match_gets_the_tenant_label():
+    assert scope_cypher("MATCH (n) RETURN count(n)", LABEL) == f"MATCH (n{SCOPE}) RETURN count(n)"
+    assert scope_cypher("MATCH (n {id: 'x'}) RETURN n", LABEL) == f"MATCH (n{SCOPE} {{id: 'x'}}) RETURN n"
+
+
+def test_unlabelled_patterns_around_relationships_get_the_tenant_label():
+    assert scope_cypher("MATCH (c)-[:author]->(x) RETURN x", LABEL) == \
+        f"MATCH (c{SCOPE})-[:author]->(x{SCOPE}) RETURN x"
+    assert scope_cypher("MATCH (a:File), (b)<--() RETURN a, b", LABEL) == \
+        f"MATCH (a:File{SCOPE}), (b{SCOPE})<--({SCOPE}) RETURN a, b"
+    assert scope_cypher("MATCH (c:Commit) WHERE NOT (c)-[:modified]->() RETURN c", LABEL) == \
+        f"MATCH (c:Commit{SCOPE}) WHERE NOT (c{SCOPE})-[:modified]->({SCOPE}) RETURN c"
+
+
+def test_expressions_and_string_literals_are_left_alone():
+    cypher = "MATCH (i:Issue) WHERE i.title CONTAINS '(x)-->(y)' RETURN count(i), (i.number) AS number"
+    assert scope_cypher(cypher, LABEL) == cypher.replace("(i:Issue)", f"(i:Issue{SCOPE})")